@@ -0,0 +1,84 @@
+#   Smartc. Smart contracts for real time applications.
+#   Copyright (C) 2017 Guillem Borrell i Nogueras (@guillemborrell)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Stream of items appended to a multiple attribute. The mean of the items
+is computed by nodes declared with reducers, that are updated with each
+item, and by plain nodes, that are called again with all the items.
+
+    python benchmarks/bench_append.py --items 20000
+"""
+import argparse
+import time
+
+from smartc.contract.builder import node, Attribute, Contract
+from smartc.contract.reducers import Count, Sum
+
+
+@node(reducer=Sum())
+def reduced_total(prices):
+    return sum(prices)
+
+
+@node(reducer=Count())
+def reduced_count(prices):
+    return len(prices)
+
+
+@node
+def total(prices):
+    return sum(prices)
+
+
+@node
+def count(prices):
+    return len(prices)
+
+
+@node
+def mean(t, n):
+    return t / n
+
+
+def measure(reduced, items):
+    prices = Attribute('prices', float, multiple=True)
+    if reduced:
+        last = mean(reduced_total(prices), reduced_count(prices))
+    else:
+        last = mean(total(prices), count(prices))
+
+    contract = Contract(last)
+    start = time.perf_counter()
+    for i in range(items):
+        contract.append('prices', float(i % 100))
+    elapsed = time.perf_counter() - start
+    assert contract.get(last.name) == sum(i % 100 for i in range(items)) \
+        / items
+
+    return items / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--items', type=int, default=20000)
+    args = parser.parse_args()
+
+    print('Reducers:    {:10.0f} items/s'.format(measure(True, args.items)))
+    print('Plain nodes: {:10.0f} items/s'.format(measure(False, args.items)))
+
+
+if __name__ == '__main__':
+    main()
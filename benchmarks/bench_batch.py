@@ -0,0 +1,105 @@
+#   Smartc. Smart contracts for real time applications.
+#   Copyright (C) 2017 Guillem Borrell i Nogueras (@guillemborrell)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Evaluate the same contract for many instances, with one Contract per
+instance and with a single ContractBatch.
+
+    python benchmarks/bench_batch.py --instances 10000
+"""
+import argparse
+import contextlib
+import os
+import random
+import time
+
+from smartc.contract.builder import node, Attribute, Contract
+from smartc.contract.batch import ContractBatch, np
+
+
+@node
+def points(player1, player2):
+    return player1 - player2
+
+
+@node(vectorize=True)
+def vpoints(player1, player2):
+    return player1 - player2
+
+
+@node
+def total(*games):
+    return sum(games)
+
+
+@node(vectorize=True)
+def vtotal(*games):
+    return sum(games)
+
+
+def build(games, vectorize):
+    diff = vpoints if vectorize else points
+    add = vtotal if vectorize else total
+    player1 = [Attribute('player1_try{}'.format(i), int) for i in range(games)]
+    player2 = [Attribute('player2_try{}'.format(i), int) for i in range(games)]
+    return add(*[diff(p1, p2) for p1, p2 in zip(player1, player2)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--instances', type=int, default=10000)
+    parser.add_argument('--games', type=int, default=5)
+    args = parser.parse_args()
+
+    inputs = {}
+    for player in ('player1', 'player2'):
+        for i in range(args.games):
+            inputs['{}_try{}'.format(player, i)] = [
+                random.randint(0, 2) for r in range(args.instances)]
+
+    with open(os.devnull, 'w') as devnull:
+        with contextlib.redirect_stdout(devnull):
+            last = build(args.games, False)
+            start = time.perf_counter()
+            for r in range(args.instances):
+                contract = Contract(last)
+                contract.set_many({k: v[r] for k, v in inputs.items()})
+            contracts = time.perf_counter() - start
+
+            start = time.perf_counter()
+            batch = ContractBatch(last, args.instances)
+            batch.set_many(inputs)
+            rows = time.perf_counter() - start
+
+            columns = inputs
+            if np is not None:
+                columns = {k: np.array(v) for k, v in inputs.items()}
+            batch = ContractBatch(build(args.games, True), args.instances)
+            start = time.perf_counter()
+            batch.set_many(columns)
+            vectorized = time.perf_counter() - start
+
+    print('{} instances of a contract with {} games'.format(
+        args.instances, args.games))
+    print('{:>24}: {:8.3f} s'.format('one Contract each', contracts))
+    print('{:>24}: {:8.3f} s'.format('ContractBatch', rows))
+    print('{:>24}: {:8.3f} s (numpy {})'.format(
+        'ContractBatch vectorized', vectorized,
+        'available' if np is not None else 'not available'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+#   Smartc. Smart contracts for real time applications.
+#   Copyright (C) 2017 Guillem Borrell i Nogueras (@guillemborrell)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Throughput and latency of events through the broker on localhost.
+It starts the broker and some publishers in separate processes, and
+subscribes from this one. Each event carries the time it was
+published.
+
+    python benchmarks/bench_broker.py --publishers 4 --events 200000
+
+Without --rate the publishers saturate the broker, and the latency is
+mostly queueing. Use --rate to measure latency under a given load.
+"""
+import argparse
+import struct
+import time
+from multiprocessing import Process
+
+import zmq
+
+from smartc.broker import run_broker, Publisher
+
+TIMESTAMP = struct.Struct('<d')
+FRONTEND = 'tcp://127.0.0.1:5566'
+BACKEND = 'tcp://127.0.0.1:5565'
+
+
+def publish(events, batch_size, hwm, rate):
+    publisher = Publisher(FRONTEND, batch_size=batch_size, hwm=hwm)
+    # Wait for the subscription to reach the publisher
+    time.sleep(1)
+    start = time.time()
+    for i in range(events):
+        now = time.time()
+        if rate and i / rate > now - start:
+            publisher.flush()
+            time.sleep(i / rate - (now - start))
+        publisher.publish('bench', TIMESTAMP.pack(time.time()))
+    publisher.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--publishers', type=int, default=2)
+    parser.add_argument('--events', type=int, default=100000,
+                        help='Events per publisher')
+    parser.add_argument('--batch', type=int, default=100)
+    parser.add_argument('--hwm', type=int, default=1000000)
+    parser.add_argument('--rate', type=float, default=0,
+                        help='Events per second and publisher, 0 for '
+                        'as fast as possible')
+    args = parser.parse_args()
+
+    broker = Process(target=run_broker, args=(FRONTEND, BACKEND, args.hwm),
+                     daemon=True)
+    broker.start()
+
+    socket = zmq.Context.instance().socket(zmq.SUB)
+    socket.setsockopt(zmq.RCVHWM, args.hwm)
+    socket.connect(BACKEND)
+    socket.setsockopt_string(zmq.SUBSCRIBE, 'bench')
+    time.sleep(0.5)
+
+    publishers = [Process(target=publish,
+                          args=(args.events, args.batch, args.hwm,
+                                args.rate))
+                  for i in range(args.publishers)]
+    for publisher in publishers:
+        publisher.start()
+
+    total = args.events * args.publishers
+    latencies = []
+    poller = zmq.Poller()
+    poller.register(socket, zmq.POLLIN)
+    start = None
+    while len(latencies) < total:
+        if not poller.poll(5000):
+            break
+        message = socket.recv_multipart()
+        now = time.time()
+        if start is None:
+            start = now
+        for event in message[1:]:
+            latencies.append(now - TIMESTAMP.unpack(event)[0])
+    elapsed = time.time() - start
+
+    for publisher in publishers:
+        publisher.join()
+    broker.terminate()
+
+    latencies.sort()
+    received = len(latencies)
+    print('{} of {} events, batches of {}, {} publishers'.format(
+        received, total, args.batch, args.publishers))
+    print('{:.0f} events/s'.format(received / elapsed))
+    print('latency p50 {:.3f} ms, p99 {:.3f} ms, max {:.3f} ms'.format(
+        1e3 * latencies[received // 2],
+        1e3 * latencies[int(received * 0.99)],
+        1e3 * latencies[-1]))
+
+
+if __name__ == '__main__':
+    main()
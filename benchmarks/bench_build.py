@@ -0,0 +1,77 @@
+#   Smartc. Smart contracts for real time applications.
+#   Copyright (C) 2017 Guillem Borrell i Nogueras (@guillemborrell)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Time the construction of long chains of games, like the chain in
+examples/rockpaperscissors.py, the compilation of the contract, and
+the creation of contracts from a compiled ContractTemplate.
+
+    python benchmarks/bench_build.py --steps 1000 10000 100000
+"""
+import argparse
+import time
+
+from smartc.contract.builder import node, Attribute, Contract, \
+    ContractTemplate
+
+
+@node
+def firstgame(player1, player2):
+    return int(player1 == player2)
+
+
+@node
+def game(player1, player2, scoreboard):
+    return scoreboard + int(player1 == player2)
+
+
+def build(steps):
+    player1 = [Attribute('player1_try{}'.format(i), str) for i in range(steps)]
+    player2 = [Attribute('player2_try{}'.format(i), str) for i in range(steps)]
+
+    scoreboard = firstgame(player1[0], player2[0])
+    for i in range(1, steps):
+        scoreboard = game(player1[i], player2[i], scoreboard)
+
+    return scoreboard
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--steps', type=int, nargs='+',
+                        default=[1000, 10000, 100000])
+    parser.add_argument('--contracts', type=int, default=1000)
+    args = parser.parse_args()
+
+    for steps in args.steps:
+        start = time.perf_counter()
+        last = build(steps)
+        built = time.perf_counter()
+        Contract(last)
+        compiled = time.perf_counter()
+        template = ContractTemplate(last)
+        start_instances = time.perf_counter()
+        for i in range(args.contracts):
+            Contract(template)
+        instantiated = time.perf_counter()
+        print('{:>8} steps, {:>8} nodes: build {:8.3f} s, '
+              'compile {:8.3f} s, from template {:10.1f} us'.format(
+                  steps, len(last.graph), built - start, compiled - built,
+                  (instantiated - start_instances) / args.contracts * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+#   Smartc. Smart contracts for real time applications.
+#   Copyright (C) 2017 Guillem Borrell i Nogueras (@guillemborrell)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Ticks of a price feed on a long-lived contract with mutable
+attributes. Each tick recomputes only the nodes downstream of the
+price, and the propagation stops at a node that rounds the price to
+a tick size. It is compared with evaluating a new contract for each
+tick, that is the only way to change a value without mutable
+attributes.
+
+    python benchmarks/bench_cutoff.py --width 200 --ticks 10000
+"""
+import argparse
+import random
+import time
+
+from smartc.contract.builder import node, Attribute, Contract, \
+    ContractTemplate
+
+
+@node
+def round_price(price):
+    return round(price, 1)
+
+
+@node
+def position(price, quantity):
+    return price * quantity
+
+
+@node
+def join(x, y):
+    return x + y
+
+
+def build(width):
+    price = Attribute('price', float, mutable=True)
+    rounded = round_price(price)
+    nodes = [position(rounded, Attribute('q{}'.format(i), float))
+             for i in range(width)]
+    while len(nodes) > 1:
+        nodes = [join(*nodes[i:i + 2]) if i + 1 < len(nodes) else nodes[i]
+                 for i in range(0, len(nodes), 2)]
+    return nodes[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--width', type=int, default=200)
+    parser.add_argument('--ticks', type=int, default=10000)
+    args = parser.parse_args()
+
+    template = ContractTemplate(build(args.width))
+    quantities = {'q{}'.format(i): float(i) for i in range(args.width)}
+    prices = [100.0]
+    for i in range(args.ticks - 1):
+        prices.append(prices[-1] + random.gauss(0, 0.005))
+
+    contract = Contract(template)
+    contract.set_many(dict(quantities, price=prices[0]))
+    start = time.perf_counter()
+    for price in prices:
+        contract.set('price', price)
+    mutable = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for price in prices:
+        Contract(template).set_many(dict(quantities, price=price))
+    fresh = time.perf_counter() - start
+
+    print('{} nodes, the rounded price changes in {} ticks'.format(
+        template.schedule.size,
+        sum(round(a, 1) != round(b, 1) for a, b in zip(prices, prices[1:]))))
+    print('Mutable attribute: {:8.1f} us/tick'.format(
+        mutable / args.ticks * 1e6))
+    print('New contract:      {:8.1f} us/tick'.format(
+        fresh / args.ticks * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+#   Smartc. Smart contracts for real time applications.
+#   Copyright (C) 2017 Guillem Borrell i Nogueras (@guillemborrell)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Compare the compiled schedule engine of Contract with the graph walk
+engine that smartc used before (repeated walks from every applied
+attribute). The graph is a set of independent three-node chains, one
+per attribute, joined by a binary tree of nodes.
+
+    python benchmarks/bench_engine.py --nodes 10000
+"""
+import argparse
+import contextlib
+import os
+import time
+
+from smartc.contract.builder import node, Attribute, Contract
+
+
+@node
+def step(x):
+    return x + 1
+
+
+@node
+def join(x, y):
+    return x + y
+
+
+class WalkContract:
+    """
+    Reference implementation of the old evaluation engine, that walks
+    the graph from the set attribute and from all the attributes that
+    were set before.
+    """
+    def __init__(self, node):
+        self.graph = node.graph
+        self.attrs = node.attrs
+        self.eval_graph = {}
+        for k, v in self.graph.items():
+            total = len(v.args) if v.min_args is None else v.min_args
+            self.eval_graph[k] = dict(total=total, eval=0)
+        self.applied_attributes = []
+
+    def _traverse(self, node):
+        for target in self.graph[node].to:
+            yield target
+            for subtarget in self.graph[target].to:
+                for t in self._traverse(subtarget):
+                    yield t
+
+    def _next_node_to_eval(self, attribute):
+        self.eval_graph[attribute]['eval'] = 1
+        for name in self._traverse(attribute):
+            previous = self.graph[name].args
+            evals = sum([self.eval_graph[n]['eval'] for n in previous])
+            has_value = self.eval_graph[name]['eval']
+            locked = any([self.graph[a].lock for a in self.graph[name].args])
+            total = self.eval_graph[name]['total']
+            if evals >= total and not has_value and not locked:
+                return name
+
+    def _node_eval(self, attribute):
+        for i in range(len(self.eval_graph) + 1):
+            key = self._next_node_to_eval(attribute)
+            if key:
+                args = self.graph[key].args
+                eval_args = [self.graph[a].value for a in args]
+                value = self.graph[key].method(*eval_args)
+                self.graph[key].value = value
+                if value is not None and self.graph[key].lock:
+                    self.graph[key].lock = False
+                self.eval_graph[key]['eval'] = 1
+            else:
+                break
+
+    def set(self, attribute, value):
+        self.graph[attribute].value = value
+        for name in self.eval_graph:
+            if self.graph[name].lock:
+                self.eval_graph[name]['eval'] = 0
+        self._node_eval(attribute)
+        for other_attribute in self.applied_attributes:
+            self._node_eval(other_attribute)
+        self.applied_attributes.append(attribute)
+
+
+def build(nodes):
+    """
+    Build a graph with roughly *nodes* nodes, and return the last node
+    and the names of the attributes.
+    """
+    chains = max(1, nodes // 5)
+    attributes = [Attribute('a{}'.format(i), int) for i in range(chains)]
+    level = [step(step(step(a))) for a in attributes]
+    while len(level) > 1:
+        pairs = [join(level[i], level[i+1])
+                 for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            pairs.append(level[-1])
+        level = pairs
+
+    return level[0], [a.name for a in attributes]
+
+
+def measure(engine, root, names):
+    """
+    Time the creation of the contract and setting all the attributes.
+    """
+    with open(os.devnull, 'w') as devnull:
+        with contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            contract = engine(root)
+            created = time.perf_counter()
+            for name in names:
+                contract.set(name, 1)
+            done = time.perf_counter()
+
+    return created - start, done - created
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--nodes', type=int, default=10000)
+    parser.add_argument('--skip-walk', action='store_true',
+                        help='Do not run the graph walk engine')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    root, names = build(args.nodes)
+    print('Built {} nodes in {:.3f} s'.format(
+        len(root.graph), time.perf_counter() - start))
+
+    engines = [('schedule', Contract)]
+    if not args.skip_walk:
+        engines.append(('graph walk', WalkContract))
+
+    for label, engine in engines:
+        root, names = build(args.nodes)
+        init, sets = measure(engine, root, names)
+        print('{:>12}: init {:8.3f} s, {} sets {:8.3f} s, '
+              '{:8.1f} us/set'.format(label, init, len(names), sets,
+                                      1e6 * sets / len(names)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+#   Smartc. Smart contracts for real time applications.
+#   Copyright (C) 2017 Guillem Borrell i Nogueras (@guillemborrell)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Gather over a long chain of games, like the winner of
+examples/rockpaperscissors.py with a scoreboard per game. A gather
+with no mode calls its condition with all the scoreboards each time one
+arrives, and a gather in any mode only with the new one. Once the
+gather fires, the games upstream are frozen.
+
+    python benchmarks/bench_gather.py --games 2000
+"""
+import argparse
+import time
+
+from smartc.contract.builder import node, Attribute, Contract, gather
+
+
+@node
+def first(points):
+    return points
+
+
+@node
+def play(score, points):
+    return score + points
+
+
+def winner(winning_score):
+    def condition(*scores):
+        for score in scores:
+            if score is not None and score >= winning_score:
+                return score
+
+    return condition
+
+
+def measure(games, mode):
+    points = [Attribute('points{}'.format(i), int) for i in range(games)]
+    scores = [first(points[0])]
+    for i in range(1, games):
+        scores.append(play(scores[-1], points[i]))
+
+    # The winner is known in the middle of the games
+    condition = winner(games // 2)
+    contract = Contract(gather(*scores, condition=condition, mode=mode))
+    start = time.perf_counter()
+    for i in range(games):
+        contract.set('points{}'.format(i), 1)
+    return (time.perf_counter() - start) / games
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--games', type=int, default=2000)
+    args = parser.parse_args()
+
+    for mode in (None, 'any'):
+        print('{:>7}: {:8.1f} us/set'.format(
+            str(mode), measure(args.games, mode) * 1e6))
+
+
+if __name__ == '__main__':
+    main()
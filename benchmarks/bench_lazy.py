@@ -0,0 +1,90 @@
+#   Smartc. Smart contracts for real time applications.
+#   Copyright (C) 2017 Guillem Borrell i Nogueras (@guillemborrell)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Contracts with many outputs where clients read only a few of them. An
+eager contract evaluates every node reachable from each set attribute,
+and a lazy one only the nodes needed by the outputs that are read.
+
+    python benchmarks/bench_lazy.py --width 1000 --depth 5 --reads 10
+"""
+import argparse
+import time
+
+from smartc.contract.builder import node, Attribute, Contract, \
+    ContractTemplate
+
+
+@node
+def step(x):
+    return x * 1.0001 + 1
+
+
+@node
+def mix(x, price):
+    return x * price
+
+
+def build(width, depth):
+    price = Attribute('price', float, mutable=True)
+    outputs = []
+    for i in range(width):
+        value = mix(Attribute('q{}'.format(i), float), price)
+        for d in range(depth):
+            value = step(value)
+        outputs.append(value)
+
+    return outputs
+
+
+def measure(template, outputs, args, lazy):
+    contract = Contract(template, lazy=lazy)
+    contract.set_many({'q{}'.format(i): float(i) for i in range(args.width)})
+    read = outputs[:args.reads]
+
+    start = time.perf_counter()
+    for tick in range(args.ticks):
+        contract.set('price', 100.0 + tick)
+        for output in read:
+            contract.get(output)
+    return (time.perf_counter() - start) / args.ticks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--width', type=int, default=1000)
+    parser.add_argument('--depth', type=int, default=5)
+    parser.add_argument('--reads', type=int, default=10)
+    parser.add_argument('--ticks', type=int, default=100)
+    args = parser.parse_args()
+
+    outputs = build(args.width, args.depth)
+
+    @node
+    def collect(*values):
+        return None
+
+    template = ContractTemplate(collect(*outputs))
+    print('{} nodes, {} outputs read'.format(
+        template.schedule.size, args.reads))
+    for lazy in (False, True):
+        print('{:>6}: {:8.2f} ms/set'.format(
+            'lazy' if lazy else 'eager',
+            measure(template, outputs, args, lazy) * 1e3))
+
+
+if __name__ == '__main__':
+    main()
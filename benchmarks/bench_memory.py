@@ -0,0 +1,169 @@
+#   Smartc. Smart contracts for real time applications.
+#   Copyright (C) 2017 Guillem Borrell i Nogueras (@guillemborrell)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Measure with tracemalloc the memory used per node by the graph built
+with @node, and by each live Contract built from it, compiling the
+graph for each contract or sharing a compiled ContractTemplate. The
+same graph is copied with the layout that smartc used before, records
+with an instance dict and uuid4 node names, and an eval_graph of dicts
+per contract, to compare both.
+
+    python benchmarks/bench_memory.py --steps 10000 --contracts 100
+"""
+import argparse
+import contextlib
+import gc
+import os
+import tracemalloc
+from uuid import uuid4
+
+from smartc.contract.builder import node, Attribute, Contract, \
+    ContractTemplate, GraphNode, SEPARATOR
+
+
+@node
+def firstgame(player1, player2):
+    return int(player1 == player2)
+
+
+@node
+def game(player1, player2, scoreboard):
+    return scoreboard + int(player1 == player2)
+
+
+def build(steps):
+    player1 = [Attribute('player1_try{}'.format(i), str) for i in range(steps)]
+    player2 = [Attribute('player2_try{}'.format(i), str) for i in range(steps)]
+
+    scoreboard = firstgame(player1[0], player2[0])
+    for i in range(1, steps):
+        scoreboard = game(player1[i], player2[i], scoreboard)
+
+    return scoreboard
+
+
+class DictGraphNode:
+    """
+    Reference of the records of the graph that smartc used before,
+    without slots.
+    """
+    def __init__(self, args, method, value, min_args=None, lock=False):
+        self.args = args
+        self.method = method
+        self.value = value
+        self.min_args = min_args
+        self.lock = lock
+        self.to = []
+
+
+class EvalGraphContract:
+    """
+    Reference of the evaluation state of the old Contract, a dict with
+    the number of arguments needed and the evaluated flag of each node.
+    """
+    def __init__(self, graph):
+        self.graph = graph
+        self.eval_graph = {}
+        for k, v in graph.items():
+            total = len(v.args) if v.min_args is None else v.min_args
+            self.eval_graph[k] = dict(total=total, eval=0)
+        self.applied_attributes = []
+
+
+def copy_graph(graph, record, rename):
+    """
+    Copy of the graph with the given record class, and the names of
+    the nodes changed by *rename*.
+    """
+    names = {name: rename(name) if SEPARATOR in name else name
+             for name in graph}
+    copy = {}
+    for name, v in graph.items():
+        new = record(tuple(names[a] for a in v.args), v.method, v.value,
+                     v.min_args, v.lock)
+        new.to = [names[t] for t in v.to]
+        copy[names[name]] = new
+
+    return copy
+
+
+def old_name(name):
+    return name.split(SEPARATOR)[0] + '_' + str(uuid4())[:8]
+
+
+def allocated(function):
+    """
+    Call the function and return its result and the bytes it allocated
+    that are still alive.
+    """
+    gc.collect()
+    start = tracemalloc.take_snapshot()
+    result = function()
+    gc.collect()
+    end = tracemalloc.take_snapshot()
+    size = sum(s.size_diff for s in end.compare_to(start, 'filename'))
+    return result, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--steps', type=int, default=10000)
+    parser.add_argument('--contracts', type=int, default=100)
+    args = parser.parse_args()
+
+    tracemalloc.start()
+    last, graph_size = allocated(lambda: build(args.steps))
+    nodes = len(last.graph)
+    print('{} nodes, graph: {:8.1f} bytes/node'.format(
+        nodes, graph_size / nodes))
+
+    layouts = (('old layout', DictGraphNode, old_name),
+               ('new layout', GraphNode, lambda name: name))
+    for label, record, rename in layouts:
+        copy, copy_size = allocated(
+            lambda: copy_graph(last.graph, record, rename))
+        print('graph copy, {}: {:8.1f} bytes/node'.format(
+            label, copy_size / nodes))
+
+    old_graph = copy_graph(last.graph, DictGraphNode, old_name)
+    live, contracts_size = allocated(
+        lambda: [EvalGraphContract(old_graph)
+                 for c in range(args.contracts)])
+    print('{} contracts, old eval_graph: {:8.1f} bytes/node per '
+          'contract'.format(len(live), contracts_size / nodes / len(live)))
+
+    def contracts(source):
+        with open(os.devnull, 'w') as devnull:
+            with contextlib.redirect_stdout(devnull):
+                result = []
+                for c in range(args.contracts):
+                    contract = Contract(source)
+                    contract.set('player1_try0', 'rock')
+                    contract.set('player2_try0', 'rock')
+                    result.append(contract)
+                return result
+
+    template = ContractTemplate(last)
+    sources = (('compiled each', last), ('from template', template))
+    for label, source in sources:
+        live, contracts_size = allocated(lambda: contracts(source))
+        print('{} contracts, {}: {:8.1f} bytes/node per contract'.format(
+            len(live), label, contracts_size / nodes / len(live)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+#   Smartc. Smart contracts for real time applications.
+#   Copyright (C) 2017 Guillem Borrell i Nogueras (@guillemborrell)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Evaluate a wide contract, where a single attribute feeds many
+independent nodes, sequentially and with thread and process pools.
+
+    python benchmarks/bench_parallel.py --width 64 --work cpu
+"""
+import argparse
+import contextlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from smartc.contract.builder import node, Attribute, Contract
+
+
+@node
+def score_cpu(x):
+    """
+    CPU bound node, it only scales with processes.
+    """
+    total = 0
+    for i in range(200000):
+        total += (i * x) % 7
+    return total
+
+
+@node
+def score_io(x):
+    """
+    Node that waits, like a price lookup. It scales with threads.
+    """
+    time.sleep(0.01)
+    return x
+
+
+@node
+def total(*scores):
+    return sum(scores)
+
+
+def build(width, work):
+    score = score_cpu if work == 'cpu' else score_io
+    x = Attribute('x', int)
+    return total(*[score(x) for i in range(width)])
+
+
+def measure(width, work, executor):
+    contract = Contract(build(width, work), executor=executor)
+    with open(os.devnull, 'w') as devnull:
+        with contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            contract.set('x', 3)
+            return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--width', type=int, default=64)
+    parser.add_argument('--work', choices=['cpu', 'io'], default='cpu')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    sequential = measure(args.width, args.work, None)
+    print('{:>10}: {:8.3f} s'.format('sequential', sequential))
+
+    for label, pool in [('threads', ThreadPoolExecutor),
+                        ('processes', ProcessPoolExecutor)]:
+        with pool(args.workers) as executor:
+            elapsed = measure(args.width, args.work, executor)
+        print('{:>10}: {:8.3f} s, speedup {:5.2f}x with {} workers'.format(
+            label, elapsed, sequential / elapsed, args.workers))
+
+
+if __name__ == '__main__':
+    main()
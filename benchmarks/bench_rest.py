@@ -0,0 +1,87 @@
+#   Smartc. Smart contracts for real time applications.
+#   Copyright (C) 2017 Guillem Borrell i Nogueras (@guillemborrell)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Ingest attribute sets through the REST API, with one request per set
+and with a single streamed NDJSON request, and report the sets per
+second of each.
+
+    python benchmarks/bench_rest.py --sets 5000
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import time
+
+from tornado import httpclient, web
+
+from smartc.contract.builder import node, Attribute
+from smartc.handlers.rest import register_template, rest_urls
+
+
+@node
+def double(a):
+    return 2 * a
+
+
+@node
+def add(x, y):
+    return x + y
+
+
+async def run(args):
+    a = Attribute('a', float, mutable=True)
+    b = Attribute('b', int, mutable=True)
+    register_template('bench', add(double(a), b))
+    web.Application(rest_urls()).listen(args.port)
+    url = 'http://127.0.0.1:{}/contracts'.format(args.port)
+    client = httpclient.AsyncHTTPClient()
+
+    response = await client.fetch(url + '/bench', method='POST', body='')
+    contract = '{}/{}/attributes'.format(url, json.loads(response.body)['id'])
+    sets = [json.dumps({'a': float(i), 'b': i}) for i in range(args.sets)]
+
+    start = time.time()
+    for body in sets:
+        await client.fetch(contract, method='POST', body=body)
+    single = time.time() - start
+
+    start = time.time()
+    await client.fetch(contract, method='POST', body='\n'.join(sets),
+                       headers={'Content-Type': 'application/x-ndjson'})
+    bulk = time.time() - start
+
+    return single, bulk
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sets', type=int, default=5000)
+    parser.add_argument('--port', type=int, default=8081)
+    args = parser.parse_args()
+
+    with open(os.devnull, 'w') as devnull:
+        with contextlib.redirect_stdout(devnull):
+            single, bulk = asyncio.run(run(args))
+
+    print('One request per set: {:.0f} sets/s'.format(args.sets / single))
+    print('NDJSON request:      {:.0f} sets/s'.format(args.sets / bulk))
+
+
+if __name__ == '__main__':
+    main()
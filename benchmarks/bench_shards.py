@@ -0,0 +1,93 @@
+#   Smartc. Smart contracts for real time applications.
+#   Copyright (C) 2017 Guillem Borrell i Nogueras (@guillemborrell)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Throughput of a ContractManager with different numbers of workers.
+It creates many contracts, sets their attributes with many commands in
+flight, and reports the sets per second. Then it adds a worker and
+reports the time to move the contracts that it owns.
+
+    python benchmarks/bench_shards.py --workers 1 2 4 --contracts 1000
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import time
+
+from smartc.contract.builder import node, Attribute
+from smartc.manager import ContractManager
+
+
+@node
+def step(x):
+    return x + 1
+
+
+@node
+def join(x, y):
+    return x + y
+
+
+def template(width):
+    attributes = [Attribute('a{}'.format(i), int) for i in range(width)]
+    nodes = [step(step(a)) for a in attributes]
+    while len(nodes) > 1:
+        nodes = [join(*nodes[i:i + 2]) if i + 1 < len(nodes) else nodes[i]
+                 for i in range(0, len(nodes), 2)]
+    return nodes[0]
+
+
+async def run(templates, workers, args):
+    manager = ContractManager(templates)
+    await manager.start(workers)
+    contracts = await asyncio.gather(*[
+        manager.create('bench') for i in range(args.contracts)])
+
+    start = time.time()
+    for i in range(args.width):
+        await asyncio.gather(*[
+            manager.set(contract, {'a{}'.format(i): i})
+            for contract in contracts])
+    elapsed = time.time() - start
+
+    start = time.time()
+    await manager.add_worker()
+    moved = time.time() - start
+
+    await manager.close()
+    return args.contracts * args.width / elapsed, moved
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--contracts', type=int, default=1000)
+    parser.add_argument('--width', type=int, default=16,
+                        help='Number of attributes of each contract')
+    args = parser.parse_args()
+
+    templates = {'bench': template(args.width)}
+    for workers in args.workers:
+        with open(os.devnull, 'w') as devnull:
+            with contextlib.redirect_stdout(devnull):
+                rate, moved = asyncio.run(run(templates, workers, args))
+        print('{} workers: {:.0f} sets/s, {:.3f} s to add a worker'.format(
+            workers, rate, moved))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+#   Smartc. Smart contracts for real time applications.
+#   Copyright (C) 2017 Guillem Borrell i Nogueras (@guillemborrell)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Durable attribute sets with the write-ahead log. It compares a writer
+that waits for an fsync after each set with many writers whose sets
+are committed in groups, and measures the time to recover the
+contracts from the log.
+
+    python benchmarks/bench_wal.py --sets 20000 --threads 16
+"""
+import argparse
+import contextlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from smartc.contract.builder import node, Attribute, Contract
+from smartc.contract.wal import WriteAheadLog
+
+
+@node
+def double(a):
+    return 2 * a
+
+
+@node
+def add(x, y):
+    return x + y
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sets', type=int, default=20000)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--contracts', type=int, default=1000)
+    parser.add_argument('--directory', default=None,
+                        help='Directory of the log, a temporary one by '
+                             'default')
+    args = parser.parse_args()
+
+    a = Attribute('a', float, mutable=True)
+    b = Attribute('b', int, mutable=True)
+    templates = {'sum': add(double(a), b)}
+    directory = args.directory or tempfile.mkdtemp()
+    path = os.path.join(directory, 'wal')
+
+    with open(os.devnull, 'w') as devnull:
+        with contextlib.redirect_stdout(devnull):
+            wal = WriteAheadLog(path)
+            for i in range(args.contracts):
+                wal.create('c{}'.format(i), 'sum')
+
+            sets = args.sets // 10
+            start = time.time()
+            for i in range(sets):
+                wal.sync(wal.set('c{}'.format(i % args.contracts),
+                                 {'a': float(i)}))
+            single = sets / (time.time() - start)
+
+            def writer(first):
+                for i in range(first, args.sets, args.threads):
+                    wal.sync(wal.set('c{}'.format(i % args.contracts),
+                                     {'b': i}))
+
+            threads = [threading.Thread(target=writer, args=(i,))
+                       for i in range(args.threads)]
+            start = time.time()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            group = args.sets / (time.time() - start)
+            wal.close()
+
+            start = time.time()
+            wal = WriteAheadLog(path)
+            contracts = wal.recover(lambda name: Contract(templates[name]))
+            recovery = time.time() - start
+            wal.close()
+
+    print('Sync after each set:        {:.0f} sets/s'.format(single))
+    print('Group commit, {} threads:   {:.0f} sets/s'.format(
+        args.threads, group))
+    print('Recovered {} contracts from {} records in {:.3f} s'.format(
+        len(contracts), args.contracts + sets + args.sets, recovery))
+
+    if args.directory is None:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
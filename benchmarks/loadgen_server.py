@@ -0,0 +1,138 @@
+#   Smartc. Smart contracts for real time applications.
+#   Copyright (C) 2017 Guillem Borrell i Nogueras (@guillemborrell)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Load generator for the multi-process web server. For each number of
+workers it starts the server, connects the websocket clients from
+several client processes, publishes events at a fixed rate and
+reports the connections and the messages per second delivered.
+
+    python benchmarks/loadgen_server.py --workers 1 2 4 --clients 4000
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import signal
+import time
+from multiprocessing import Process, Queue
+
+import zmq
+from tornado.websocket import websocket_connect
+
+BROKER = 'tcp://127.0.0.1:5555'
+
+
+def serve(port, workers, reuse_port):
+    with open(os.devnull, 'w') as devnull:
+        with contextlib.redirect_stdout(devnull):
+            from smartc.server import main
+            main(port, workers, reuse_port)
+
+
+def publish(rate, duration):
+    socket = zmq.Context.instance().socket(zmq.PUB)
+    socket.bind(BROKER)
+    time.sleep(1)
+    end = time.time() + duration
+    while time.time() < end:
+        socket.send_multipart([b'pub', str(time.time()).encode()])
+        time.sleep(1 / rate)
+    socket.close()
+
+
+async def connect_clients(url, clients, counter, ready):
+    async def client():
+        connection = await websocket_connect(url)
+        ready.append(connection)
+        while True:
+            message = await connection.read_message()
+            if message is None:
+                break
+            counter[0] += 1
+
+    tasks = []
+    for batch in range(0, clients, 200):
+        size = min(batch + 200, clients)
+        tasks.extend(asyncio.ensure_future(client())
+                     for i in range(batch, size))
+        while len(ready) < size:
+            await asyncio.sleep(0.01)
+    return tasks
+
+
+def run_clients(url, clients, duration, results):
+    async def run():
+        counter = [0]
+        ready = []
+        await connect_clients(url, clients, counter, ready)
+        results.put(('connected', len(ready)))
+        await asyncio.sleep(1 + duration)
+        results.put(('received', counter[0]))
+        for connection in ready:
+            connection.close()
+
+    asyncio.run(run())
+
+
+def measure(args, workers):
+    server = Process(target=serve,
+                     args=(args.port, workers, args.reuse_port))
+    server.start()
+    time.sleep(1)
+
+    url = 'ws://127.0.0.1:{}/push'.format(args.port)
+    results = Queue()
+    per_process = args.clients // args.client_processes
+    clients = [Process(target=run_clients,
+                       args=(url, per_process, args.duration + 1, results))
+               for i in range(args.client_processes)]
+    for client in clients:
+        client.start()
+
+    connected = sum(results.get()[1] for client in clients)
+    publisher = Process(target=publish, args=(args.rate, args.duration))
+    publisher.start()
+    received = sum(results.get()[1] for client in clients)
+    publisher.join()
+    for client in clients:
+        client.join()
+
+    # The supervisor stops the workers
+    os.kill(server.pid, signal.SIGTERM)
+    server.join()
+
+    print('{:>3} workers: {:>6} connections, {:>10.0f} messages/s'.format(
+        workers, connected, received / args.duration))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--clients', type=int, default=2000)
+    parser.add_argument('--client-processes', type=int, default=4)
+    parser.add_argument('--rate', type=float, default=50)
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--reuse-port', action='store_true')
+    args = parser.parse_args()
+
+    for workers in args.workers:
+        measure(args, workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+#   Smartc. Smart contracts for real time applications.
+#   Copyright (C) 2017 Guillem Borrell i Nogueras (@guillemborrell)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Load test of the push websocket. It starts the web server and a
+publisher in separate processes, connects many websocket clients, and
+reports the messages per second delivered to the clients and the
+number of file descriptors open in the server.
+
+    python benchmarks/loadtest_push.py --clients 10000 --rate 100
+
+With --coalesce the messages are coalesced in frames during a window
+of that many seconds, and with --compression-level the frames are
+compressed with permessage-deflate.
+
+The number of clients is limited by the open files limit (ulimit -n).
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import time
+from multiprocessing import Process
+
+import zmq
+from tornado.websocket import websocket_connect
+
+from smartc.handlers.push import decode_batch
+
+
+def publish(address, rate, duration):
+    """
+    Publish messages at the given rate (per second) for a while.
+    """
+    socket = zmq.Context.instance().socket(zmq.PUB)
+    socket.bind(address)
+    time.sleep(1)
+    interval = 1 / rate
+    end = time.time() + duration
+    while time.time() < end:
+        socket.send_multipart([b'pub', str(time.time()).encode()])
+        time.sleep(interval)
+
+
+def serve(port, options):
+    with open(os.devnull, 'w') as devnull:
+        with contextlib.redirect_stdout(devnull):
+            from tornado import ioloop, web
+            from smartc.handlers.push import PushHandler
+            app = web.Application([(r'/push', PushHandler, options)])
+            app.listen(port)
+            ioloop.IOLoop.current().start()
+
+
+def open_files(pid):
+    return len(os.listdir('/proc/{}/fd'.format(pid)))
+
+
+async def client(url, counter, connected, coalesce, compression):
+    connection = await websocket_connect(
+        url, compression_options=compression)
+    connected.append(connection)
+    while True:
+        message = await connection.read_message()
+        if message is None:
+            break
+        if coalesce is None:
+            counter[0] += 1
+        else:
+            counter[0] += len(decode_batch(message))
+
+
+async def run(args, server):
+    url = 'ws://127.0.0.1:{}/push'.format(args.port)
+    counter = [0]
+    connected = []
+    tasks = []
+    compression = None
+    if args.compression_level is not None:
+        compression = {}
+    # Connect in batches, not to overflow the listen backlog
+    for batch in range(0, args.clients, 500):
+        size = min(batch + 500, args.clients)
+        for i in range(batch, size):
+            tasks.append(asyncio.ensure_future(
+                client(url, counter, connected, args.coalesce, compression)))
+        while len(connected) < size:
+            await asyncio.sleep(0.01)
+
+    print('{} clients connected, server has {} open files'.format(
+        len(connected), open_files(server.pid)))
+
+    publisher = Process(target=publish, args=(
+        args.broker, args.rate, args.duration))
+    publisher.start()
+    await asyncio.sleep(1)
+    start = time.time()
+    first = counter[0]
+    while publisher.is_alive():
+        await asyncio.sleep(1)
+    elapsed = time.time() - start
+    received = counter[0] - first
+
+    print('{} messages in {:.1f} s, {:.0f} messages/s delivered, '
+          '{:.1f} messages/s per client'.format(
+              received, elapsed, received / elapsed,
+              received / elapsed / max(1, len(connected))))
+    print('Server has {} open files'.format(open_files(server.pid)))
+
+    for connection in connected:
+        connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--clients', type=int, default=1000)
+    parser.add_argument('--rate', type=float, default=100)
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--broker', default='tcp://127.0.0.1:5555')
+    parser.add_argument('--coalesce', type=float, default=None,
+                        help='Window to coalesce messages, in seconds')
+    parser.add_argument('--compression-level', type=int, default=None)
+    args = parser.parse_args()
+
+    options = {'coalesce': args.coalesce,
+               'compression_level': args.compression_level}
+    server = Process(target=serve, args=(args.port, options))
+    server.start()
+    time.sleep(1)
+    try:
+        asyncio.run(run(args, server))
+    finally:
+        server.terminate()
+
+
+if __name__ == '__main__':
+    main()
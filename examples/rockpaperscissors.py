@@ -46,11 +46,17 @@ def firstgame(player1, player2):
 def game(player1, player2, scoreboard):
     return game_winner(player1, player2, scoreboard)
 
-@node
+@node(eager=True)
 def winner(message):
     print(message)
     return True
 
+
+@node
+def summary(notified, scoreboard):
+    print('Computing the summary')
+    return 'Player1 {player1} - Player2 {player2}'.format_map(scoreboard)
+
 def select_winner(*scoreboards):
     message = None
     
@@ -70,10 +76,17 @@ scoreboard2 = game(bets_player1[1], bets_player2[1], scoreboard1)
 scoreboard3 = game(bets_player1[2], bets_player2[2], scoreboard2)
 scoreboard4 = game(bets_player1[3], bets_player2[3], scoreboard3)
 scoreboard5 = game(bets_player1[4], bets_player2[4], scoreboard4)
-got_winner = gather(scoreboard3, scoreboard4, scoreboard5, condition=select_winner)
+# The condition only sees the scoreboards that arrived since the last call
+got_winner = gather(scoreboard3, scoreboard4, scoreboard5,
+                    condition=select_winner, mode='any')
 notify_winner = winner(got_winner)
+final_summary = summary(notify_winner, scoreboard4)
 
-contract = Contract(notify_winner)
+# In a lazy contract, nodes are evaluated when they are read. The winner
+# is eager, so it is notified as soon as it is known, along with the
+# scoreboards it depends on. The summary is only computed when it is
+# read with get.
+contract = Contract(final_summary, lazy=True)
 print(contract.graph)
 
 contract.set('player1_try0', 'rock')
@@ -85,4 +98,6 @@ contract.set('player2_try2', 'scissors')
 contract.set('player1_try3', 'rock')
 contract.set('player2_try3', 'paper')
 
+print(contract.get(final_summary))
+
 contract.visualize()
@@ -13,6 +13,7 @@ setup(
         ],
     zip_safe=False,
     install_requires=['zmq', 'tornado', 'autobahn', 'graphviz'],
+    extras_require={'batch': ['numpy']},
     include_package_data=True,
     setup_requires=['flake8'],
     tests_require=[]
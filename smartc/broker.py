@@ -14,17 +14,157 @@
 #   You should have received a copy of the GNU Affero General Public License
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import zmq
+import asyncio
 import time
 
+import zmq
+
+from smartc.monitor import metrics
+
+# Contract workers publish to the frontend, web servers subscribe to
+# the backend.
+FRONTEND = 'tcp://127.0.0.1:5556'
+BACKEND = 'tcp://127.0.0.1:5555'
+
+PUBLISHED = metrics.counter(
+    'smartc_zmq_messages_published_total', 'Messages sent to the broker')
+EVENTS = metrics.counter(
+    'smartc_zmq_events_published_total', 'Events sent to the broker')
+
+
+def run_broker(frontend=FRONTEND, backend=BACKEND, hwm=100000):
+    """
+    Run the broker, a XSUB/XPUB proxy. Any number of publishers connect
+    to the frontend and any number of subscribers to the backend, and
+    the subscriptions are forwarded upstream, so the publishers only
+    send what somebody is subscribed to. It blocks forever.
+
+    :param frontend: Address where publishers connect
+    :param backend: Address where subscribers connect
+    :param hwm: High water mark of the sockets, in messages
+    """
+    context = zmq.Context.instance()
+    xsub = context.socket(zmq.XSUB)
+    xsub.setsockopt(zmq.RCVHWM, hwm)
+    xsub.bind(frontend)
+
+    xpub = context.socket(zmq.XPUB)
+    xpub.setsockopt(zmq.SNDHWM, hwm)
+    xpub.bind(backend)
+
+    print('Broker from {} to {}'.format(frontend, backend))
+    zmq.proxy(xsub, xpub)
+
+
+class Publisher:
+    """
+    Publisher that sends events to the broker. Small events are batched
+    per topic in multipart messages, where the first frame is the topic
+    and each of the following frames is an event. A batch is sent when
+    it has *batch_size* events, when the oldest event is older than
+    *max_delay* seconds, or when :meth:`flush` is called.
+
+    Within a running event loop, a timer sends the batches *max_delay*
+    seconds after the oldest event was published. Without one, the age
+    of the batches is only checked when an event is published, so the
+    caller must call :meth:`flush` when it stops publishing.
+
+    :param address: Address of the frontend of the broker
+    :param batch_size: Maximum number of events in a message
+    :param max_delay: Maximum time an event waits in a batch, in seconds
+    :param hwm: High water mark of the socket, in messages
+    """
+    def __init__(self, address=FRONTEND, batch_size=1, max_delay=0.001,
+                 hwm=100000):
+        self.socket = zmq.Context.instance().socket(zmq.PUB)
+        self.socket.setsockopt(zmq.SNDHWM, hwm)
+        self.socket.connect(address)
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.batches = {}
+        self.oldest = None
+        self.timer = None
+
+    def publish(self, topic, event):
+        """
+        Publish an event in a topic
+
+        :param topic: Topic as a string
+        :param event: Event as bytes
+        """
+        if self.batch_size <= 1:
+            self.socket.send_multipart([topic.encode(), event])
+            if metrics.enabled:
+                PUBLISHED.inc()
+                EVENTS.inc()
+            return
+
+        batch = self.batches.get(topic)
+        if batch is None:
+            batch = self.batches[topic] = [topic.encode()]
+            if self.oldest is None:
+                self.oldest = time.monotonic()
+                self._schedule()
+        batch.append(event)
+
+        if len(batch) > self.batch_size:
+            self._send(batch)
+            del self.batches[topic]
+            if not self.batches:
+                self.flush()
+        elif time.monotonic() - self.oldest > self.max_delay:
+            self.flush()
+
+    def _schedule(self):
+        """
+        Flush the batches after *max_delay* seconds if there is an event
+        loop running in this thread.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+
+        self.timer = loop.call_later(self.max_delay, self._expire)
+
+    def _expire(self):
+        self.timer = None
+        self.flush()
+
+    def _send(self, batch):
+        self.socket.send_multipart(batch)
+        if metrics.enabled:
+            PUBLISHED.inc()
+            EVENTS.inc(len(batch) - 1)
+
+    def flush(self):
+        """
+        Send all the pending batches
+        """
+        for batch in self.batches.values():
+            self._send(batch)
+        self.batches.clear()
+        self.oldest = None
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+    def close(self, linger=None):
+        """
+        Send the pending batches and close the socket
+
+        :param linger: Time to wait for the messages not sent yet, in
+                       milliseconds. Forever by default.
+        """
+        self.flush()
+        self.socket.close(linger=linger)
+
 
-def server_pub():
+def server_pub(address=FRONTEND):
     print("Starting...")
-    context = zmq.Context()
-    socket = context.socket(zmq.PUB)
-    socket.bind("tcp://127.0.0.1:5555")
+    publisher = Publisher(address)
     topic = "pub"
 
     for i in range(10):
-        socket.send_multipart([topic.encode(), b"a_message"])
+        publisher.publish(topic, b"a_message")
         time.sleep(1)
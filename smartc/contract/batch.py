@@ -0,0 +1,355 @@
+#   Smartc. Smart contracts for real time applications.
+#   Copyright (C) 2017 Guillem Borrell i Nogueras (@guillemborrell)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from array import array
+from heapq import heappush, heappop
+
+from smartc.contract.builder import ContractTemplate
+from smartc.contract.schedule import compile_graph
+
+# NumPy is optional. Without it, all the columns are lists.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+NUMERIC_TYPES = (int, float, bool)
+
+
+class ContractBatch:
+    """
+    Many instances of the same contract that share a single compiled
+    schedule. Each instance is a row, and the values of each node are
+    stored in a column with one item per row. Attributes of type int,
+    float or bool are stored in NumPy arrays if NumPy is installed.
+
+    A node is evaluated for all the rows that are ready at the same time.
+    Functions decorated with ``@node(vectorize=True)`` are called once
+    with a column per argument, the rest are called once per row.
+    Gathers behave like in :class:`smartc.contract.builder.Contract`,
+    for each row: in ``'first'`` and ``'any'`` modes the condition gets
+    the arguments that arrived since the last call, and they freeze the
+    nodes upstream of the row once they fire.
+
+    :param node: Node of type Node, usually the last node in the task
+                 graph, or a ContractTemplate
+    :param size: Number of instances of the contract
+    """
+    def __init__(self, node, size):
+        if isinstance(node, ContractTemplate):
+            self.schedule = node.schedule
+        else:
+            self.schedule = compile_graph(node.graph, node.attrs, node.name)
+        if self.schedule.is_async:
+            raise ValueError(
+                'ContractBatch does not support asynchronous nodes'
+            )
+
+        self.attrs = self.schedule.attrs
+        self.size = size
+        self.columns = [self._column(name) for name in self.schedule.names]
+        self.pending = [array('l', [needed]) * size
+                        for needed in self.schedule.needed]
+        self.evaluated = [bytearray(size) for name in self.schedule.names]
+        self.locked = [bytearray([lock]) * size
+                       for lock in self.schedule.lock]
+        self.frozen = [bytearray(size) for name in self.schedule.names]
+        self.arrivals = {}
+        self._ready = {}
+        self._heap = []
+
+    def _column(self, name):
+        """
+        Empty column for the node or the attribute with the given name
+        """
+        if np is not None and name in self.attrs:
+            attr_type = self.attrs[name].attr_type
+            if attr_type in NUMERIC_TYPES:
+                return np.zeros(self.size, dtype=attr_type)
+
+        return [None] * self.size
+
+    def _take(self, column, rows):
+        """
+        Values of a column for the given rows. The whole column is
+        returned if all the rows are requested.
+        """
+        if len(rows) == self.size:
+            return column
+
+        if np is not None and isinstance(column, np.ndarray):
+            return column[rows]
+
+        return [column[r] for r in rows]
+
+    def _value(self, j, r):
+        """
+        Value of the node or the attribute *j* in the row *r*, as a
+        Python object, or None if it has not been evaluated.
+        """
+        if not self.evaluated[j][r]:
+            return None
+
+        value = self.columns[j][r]
+        if np is not None and isinstance(value, np.generic):
+            return value.item()
+
+        return value
+
+    def _values(self, j, rows, mask):
+        """
+        Values of the node or the attribute *j* for the given rows, as
+        Python objects. If *mask* is True, the rows where it has not
+        been evaluated are None instead of the zero of a numeric column.
+        """
+        values = self._take(self.columns[j], rows)
+        if np is not None and isinstance(values, np.ndarray):
+            values = values.tolist()
+        elif np is not None:
+            values = [v.item() if isinstance(v, np.generic) else v
+                      for v in values]
+
+        if mask:
+            evaluated = self.evaluated[j]
+            values = [v if evaluated[r] else None
+                      for r, v in zip(rows, values)]
+
+        return values
+
+    def _put(self, i, rows, values):
+        """
+        Store the values of the node or the attribute *i* for the
+        given rows.
+        """
+        column = self.columns[i]
+        if np is not None and isinstance(values, np.ndarray):
+            if isinstance(column, list) and not any(self.evaluated[i]):
+                column = np.zeros(self.size, dtype=values.dtype)
+                self.columns[i] = column
+
+            if isinstance(column, np.ndarray):
+                column[rows] = values
+                return
+
+        for r, value in zip(rows, values):
+            column[r] = value
+
+    def _release(self, i, rows):
+        """
+        Mark the node *i* as evaluated for the given rows, and queue the
+        rows of the successors that become ready and are not frozen. The
+        rows that arrive at a waiting gather in delta mode are recorded.
+        """
+        evaluated = self.evaluated[i]
+        for r in rows:
+            evaluated[r] = 1
+
+        delta = self.schedule.delta
+        for target in self.schedule.targets(i):
+            pending = self.pending[target]
+            target_evaluated = self.evaluated[target]
+            frozen = self.frozen[target]
+            if delta[target]:
+                locked = self.locked[target]
+                arrivals = self.arrivals.setdefault(target, {})
+                for r in rows:
+                    if locked[r] and not frozen[r]:
+                        arrivals.setdefault(r, []).append(i)
+
+            ready = None
+            for r in rows:
+                pending[r] -= 1
+                if pending[r] <= 0 and not target_evaluated[r] and \
+                        not frozen[r]:
+                    if ready is None:
+                        ready = self._ready.get(target)
+                        if ready is None:
+                            ready = self._ready[target] = set()
+                            heappush(self._heap, target)
+                    ready.add(r)
+
+    def _freeze(self, i, rows):
+        """
+        Freeze the gather *i* in the given rows, and the nodes upstream
+        whose successors are all frozen in the same row.
+        """
+        schedule = self.schedule
+        for r in rows:
+            self.frozen[i][r] = 1
+            stack = [i]
+            while stack:
+                for j in schedule.args(stack.pop()):
+                    frozen = self.frozen[j]
+                    if schedule.methods[j] is None or frozen[r]:
+                        continue
+
+                    if all(self.frozen[t][r] for t in schedule.targets(j)):
+                        frozen[r] = 1
+                        self.arrivals.get(j, {}).pop(r, None)
+                        stack.append(j)
+
+    def _call(self, i, rows):
+        """
+        Evaluate the node *i* for the given rows and return the values.
+        A gather in delta mode takes the values of the arguments that
+        arrived in each row. Functions called once per row take Python
+        values, like in a contract.
+        """
+        schedule = self.schedule
+        method = schedule.methods[i]
+        if schedule.delta[i]:
+            arrivals = self.arrivals.get(i, {})
+            return [method(*[self._value(j, r) for j in arrivals.pop(r, ())])
+                    for r in rows]
+
+        if schedule.vectorize[i]:
+            values = method(*[self._take(self.columns[j], rows)
+                              for j in schedule.args(i)])
+            if len(values) != len(rows):
+                raise ValueError(
+                    'Node {} returned {} values for {} rows'.format(
+                        schedule.names[i], len(values), len(rows))
+                )
+            return values
+
+        # The arguments of a gather may not have a value yet
+        columns = [self._values(j, rows, schedule.lock[i])
+                   for j in schedule.args(i)]
+        cache = schedule.caches[i]
+        if cache is not None:
+            return [cache.call(method, args) for args in zip(*columns)]
+
+        return [method(*args) for args in zip(*columns)]
+
+    def _node_eval(self):
+        """
+        Evaluate the queued nodes in topological order. Since the ids
+        of the nodes are topological, each node is evaluated once for
+        all its ready rows.
+        """
+        while self._heap:
+            i = heappop(self._heap)
+            rows = sorted(self._ready.pop(i))
+            values = self._call(i, rows)
+            self._put(i, rows, values)
+
+            if self.schedule.lock[i]:
+                # Rows of a gather are released once their condition
+                # is met. Then they are unlocked for good.
+                locked = self.locked[i]
+                released = []
+                for r, value in zip(rows, values):
+                    if not locked[r]:
+                        released.append(r)
+                    elif value is not None:
+                        locked[r] = 0
+                        released.append(r)
+                rows = released
+
+            self._release(i, rows)
+            if self.schedule.freeze[i]:
+                self._freeze(i, rows)
+
+    def _check(self, attribute, values, rows):
+        """
+        Check that the attribute is in the contract, the type of the
+        values, and that it is not set yet in any of the rows, since
+        the nodes downstream are not recomputed, even for mutable
+        attributes. Returns the id of the attribute.
+        """
+        if attribute not in self.attrs:
+            raise ValueError(
+                'Attribute {} not present in the graph'.format(attribute)
+            )
+
+        if len(values) != len(rows):
+            raise ValueError(
+                'Got {} values for {} rows'.format(len(values), len(rows))
+            )
+
+        attr_type = self.attrs[attribute].attr_type
+        if np is not None and isinstance(values, np.ndarray):
+            if attr_type not in NUMERIC_TYPES or \
+                    not np.can_cast(values.dtype, attr_type):
+                raise ValueError(
+                    'Attribute {} not of type {}'.format(attribute, attr_type)
+                )
+        elif any(type(value) is not attr_type for value in values):
+            raise ValueError(
+                'Attribute {} not of type {}'.format(attribute, attr_type)
+            )
+
+        i = self.schedule.index[attribute]
+        evaluated = self.evaluated[i]
+        if any(evaluated[r] for r in rows):
+            raise ValueError(
+                'Attribute {} is already set in some of the rows'.format(
+                    attribute)
+            )
+
+        return i
+
+    def set(self, attribute, values, rows=None):
+        """
+        Set an attribute for many instances and evaluate the task graph.
+
+        :param attribute: Name of the attribute to be evaluated.
+        :param values: Sequence with a value for each row.
+        :param rows: Rows to set, all of them by default.
+        """
+        self.set_many({attribute: values}, rows)
+
+    def set_many(self, attributes, rows=None):
+        """
+        Set multiple attributes for many instances, and evaluate the
+        task graph once.
+
+        :param attributes: Dictionary with names of attributes as keys
+                           and sequences of values.
+        :param rows: Rows to set, all of them by default.
+        """
+        if rows is None:
+            rows = list(range(self.size))
+        else:
+            rows = list(rows)
+
+        ids = [(self._check(k, v, rows), v) for k, v in attributes.items()]
+        for i, values in ids:
+            self._put(i, rows, values)
+
+        for i, values in ids:
+            self._release(i, rows)
+
+        self._node_eval()
+
+    def column(self, name):
+        """
+        Column with the values of a node or an attribute for all the
+        rows. Rows that have not been evaluated hold None or zero.
+        """
+        return self.columns[self.schedule.index[name]]
+
+    def get(self, row, name):
+        """
+        Value of a node or an attribute for a single row, or None if
+        it has not been evaluated.
+        """
+        i = self.schedule.index[name]
+        if not self.evaluated[i][row]:
+            return None
+
+        return self.columns[i][row]
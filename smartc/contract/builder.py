@@ -14,16 +14,106 @@
 #   You should have received a copy of the GNU Affero General Public License
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from uuid import uuid4
+import asyncio
+import pickle
+from array import array
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from heapq import heappop, heappush
+from importlib import import_module
+from itertools import count
+from sys import intern
+from time import perf_counter
 # You need python-graphviz and graphviz, the system library.
 from graphviz import Digraph
 
+from smartc.contract.cache import NodeCache, MISSING
+from smartc.contract.schedule import compile_graph, \
+    EVALUATED, LOCKED, QUEUED, PENDING, FROZEN
+from smartc.monitor import metrics
+
+SETS = metrics.counter(
+    'smartc_contract_sets_total', 'Sets of attributes of contracts')
+SET_SECONDS = metrics.histogram(
+    'smartc_contract_set_seconds',
+    'Time to set attributes and evaluate the contract')
+NODE_SECONDS = metrics.histogram(
+    'smartc_contract_node_seconds',
+    'Time to evaluate a node, by function', ['function'])
+NODES_EVALUATED = metrics.histogram(
+    'smartc_contract_nodes_evaluated', 'Nodes evaluated by each set',
+    lowest=1, highest=2 ** 20)
+PROPAGATION_DEPTH = metrics.histogram(
+    'smartc_contract_propagation_depth',
+    'Longest chain of nodes evaluated by each set', lowest=1,
+    highest=2 ** 16)
+RECOMPUTED = metrics.counter(
+    'smartc_contract_nodes_recomputed_total',
+    'Nodes recomputed after a mutable attribute changed')
+CUTOFFS = metrics.counter(
+    'smartc_contract_cutoffs_total',
+    'Recomputed nodes whose value did not change')
+APPENDED = metrics.counter(
+    'smartc_contract_appended_items_total',
+    'Items appended to multiple attributes')
+
+# Items of multiple attributes of these types are stored in arrays
+BUFFER_TYPECODES = {int: 'q', float: 'd'}
+
+
+# Separates the name of the function from the suffix of a node. It is
+# reserved, so no attribute can have the name of a node.
+SEPARATOR = '~'
+
+_suffixes = count()
+
 
 def gen_short_random():
     """
-    Convenience function that creates an 8-character random string
+    Convenience function that creates a short suffix that is unique
+    within the process, to name the nodes.
+    """
+    return '{}{:x}'.format(SEPARATOR, next(_suffixes))
+
+
+def function_reference(f):
+    """
+    Reference to a function that can be stored or sent to another
+    process: the name of its module and its qualified name.
+    """
+    return f.__module__, f.__qualname__
+
+
+def resolve_reference(reference):
+    """
+    Object pointed by a reference built with :func:`function_reference`.
+    """
+    module, qualname = reference
+    obj = import_module(module)
+    for name in qualname.split('.'):
+        obj = getattr(obj, name)
+
+    return obj
+
+
+def resolve_function(reference):
+    """
+    Function from a reference built with :func:`function_reference`.
+    If the name points to a function decorated with @node, it returns
+    the decorated function.
+    """
+    obj = resolve_reference(reference)
+    if isinstance(obj, Method):
+        return obj.function
+
+    return obj
+
+
+def call_function(reference, args):
+    """
+    Resolve a function reference and call it with the given arguments.
     """
-    return '_' + str(uuid4())[:8]
+    return resolve_function(reference)(*args)
 
 
 class Attribute:
@@ -42,10 +132,16 @@ class Attribute:
     permission. Finally, a variable is blocked if no user can set its value
     until some function of the contract changes this flag.
     """
+    __slots__ = ('name', 'attr_type', 'value', 'mutable', 'multiple',
+                 'allowed')
+
     def __init__(self, name, attr_type,
                  mutable=False, multiple=False,
                  allowed=None, blocked=False):
-        self.name = name
+        if SEPARATOR in name:
+            raise ValueError(
+                'Attribute names cannot contain {}'.format(SEPARATOR))
+        self.name = intern(name)
         self.attr_type = attr_type
         self.value = None
         self.mutable = mutable
@@ -70,13 +166,33 @@ class GraphNode:
     :param args: Arguments of the function to be evaluated
     :param method: Function to be evaluated
     :param value: Result of the function
+    :param vectorize: True if the function takes and returns arrays
+    :param cache: NodeCache with the results of a pure function
+    :param reducer: Reducer that updates the value when an item is
+                    appended to the argument
+    :param eager: True if the node is evaluated eagerly in lazy contracts
+    :param delta: True if the node is a gather whose condition takes the
+                  new arguments only
+    :param freeze: True if the node is a gather that freezes the nodes
+                   upstream once it fires
     """
-    def __init__(self, args, method, value, min_args=None, lock=False):
+    __slots__ = ('args', 'method', 'value', 'min_args', 'lock',
+                 'vectorize', 'cache', 'reducer', 'eager', 'delta',
+                 'freeze', 'to')
+
+    def __init__(self, args, method, value, min_args=None, lock=False,
+                 vectorize=False, cache=None, reducer=None, eager=False):
         self.args = args
         self.method = method
         self.value = value
         self.min_args = min_args
         self.lock = lock 
+        self.vectorize = vectorize
+        self.cache = cache
+        self.reducer = reducer
+        self.eager = eager
+        self.delta = False
+        self.freeze = False
         self.to = []
 
     def add_target(self, target):
@@ -92,61 +208,116 @@ class GraphNode:
         return '[{}] : {} lock({})'.format(', '.join(self.to), self.value, self.lock)
 
 
+class GraphRegistry:
+    """
+    Append-only store of the graph shared by all the nodes that are
+    connected. Nodes are only added to a registry, never copied. When
+    a node depends on nodes from different registries, the registries
+    are merged union-find style: the smaller one is appended to the
+    larger one and points to it from then on, so building a graph
+    costs O(1) amortized per node.
+    """
+    __slots__ = ('parent', 'graph', 'attrs')
+
+    def __init__(self):
+        self.parent = None
+        self.graph = {}
+        self.attrs = {}
+
+    def find(self):
+        """
+        Returns the registry that actually stores the graph, and
+        compresses the path to it.
+        """
+        root = self
+        while root.parent is not None:
+            root = root.parent
+
+        registry = self
+        while registry.parent is not None and registry.parent is not root:
+            registry.parent, registry = root, registry.parent
+
+        return root
+
+    def union(self, other):
+        """
+        Merge two registries and return the one that stores the result.
+        """
+        first = self.find()
+        second = other.find()
+        if first is second:
+            return first
+
+        if len(first.graph) < len(second.graph):
+            first, second = second, first
+
+        for k, v in second.graph.items():
+            if k in first.graph:
+                # Only attributes may be shared by two registries
+                first.graph[k].to.extend(v.to)
+            else:
+                first.graph[k] = v
+
+        first.attrs.update(second.attrs)
+        second.parent = first
+        second.graph = None
+        second.attrs = None
+
+        return first
+
+
 class Node:
     """
     Convenience class to build the contract. It stores all the
     necessary information from the graph as it is built, and it is
-    returned by the @node decorator (see below).
+    returned by the @node decorator (see below). The graph and the
+    attributes are a view of the registry shared by all the connected
+    nodes, so they may contain nodes built after this one.
     """
-    def __init__(self, name, graph, attrs=None):
+    __slots__ = ('name', 'registry', 'value')
+
+    def __init__(self, name, registry):
         self.name = name
-        self.graph = graph
+        self.registry = registry
         self.value = None
-        self.attrs = {}
 
-        if attrs:
-            self.attrs.update(attrs)
+    @property
+    def graph(self):
+        self.registry = self.registry.find()
+        return self.registry.graph
+
+    @property
+    def attrs(self):
+        self.registry = self.registry.find()
+        return self.registry.attrs
 
 
 class Method:
     """
     Fundamental class to build the graph programatically. The @node
     decorator basically hides the initialization of this class. It
-    builds the graph in a node from all the previous nodes.
+    adds a node to the registry shared by all the previous nodes.
     """
-    def __init__(self, f):
+    def __init__(self, f, vectorize=False, pure=False, cache=None,
+                 reducer=None, eager=False):
         self.name = f.__name__
         self.function = f
+        self.vectorize = vectorize
+        self.reducer = reducer
+        self.eager = eager
+        if cache is not None and not pure:
+            raise ValueError('Only pure nodes can be cached')
+
+        if pure:
+            if cache is None:
+                cache = NodeCache()
+            elif isinstance(cache, int):
+                cache = NodeCache(cache)
+        self.cache = cache
         self.graph = None
         self.attrs = {}
         self.ev_name = None
 
-    @staticmethod
-    def _merge_graphs(graph1, graph2):
-        """
-        Convenience function to merge the graph coming from two nodes
-        """
-        keys_graph1 = [k for k in graph1]
-        keys_graph2 = [k for k in graph2]
-        keys_graph1.extend(keys_graph2)
-        keys_set = set(keys_graph1)
-        result = dict()
-
-        for k in keys_set:
-            if k in graph1 and k not in graph2:
-                result[k] = graph1[k]
-
-            elif k in graph2 and k not in graph1:
-                result[k] = graph2[k]
-
-            elif k in graph1 and k in graph2:
-                targets = list(set(graph1[k].to + graph2[k].to))
-                value = graph1[k]
-                value.to = targets                    
-                result[k] = value
-                
-        return result
-
     def __call__(self, *args):
         """
         This is what makes the trick of delayed evaluation. Calling the
@@ -155,64 +326,174 @@ class Method:
         """
         # This is the name of the node, that comes from the name of the
         # name of the function that is evaluated
-        self.ev_name = self.name + gen_short_random()
-
-        # Empty graph, that will be build from the preceding nodes
-        self.graph = {}
+        self.ev_name = intern(self.name + gen_short_random())
 
+        # Merge the registries of the preceding nodes, if any
+        registry = None
         for arg in args:
             if type(arg) == Node:
-                # If the arguments are nodes, merge the different graphs
-                self.graph = self._merge_graphs(self.graph, arg.graph)
-                self.attrs.update(arg.attrs)
-            elif type(arg) == Attribute:
+                if registry is None:
+                    registry = arg.registry.find()
+                else:
+                    registry = registry.union(arg.registry)
+            elif type(arg) != Attribute:
+                raise ValueError(
+                    'Method arguments can only be of Node'
+                    ' or Attribute type'
+                    )
+
+        if self.reducer is not None and (
+                len(args) != 1 or type(args[0]) != Attribute or
+                not args[0].multiple):
+            raise ValueError(
+                'Node {} with a reducer must take a single multiple '
+                'attribute'.format(self.name)
+            )
+
+        if registry is None:
+            registry = GraphRegistry()
+
+        self.graph = registry.graph
+        self.attrs = registry.attrs
+
+        for arg in args:
+            if type(arg) == Attribute:
                 # If the argument is an attribute, update the graph and
                 # the list of arguments
                 if arg.name not in self.graph:
                     self.graph[arg.name] = GraphNode((), None, None)
+                elif self.graph[arg.name].method is not None:
+                    raise ValueError(
+                        'Attribute {} has the name of a node'.format(
+                            arg.name))
                 self.attrs[arg.name] = arg
-            else:
-                raise ValueError(
-                    'Method arguments can only be of Node'
-                    ' or Attribute type'
-                    )
 
         # Update the graph with the present node
         self.graph[self.ev_name] = GraphNode(tuple(a.name for a in args),
-                                        self.function,
-                                        None)
+                                             self.function,
+                                             None,
+                                             vectorize=self.vectorize,
+                                             cache=self.cache,
+                                             reducer=self.reducer,
+                                             eager=self.eager)
 
         # Update the list of targets in the preceding nodes
         for arg in args:
             self.graph[arg.name].add_target(self.ev_name)
 
         # Return a node to keep building.
-        return Node(self.ev_name, self.graph, attrs=self.attrs)
+        return Node(self.ev_name, registry)
 
 
-def gather(*args, condition=None):
-    def default_gather(*args):
-        if all(args):
-            return True
-    
-    if condition is None:
-        _gather_function = default_gather
-    else:
-        _gather_function = condition
+def default_gather(*args):
+    """
+    Condition of a gather node when none is given. It is met when all
+    the arguments have a value.
+    """
+    if all(args):
+        return True
 
-    method = Method(_gather_function)
+
+def first_value(*args):
+    """
+    Condition of a gather that fires with the first argument that has
+    a value.
+    """
+    for arg in args:
+        if arg is not None:
+            return arg
+
+
+def all_values(*args):
+    """
+    Condition of a gather that fires with the values of all the
+    arguments.
+    """
+    return args
+
+
+GATHER_MODES = (None, 'first', 'any', 'all')
+
+
+def gather(*args, condition=None, mode=None, freeze=True):
+    """
+    Node that waits for its arguments until a condition is met. The
+    condition returns None to keep waiting, or the value of the node.
+    Then the node fires: it releases the nodes downstream, and it keeps
+    its value for good. The *mode* selects when the condition is called:
+
+    * None: each time an argument arrives, with the values of all the
+      arguments, None for the ones that did not arrive.
+    * ``'any'``: each time arguments arrive, with the values of the new
+      arguments only, so the cost does not grow with the arguments that
+      arrived before.
+    * ``'first'``: it fires with the first argument that arrives. It
+      takes no condition.
+    * ``'all'``: once, when all the arguments have arrived. Without a
+      condition, it fires with the tuple of their values.
+
+    If *freeze* is True, the nodes upstream of the gather whose values
+    are only used by frozen nodes are frozen when it fires, and they are
+    not evaluated anymore.
+
+    :param args: Arguments, of type Node or Attribute
+    :param condition: Function of the values of the arguments
+    :param mode: None, ``'first'``, ``'any'`` or ``'all'``
+    :param freeze: True to freeze the nodes upstream once it fires
+    """
+    if mode not in GATHER_MODES:
+        raise ValueError('Unknown gather mode {}'.format(mode))
+
+    if mode == 'first':
+        if condition is not None:
+            raise ValueError('A gather in first mode takes no condition')
+        condition = first_value
+    elif condition is None:
+        condition = {None: default_gather, 'any': first_value,
+                     'all': all_values}[mode]
+
+    method = Method(condition)
     node = method(*args)
-    node.graph[method.ev_name].min_args = 1
-    node.graph[method.ev_name].lock = True
+    graph_node = node.graph[method.ev_name]
+    # A gather in all mode needs all its arguments, like any other node
+    graph_node.min_args = None if mode == 'all' else 1
+    graph_node.lock = True
+    graph_node.delta = mode in ('first', 'any')
+    graph_node.freeze = freeze
 
     return node
 
 
-def node(f):
+def node(f=None, vectorize=False, pure=False, cache=None, reducer=None,
+         eager=False):
     """
     Decorator that is used to build a task graph with delayed evaluation.
     It decorates functions that depend on arguments of class Attribute
-    or Node.
+    or Node. Functions defined with ``async def`` are also accepted,
+    and they are awaited by :meth:`Contract.aset`.
+
+    The decorator also accepts options, as in ``@node(vectorize=True)``.
+    A vectorized function is called by
+    :class:`smartc.contract.batch.ContractBatch` once for many instances
+    of the contract, with a sequence (a NumPy array if possible) per
+    argument, and it must return a sequence of the same length.
+
+    A function that always returns the same value for the same arguments
+    can be declared with ``@node(pure=True)``. Its results are stored in
+    a :class:`smartc.contract.cache.NodeCache`, keyed on the values of
+    the arguments and shared by all the contracts built from the graph.
+    The *cache* option is either the maximum number of results or a
+    NodeCache, that may be shared by many functions.
+
+    A function whose only argument is a multiple attribute can be
+    updated incrementally when items are appended to the attribute,
+    declaring a reducer from :mod:`smartc.contract.reducers`, as in
+    ``@node(reducer=Sum())``.
+
+    Contracts created with ``lazy=True`` only evaluate a node when it is
+    read with :meth:`Contract.get`. Nodes with side effects that must
+    run anyway, like notifications, are declared with
+    ``@node(eager=True)``.
 
     >>> from smartc.contract.builder import node
     >>> from smartc.contract.builder import Attribute
@@ -229,7 +510,12 @@ def node(f):
     >>> print(d.graph)
     {'b': [add_2787ddee: None], 'a': [timestwo_100ec180: None], 'timestwo_100ec180': [add_2787ddee: None], 'add_2787ddee': [: None]}
     """
-    return Method(f)
+    if f is None:
+        return lambda f: Method(f, vectorize=vectorize, pure=pure,
+                                cache=cache, reducer=reducer, eager=eager)
+
+    return Method(f, vectorize=vectorize, pure=pure, cache=cache,
+                  reducer=reducer, eager=eager)
 
 
 def visualize(node):
@@ -248,45 +534,333 @@ def visualize(node):
     dot.render()
 
 
-class Contract:
+class ContractTemplate:
     """
-    Class that builds and evaluates a contract given a node in
-    the task graph.
+    Task graph compiled once into a
+    :class:`smartc.contract.schedule.Schedule`, to create many contracts
+    from it. The contracts share the schedule, the functions and the
+    attributes, and each one only allocates its values and its
+    evaluation state, so creating a contract does not depend on the
+    time it takes to build or compile the graph::
 
-    :param node:  Node of type Node, usually the last node in the task graph
+        template = ContractTemplate(last)
+        contract = template.instantiate()
+
+    The graph can be modified or discarded after the template is
+    created.
+
+    :param node: Node of type Node, usually the last node in the task graph
     """
-    @staticmethod
-    def _build_eval_graph(graph):
-        """
-        Convenience function that updates the eval graph. The contract
-        stores an additional graph that is used to check when a node has
-        to be evaluated, the eval_graph. It basically stores a dict with
-        two keys, 'total' is the number of preceding nodes, and 'eval' 
-        is set to 1 or True if the node can be evaluated.
-        """
-        eval_graph = {}
-        for k, v in graph.items():
-            if v.min_args is None:
-                eval_graph[k] = dict(total=len(v.args), eval=0)
-            else:
-                eval_graph[k] = dict(total=v.min_args, eval=0)
+    __slots__ = ('name', 'schedule')
 
-        return eval_graph
+    def __init__(self, node):
+        self.name = node.name
+        self.schedule = compile_graph(node.graph, node.attrs, node.name)
 
-    def __init__(self, node=None):
+    @property
+    def attrs(self):
+        return self.schedule.attrs
+
+    def instantiate(self, executor=None, lazy=False):
+        """
+        New contract with no node evaluated. It is equivalent to
+        ``Contract(template)``.
+
+        :param executor: Optional thread or process pool executor.
+        :param lazy: True to evaluate the nodes only when they are read.
+        """
+        contract = Contract.__new__(Contract)
+        contract.graph = None
+        contract._setup(self.schedule, executor, lazy=lazy)
+        return contract
+
+    def restore(self, snapshot, executor=None):
+        """
+        Contract restored from a snapshot taken with
+        :meth:`Contract.snapshot`.
+
+        :param snapshot: Bytes returned by :meth:`Contract.snapshot`
+        :param executor: Optional thread or process pool executor.
+        """
+        return Contract.restore(self.schedule, snapshot, executor)
+
+    def __repr__(self):
+        return 'ContractTemplate({}, {!r})'.format(self.name, self.schedule)
+
+
+class Contract:
+    """
+    Class that builds and evaluates a contract given a node in
+    the task graph. The graph is compiled into a
+    :class:`smartc.contract.schedule.Schedule` when the contract is
+    created. The values are kept in a list indexed by the id of each
+    node, and the evaluation state of each node is packed in a single
+    integer of the *state* array: the evaluated, locked and queued
+    flags, and the number of pending arguments (see
+    :mod:`smartc.contract.schedule`).
+
+    If an executor from :mod:`concurrent.futures` is given, the nodes
+    that are ready at the same time are evaluated concurrently in it.
+    Functions evaluated in a process pool must be importable from the
+    module they are defined in.
+
+    A contract built from a node compiles its own schedule. To create
+    many contracts from the same graph, build them from a
+    :class:`ContractTemplate` instead, that is compiled once.
+
+    A lazy contract only evaluates a node when it is read with
+    :meth:`get`, along with the nodes it depends on, and keeps the value
+    until an argument changes. Nodes declared with ``@node(eager=True)``
+    and the nodes they depend on are still evaluated when the
+    attributes are set.
+
+    If *changes* is set to a list, the ids of the nodes and the
+    attributes that get a new value are appended to it while the
+    contract is evaluated, to follow the changes of a set without
+    scanning the whole contract. It is None by default.
+
+    :param node:  Node of type Node, usually the last node in the task
+                  graph, or a ContractTemplate
+    :param executor: Optional thread or process pool executor.
+    :param lazy: True to evaluate the nodes only when they are read.
+    """
+    def __init__(self, node=None, executor=None, lazy=False):
         """
         Class initialization. In addition to store the graph and the
-        attributes, it also creates the evaluation graph and the list
-        of attributes that have been previously used for delayed evaluation.
+        attributes, it compiles the schedule and creates the arrays with
+        the evaluation state and the queue of nodes that are ready to be
+        evaluated.
         """
         self.graph = None
-        self.attrs = None
+        if isinstance(node, ContractTemplate):
+            self._setup(node.schedule, executor, lazy=lazy)
+            return
+
         if node:
             self.graph = node.graph
-            self.attrs = node.attrs
 
-        self.eval_graph = self._build_eval_graph(node.graph)
-        self.applied_attributes = []
+        self._setup(compile_graph(node.graph, node.attrs, node.name),
+                    executor, lazy=lazy)
+
+    def _setup(self, schedule, executor, values=None, state=None,
+               lazy=False):
+        """
+        Store the schedule and create the evaluation state, or take
+        the given one. *lazy* flags the nodes evaluated on demand, or
+        it is None if the contract is not lazy.
+        """
+        self.schedule = schedule
+        self.attrs = schedule.attrs
+        if values is None:
+            values = [None] * schedule.size
+        self.values = values
+        initial = schedule.state
+        self.lazy = None
+        if lazy:
+            self.lazy, initial = schedule.lazy_plan()
+        if state is None:
+            state = initial[:]
+        self.state = state
+        self.ready = deque()
+        self.arrivals = {}
+        self.taken = {}
+        self.retry = None
+        self.changes = None
+        self.executor = executor
+
+    @classmethod
+    def restore(cls, schedule, snapshot, executor=None):
+        """
+        Create a contract from a snapshot taken with :meth:`snapshot`.
+        No node is evaluated. The schedule can be compiled from the
+        graph again, or loaded with
+        :func:`smartc.contract.snapshot.load_schedule`.
+
+        :param schedule: Schedule of the contract
+        :param snapshot: Bytes returned by :meth:`snapshot`
+        :param executor: Optional thread or process pool executor.
+        """
+        fingerprint, values, packed, *extra = pickle.loads(snapshot)
+        if fingerprint != schedule.fingerprint():
+            raise ValueError(
+                'Snapshot does not match the schedule of the contract'
+            )
+
+        state = array('q')
+        state.frombytes(packed)
+        contract = cls.__new__(cls)
+        contract.graph = None
+        contract._setup(schedule, executor, values, state,
+                        lazy=bool(extra and extra[0]))
+        # Nodes whose evaluation failed are still queued
+        contract.ready.extend(i for i in range(schedule.size)
+                              if state[i] & QUEUED)
+        # And so are the nodes left by a recomputation that failed. A
+        # sorted list is a heap already.
+        if len(extra) > 1 and extra[1] is not None:
+            heap, inplace = extra[1]
+            contract.retry = heap, set(heap), set(inplace)
+        # The arguments that arrived at the gathers in delta mode. The
+        # ones taken by a call that failed were given back already.
+        if len(extra) > 2:
+            contract.arrivals = extra[2]
+
+        return contract
+
+    def snapshot(self):
+        """
+        Binary snapshot of the state of the contract: the values and the
+        evaluation state of every node, the arguments that arrived at
+        the gathers in delta mode, and the nodes left to recompute by a
+        set that failed. The structure of the graph is not
+        included, only a fingerprint of the schedule, so the snapshot
+        can be restored with :meth:`restore` on an equivalent schedule.
+        """
+        retry = None
+        if self.retry is not None:
+            # The nodes left to recompute by a propagation that failed
+            heap, marked, inplace = self.retry
+            retry = sorted(heap), sorted(inplace)
+
+        return pickle.dumps(
+            (self.schedule.fingerprint(), self.values, self.state.tobytes(),
+             self.lazy is not None, retry, self.arrivals),
+            protocol=pickle.HIGHEST_PROTOCOL)
+
+    def _stale(self, root):
+        """
+        Ids of the lazy nodes without a value that the node *root*
+        depends on, including the root, in topological order.
+        """
+        state = self.state
+        lazy = self.lazy
+        if not lazy[root] or state[root] & EVALUATED or \
+                state[root] >= FROZEN:
+            return []
+
+        seen = {root}
+        stack = [root]
+        while stack:
+            for j in self.schedule.args(stack.pop()):
+                if lazy[j] and not state[j] & EVALUATED and \
+                        state[j] < FROZEN and j not in seen:
+                    seen.add(j)
+                    stack.append(j)
+
+        return sorted(seen)
+
+    def _computable(self, i):
+        """
+        True if enough arguments of the node *i* have a value
+        """
+        state = self.state
+        available = 0
+        for j in self.schedule.args(i):
+            if state[j] & EVALUATED:
+                available += 1
+
+        return available >= self.schedule.needed[i]
+
+    def _pull_args(self, i):
+        """
+        Values of the arguments of a lazy node evaluated on demand. A
+        gather in delta mode is called with all the arguments that have
+        a value, since the arrivals are not recorded for lazy nodes.
+        """
+        if self.schedule.delta[i]:
+            state = self.state
+            self.arrivals[i] = [j for j in self.schedule.args(i)
+                                if state[j] & EVALUATED]
+
+        return self._eval_args(i)
+
+    def _settle(self, i, value):
+        """
+        Store the value of a lazy node evaluated on demand. Like in
+        _store, a gather is unlocked for good once its condition is met.
+        """
+        self.values[i] = value
+        if self.state[i] & LOCKED:
+            if value is None:
+                return
+
+            self.state[i] &= ~LOCKED
+            self.state[i] |= EVALUATED
+            if self.changes is not None:
+                self.changes.append(i)
+            if self.schedule.freeze[i]:
+                self._freeze(i)
+            return
+
+        self.state[i] |= EVALUATED
+        if self.changes is not None:
+            self.changes.append(i)
+
+    def _read(self, i):
+        """
+        Value of the node *i* in a lazy contract, or None if it can't be
+        evaluated yet.
+        """
+        return self.values[i] if self.state[i] & EVALUATED else None
+
+    def _node_id(self, name):
+        """
+        Id of a node or an attribute given its name or the Node
+        """
+        name = getattr(name, 'name', name)
+        i = self.schedule.index.get(name)
+        if i is None:
+            raise ValueError(
+                'Node {} not present in the graph'.format(name)
+            )
+
+        return i
+
+    def get(self, name):
+        """
+        Value of a node or an attribute, or None if it has not been
+        evaluated yet. In a lazy contract, the node is evaluated first if
+        it has no value, and so are the nodes it depends on. Lazy
+        contracts with asynchronous nodes must use :meth:`aget`.
+
+        :param name: Name of the node or the attribute, or the Node.
+        """
+        i = self._node_id(name)
+        if self.lazy is None:
+            return self.values[i]
+
+        stale = self._stale(i)
+        if stale and self.schedule.is_async:
+            raise ValueError(
+                'Contract has asynchronous nodes, use Contract.aget'
+            )
+
+        for j in stale:
+            if self._computable(j):
+                eval_args = self._pull_args(j)
+                if self.executor is not None:
+                    value = self._submit(j, eval_args).result()
+                else:
+                    value = self._call(j, eval_args)
+                self._settle(j, value)
+
+        return self._read(i)
+
+    async def aget(self, name):
+        """
+        Coroutine version of :meth:`get`.
+
+        :param name: Name of the node or the attribute, or the Node.
+        """
+        i = self._node_id(name)
+        if self.lazy is None:
+            return self.values[i]
+
+        for j in self._stale(i):
+            if self._computable(j):
+                self._settle(j, await self._acall(j, self._pull_args(j)))
+
+        return self._read(i)
 
     def visualize(self):
         """
@@ -294,101 +868,394 @@ class Contract:
         the node that was used to build the contract.
         """
         dot = Digraph(comment='Contract graph', format='png')
-        for k, v in self.graph.items():
-            if v.value is not None:
+        names = self.schedule.names
+        for i, k in enumerate(names):
+            if self.values[i] is not None:
                 dot.node(k, k, color='blue')
             else:
                 dot.node(k, k)
 
-        for k, v in self.graph.items():
-            if v.args is not None:
-                for arg in v.args:
-                    dot.edge(arg, k, v.method.__name__)
+        for i, k in enumerate(names):
+            for j in self.schedule.args(i):
+                dot.edge(names[j], k, self.schedule.methods[i].__name__)
 
         dot.render()
 
-    def _traverse(self, node):
-        """
-        Generator that traverses the graph fetching all the nodes.
-        """
-        for target in self.graph[node].to:
-            yield target
-            for subtarget in self.graph[target].to:
-                for t in self._traverse(subtarget):
-                    yield t
-
-    def _next_node_to_eval(self, attribute):
-        """
-        This function returns the next node that has to be evaluated
-        within the grap. When all the previous nodes have been evaluated,
-        it returns the node and resets the graph walk.
-        """
-        self.eval_graph[attribute]['eval'] = 1
-        for node in self._traverse(attribute):
-            # Check the number of previous evaluations
-            previous = self.graph[node].args
-            evals = sum([self.eval_graph[n]['eval'] for n in previous])
-            has_value = self.eval_graph[node]['eval']
-            locked = any([self.graph[a].lock for a in self.graph[node].args])
-            total = self.eval_graph[node]['total']
-            if evals >= total and not has_value and not locked:
-                return node
-
-    def _node_eval(self, attribute):
-        """
-        Starting from the given attribute, evaluate all the nodes that
-        can be evaluated (see _next_node_to_eval). 
-        """
-        for i in range(len(self.eval_graph) + 1):  # I know max evals
-            print('Graph walk', i+1)
-            key = self._next_node_to_eval(attribute)
-            if key:
-                args = self.graph[key].args
-                eval_args = [self.graph[a].value for a in args]
-                print('Eval {} in node {} with args {}'.format(
-                    self.graph[key].method.__name__,
-                    key,
-                    eval_args))
-                value = self.graph[key].method(*eval_args)
-                self.graph[key].value = value
-
-                # Unlock if condition for gather is met
-                if value is not None and self.graph[key].lock == True:
-                    print('Unlocking', key)
-                    self.graph[key].lock = False
-                
-                print('Set', key, 'with value', value)
-
-                self.eval_graph[key]['eval'] = 1
-            else:
-                break
+    def _release(self, i):
+        """
+        Mark the node *i* as evaluated and notify its successors. Every
+        successor whose pending counter drops to zero is pushed to the
+        ready queue. Locked nodes (gather) are pushed again each time
+        a new argument arrives, until their condition is met.
+        """
+        state = self.state
+        succ_idx = self.schedule.succ_idx
+
+        if self.schedule.notify[i]:
+            self._notify(i)
+        if self.changes is not None:
+            self.changes.append(i)
+
+        state[i] |= EVALUATED
+        for p in range(self.schedule.succ_ptr[i],
+                       self.schedule.succ_ptr[i+1]):
+            target = succ_idx[p]
+            # One less pending argument. The counter is zero or less
+            # when the packed state is smaller than one PENDING unit.
+            target_state = state[target] - PENDING
+            if target_state < PENDING and \
+                    not target_state & (EVALUATED | QUEUED):
+                target_state |= QUEUED
+                self.ready.append(target)
+            state[target] = target_state
+
+    def _notify(self, i):
+        """
+        Record that the node *i* arrived at the waiting gathers that are
+        called with the new arguments only.
+        """
+        state = self.state
+        delta = self.schedule.delta
+        lazy = self.lazy
+        for target in self.schedule.targets(i):
+            if delta[target] and state[target] & LOCKED and \
+                    (lazy is None or not lazy[target]):
+                self.arrivals.setdefault(target, []).append(i)
+
+    def _eval_args(self, i):
+        """
+        Values of the arguments of the node *i*, or of the arguments
+        that arrived since the last call for gathers in delta mode.
+        The arrivals taken are kept until the next call, in case the
+        evaluation fails.
+        """
+        values = self.values
+        if self.schedule.delta[i]:
+            taken = self.taken[i] = self.arrivals.pop(i, [])
+            return [values[j] for j in taken]
 
-    def set(self, attribute, value):
+        return [values[j] for j in self.schedule.args(i)]
+
+    def _requeue(self, failed):
         """
-        Set an attribute and trigger delayed evaluation of the task graph.
+        Push the nodes whose evaluation failed back to the front of the
+        ready queue, with the arrivals they took if they are gathers in
+        delta mode, so they are evaluated again by the next set.
+        """
+        for i in reversed(failed):
+            self.state[i] |= QUEUED
+            self.ready.appendleft(i)
+            self._untake(i)
 
-        :param attribute: Name of the attribute to be evaluated.
-        :param value: Value of the attribute with a correct type.
+    def _untake(self, i):
+        """
+        Give back the arrivals taken by the last call of the node *i*,
+        if it is a gather in delta mode.
+        """
+        if self.schedule.delta[i]:
+            self.arrivals[i] = self.taken.pop(i, []) + \
+                self.arrivals.get(i, [])
+
+    def _store(self, i, value):
+        """
+        Store the value of the node *i* once it is evaluated, and
+        release its successors.
+        """
+        self.values[i] = value
+
+        if self.state[i] & LOCKED:
+            # A gather does not release its successors until
+            # its condition is met. Then it is unlocked for good.
+            if value is None:
+                return
+
+            self.state[i] &= ~LOCKED
+            self._release(i)
+            if self.schedule.freeze[i]:
+                self._freeze(i)
+            return
+
+        self._release(i)
+
+    def _freeze(self, i):
+        """
+        Freeze the gather *i* once it fired, and the nodes upstream whose
+        successors are all frozen. Attributes can still be set, but
+        frozen nodes are never evaluated again.
+        """
+        state = self.state
+        schedule = self.schedule
+        flags = EVALUATED | LOCKED | QUEUED
+        state[i] = (state[i] & flags) + 2 * FROZEN
+        stack = [i]
+        while stack:
+            for j in schedule.args(stack.pop()):
+                if schedule.methods[j] is None or state[j] >= FROZEN:
+                    continue
+
+                if all(state[t] >= FROZEN for t in schedule.targets(j)):
+                    state[j] = (state[j] & flags) + 2 * FROZEN
+                    self.arrivals.pop(j, None)
+                    stack.append(j)
+
+    def _call(self, i, eval_args):
+        """
+        Call the function of the node *i*, or fetch the result from the
+        cache if the node is pure.
+        """
+        cache = self.schedule.caches[i]
+        if cache is None:
+            return self.schedule.methods[i](*eval_args)
+
+        return cache.call(self.schedule.methods[i], eval_args)
+
+    def _node_eval(self):
+        """
+        Evaluate all the nodes in the ready queue, and the ones that
+        become ready in the process, until the queue is empty. Nodes
+        frozen by a gather while they were queued are skipped. If a
+        node raises, it is queued again before the exception is
+        propagated.
+        """
+        if self.executor is not None:
+            return self._wave_eval()
+
+        if metrics.enabled:
+            return self._timed_node_eval()
+
+        ready = self.ready
+        state = self.state
+        while ready:
+            i = ready.popleft()
+            state[i] &= ~QUEUED
+            if state[i] >= FROZEN:
+                continue
+            try:
+                value = self._call(i, self._eval_args(i))
+            except BaseException:
+                self._requeue([i])
+                raise
+            self._store(i, value)
+
+    def _timed_node_eval(self):
+        """
+        Version of _node_eval that measures the evaluation time of each
+        node, and the number of nodes and the depth of the propagation.
+        The depth of a node is one more than the deepest of its
+        arguments evaluated in the same pass.
+        """
+        methods = self.schedule.methods
+        ready = self.ready
+        depth = {}
+
+        while ready:
+            i = ready.popleft()
+            self.state[i] &= ~QUEUED
+            if self.state[i] >= FROZEN:
+                continue
+            eval_args = self._eval_args(i)
+            start = perf_counter()
+            try:
+                value = self._call(i, eval_args)
+            except BaseException:
+                self._requeue([i])
+                raise
+            NODE_SECONDS.labels(methods[i].__name__).observe(
+                perf_counter() - start)
+            depth[i] = 1 + max([depth.get(j, 0)
+                                for j in self.schedule.args(i)], default=0)
+            self._store(i, value)
+
+        self._observe(len(depth), max(depth.values(), default=0))
+
+    @staticmethod
+    def _observe(evaluated, depth):
+        NODES_EVALUATED.observe(evaluated)
+        PROPAGATION_DEPTH.observe(depth)
+
+    def _submit(self, i, eval_args):
+        """
+        Submit the evaluation of the node *i* to the executor. Process
+        pools get a reference to the function instead of the function,
+        since the functions decorated with @node can't be pickled.
+        Conditions of gather nodes are cheap, and they are evaluated in
+        the calling thread.
+
+        Cached results of pure nodes are looked up before submitting,
+        and stored when the evaluation finishes.
+        """
+        method = self.schedule.methods[i]
+        cache = self.schedule.caches[i]
+        if cache is not None:
+            key = cache.key(method, eval_args)
+            value = cache.get(key)
+            if value is not MISSING:
+                future = Future()
+                future.set_result(value)
+                return future
+
+        if self.state[i] & LOCKED:
+            future = Future()
+            future.set_result(method(*eval_args))
+            return future
+
+        if isinstance(self.executor, ProcessPoolExecutor):
+            future = self.executor.submit(call_function,
+                                          function_reference(method),
+                                          eval_args)
+        else:
+            future = self.executor.submit(method, *eval_args)
+
+        if cache is not None:
+            def store(future):
+                if future.exception() is None:
+                    cache.put(key, future.result())
+
+            future.add_done_callback(store)
+
+        return future
+
+    def _wave(self):
+        """
+        Take the nodes in the ready queue that are not frozen
+        """
+        state = self.state
+        wave = []
+        for i in self.ready:
+            state[i] &= ~QUEUED
+            if state[i] < FROZEN:
+                wave.append(i)
+        self.ready.clear()
+
+        return wave
+
+    def _wave_eval(self):
+        """
+        Evaluate the ready queue in wavefronts. All the nodes that are
+        ready are submitted to the executor at once, and their
+        successors are released only after the whole wave is done. The
+        results of the nodes frozen by a gather of the same wave are
+        dropped.
+
+        If some nodes of a wave raise, the results of the rest are
+        stored, the failed nodes are queued again and the first
+        exception is propagated.
+        """
+        ready = self.ready
+        evaluated = waves = 0
+
+        while ready:
+            wave = self._wave()
+            futures = []
+            for i in wave:
+                try:
+                    futures.append(self._submit(i, self._eval_args(i)))
+                except BaseException as error:
+                    future = Future()
+                    future.set_exception(error)
+                    futures.append(future)
+            wait(futures)
+            self._finish(wave, [future.exception() or future.result()
+                                for future in futures])
+            evaluated += len(wave)
+            waves += 1
+
+        if metrics.enabled:
+            self._observe(evaluated, waves)
+
+    async def _acall(self, i, eval_args):
+        """
+        Evaluate the node *i* within the event loop. Coroutine functions
+        are awaited, and the rest are called directly or submitted to
+        the executor, if any.
+        """
+        method = self.schedule.methods[i]
+        if self.schedule.asynchronous[i]:
+            cache = self.schedule.caches[i]
+            if cache is None:
+                return await method(*eval_args)
+
+            key = cache.key(method, eval_args)
+            value = cache.get(key)
+            if value is MISSING:
+                value = await method(*eval_args)
+                cache.put(key, value)
+
+            return value
+
+        if self.executor is not None:
+            return await asyncio.wrap_future(self._submit(i, eval_args))
+
+        return self._call(i, eval_args)
+
+    def _finish(self, wave, results):
+        """
+        Store the results of a wave, where the nodes that raised have
+        the exception as a result. The failed nodes are queued again and
+        the first exception is raised once the rest are stored.
+        """
+        failed = []
+        for i, value in zip(wave, results):
+            if isinstance(value, BaseException):
+                failed.append(i)
+            elif self.state[i] < FROZEN:
+                self._store(i, value)
+
+        if failed:
+            self._requeue(failed)
+            raise results[wave.index(failed[0])]
+
+    async def _anode_eval(self):
+        """
+        Asynchronous version of _node_eval. All the nodes that are ready
+        are evaluated concurrently with asyncio.gather, and their
+        successors are released when the whole wave is done. Failures
+        are handled like in _wave_eval, and the whole wave is queued
+        again if the set is cancelled.
+        """
+        ready = self.ready
+        evaluated = waves = 0
+
+        while ready:
+            wave = self._wave()
+            coroutines = [self._acall(i, self._eval_args(i)) for i in wave]
+            try:
+                results = await asyncio.gather(*coroutines,
+                                               return_exceptions=True)
+            except BaseException:
+                self._requeue(wave)
+                raise
+            self._finish(wave, results)
+            evaluated += len(wave)
+            waves += 1
+
+        if metrics.enabled:
+            self._observe(evaluated, waves)
+
+    def _check(self, attribute, value):
+        """
+        Check that the attribute is in the contract, the type of the
+        value, and that it is mutable if it was already set. The value
+        of a multiple attribute is a sequence of items of its type.
+        Returns the id of the attribute.
         """
-        print('Set attribute', attribute)
         if attribute in self.attrs:
-            if type(value) == self.attrs[attribute].attr_type:                        
-                self.graph[attribute].value = value
-                print('Walk from', attribute)
-                
-                # Reset nodes with locks
-                for node in self.eval_graph:
-                    if self.graph[node].lock == True:
-                        self.eval_graph[node]['eval'] = 0
-                    
-                self._node_eval(attribute)
-                # Traverse from the other attributes in case there are
-                # additional paths
-                for other_attribute in self.applied_attributes:
-                    print('Walk from', other_attribute)
-                    self._node_eval(other_attribute)
-
-                self.applied_attributes.append(attribute)
+            attr = self.attrs[attribute]
+            if attr.multiple:
+                valid = isinstance(value, (list, tuple, array)) and all(
+                    type(item) is attr.attr_type for item in value)
+            else:
+                valid = type(value) is attr.attr_type
+
+            if valid:
+                i = self.schedule.index[attribute]
+                if self.state[i] & EVALUATED and \
+                        not self.schedule.mutable[i]:
+                    raise ValueError(
+                        'Attribute {} is already set and it is not '
+                        'mutable'.format(attribute)
+                    )
+                return i
 
             else:
                 raise ValueError(
@@ -402,18 +1269,442 @@ class Contract:
                     )
                 )
 
+    def _assign(self, attributes):
+        """
+        Check all the attributes given as a dictionary and then assign
+        them, so either all of them or none are assigned. Releases the
+        successors of the attributes that had no value yet, and returns
+        the ids of the mutable attributes whose value changed.
+        """
+        ids = [(self._check(k, v), v) for k, v in attributes.items()]
+        changed = []
+        for i, value in ids:
+            if self.schedule.multiple[i]:
+                value = self._buffer(i, value)
+            if self.state[i] & EVALUATED and \
+                    not self._unchanged(self.values[i], value):
+                changed.append(i)
+            self.values[i] = value
+
+        for i, value in ids:
+            if not self.state[i] & EVALUATED:
+                self._release(i)
+
+        if changed and self.changes is not None:
+            self.changes.extend(changed)
+        return changed
+
+    @staticmethod
+    def _unchanged(old, new):
+        """
+        True if a new value is equal to the previous one, so the nodes
+        downstream do not need to be recomputed. Values that can't be
+        compared to a single boolean, like NumPy arrays, always change.
+        """
+        if old is new:
+            return True
+
+        try:
+            return type(old) is type(new) and bool(old == new)
+        except (TypeError, ValueError):
+            return False
+
+    def _mark(self, i, heap, marked):
+        """
+        Push to the heap the successors of the node *i* that have to be
+        recomputed because its value changed: the evaluated nodes, and
+        the gathers whose condition was not met yet. Gathers that
+        already fired keep their value. Nodes that were not evaluated
+        will read the new value when they are, and so will the nodes
+        that are queued again because their evaluation failed.
+        """
+        state = self.state
+        lock = self.schedule.lock
+        delta = self.schedule.delta
+        for target in self.schedule.targets(i):
+            target_state = state[target]
+            if lock[target]:
+                # A waiting gather has seen enough arguments (no pending
+                # count). It is not pushed if it is already queued, but
+                # a gather in delta mode must see the new value anyway.
+                if not target_state & LOCKED or target_state >= PENDING:
+                    continue
+                if delta[target]:
+                    self.arrivals.setdefault(target, []).append(i)
+                if target_state & QUEUED:
+                    continue
+            elif not target_state & EVALUATED or target_state >= FROZEN:
+                continue
+
+            if target in marked:
+                continue
+
+            marked.add(target)
+            heappush(heap, target)
+
+    def _recompute(self, i, value, heap, marked, inplace):
+        """
+        Store the recomputed value of the node *i*. Returns True if the
+        propagation stops at the node because the value did not change
+        (early cutoff).
+
+        There is no cutoff if an argument in *inplace* was modified in
+        place, since the previous value may be the same object. If the
+        node returns that object again, it is added to *inplace* too.
+        """
+        if self.state[i] & LOCKED:
+            # The condition of a gather is checked again. If it is met,
+            # the gather releases its successors for the first time.
+            self._store(i, value)
+            return False
+
+        old = self.values[i]
+        if inplace and any(j in inplace for j in self.schedule.args(i)):
+            if value is old:
+                inplace.add(i)
+        elif self._unchanged(old, value):
+            return True
+
+        self.values[i] = value
+        if self.changes is not None:
+            self.changes.append(i)
+        self._mark(i, heap, marked)
+        return False
+
+    def _dirty(self, changed):
+        """
+        Heap and set of the nodes to recompute because the nodes in
+        *changed* changed.
+        """
+        heap = []
+        marked = set()
+        for i in changed:
+            self._mark(i, heap, marked)
+
+        return heap, marked
+
+    def _invalidate(self, i, heap, marked):
+        """
+        Drop the value of the lazy node *i*, that is evaluated again
+        when it is read, and the values of the nodes downstream.
+        """
+        self.state[i] &= ~EVALUATED
+        self._mark(i, heap, marked)
+
+    def _resume(self, heap, marked, inplace):
+        """
+        Add to the heap the nodes left to recompute by a propagation
+        that failed.
+        """
+        retry, self.retry = self.retry, None
+        if retry is None:
+            return
+
+        inplace.update(retry[2])
+        for i in retry[0]:
+            if i not in marked:
+                marked.add(i)
+                heappush(heap, i)
+
+    def _fail(self, i, heap, marked, inplace):
+        """
+        Keep the node *i*, whose recomputation raised, and the rest of
+        the heap, so the next set recomputes them.
+        """
+        heappush(heap, i)
+        self._untake(i)
+        self.retry = heap, marked, inplace
+
+    def _propagate(self, heap, marked, inplace=None):
+        """
+        Recompute the nodes in the heap, and the ones downstream whose
+        arguments change in the process. Since the ids of the nodes are
+        topological, popping them from a heap recomputes each node once,
+        after all its arguments. If a node raises, it is recomputed
+        again by the next set, along with the nodes left in the heap.
+
+        *inplace* is the set of the nodes whose value was modified in
+        place, see _recompute.
+        """
+        recomputed = cutoffs = 0
+        lazy = self.lazy
+        if inplace is None:
+            inplace = set()
+        self._resume(heap, marked, inplace)
+        while heap:
+            i = heappop(heap)
+            if self.state[i] >= FROZEN:
+                continue
+            if lazy is not None and lazy[i]:
+                self._invalidate(i, heap, marked)
+                continue
+
+            eval_args = self._eval_args(i)
+            try:
+                if self.executor is not None:
+                    value = self._submit(i, eval_args).result()
+                else:
+                    value = self._call(i, eval_args)
+            except BaseException:
+                self._fail(i, heap, marked, inplace)
+                raise
+            cutoffs += self._recompute(i, value, heap, marked, inplace)
+            recomputed += 1
+
+        if metrics.enabled:
+            RECOMPUTED.inc(recomputed)
+            CUTOFFS.inc(cutoffs)
+
+    async def _apropagate(self, heap, marked, inplace=None):
+        """
+        Asynchronous version of _propagate
+        """
+        recomputed = cutoffs = 0
+        lazy = self.lazy
+        if inplace is None:
+            inplace = set()
+        self._resume(heap, marked, inplace)
+        while heap:
+            i = heappop(heap)
+            if self.state[i] >= FROZEN:
+                continue
+            if lazy is not None and lazy[i]:
+                self._invalidate(i, heap, marked)
+                continue
+
+            try:
+                value = await self._acall(i, self._eval_args(i))
+            except BaseException:
+                self._fail(i, heap, marked, inplace)
+                raise
+            cutoffs += self._recompute(i, value, heap, marked, inplace)
+            recomputed += 1
+
+        if metrics.enabled:
+            RECOMPUTED.inc(recomputed)
+            CUTOFFS.inc(cutoffs)
+
+    def set(self, attribute, value):
+        """
+        Set an attribute and trigger delayed evaluation of the task graph.
+        Only the nodes downstream of the attribute are visited. Contracts
+        with nodes defined with ``async def`` must use :meth:`aset`.
+
+        An attribute can only be set again if it is mutable. Then the
+        nodes downstream that were evaluated are recomputed, in
+        topological order, and the propagation stops at the nodes whose
+        value does not change.
+
+        :param attribute: Name of the attribute to be evaluated.
+        :param value: Value of the attribute with a correct type.
+        """
+        self.set_many({attribute: value})
+
+    def set_many(self, attributes):
+        """
+        Set multiple attributes at once. All the values are checked
+        before any of them is assigned, and then the task graph is
+        evaluated in a single pass, so each reachable node is evaluated
+        once.
+
+        :param attributes: Dictionary with names of attributes as keys.
+        """
+        if self.schedule.is_async:
+            raise ValueError(
+                'Contract has asynchronous nodes, use Contract.aset'
+            )
+
+        start = perf_counter() if metrics.enabled else None
+        changed = self._assign(attributes)
+        if changed or self.retry is not None:
+            self._propagate(*self._dirty(changed))
+        self._node_eval()
+        if start is not None:
+            SETS.inc()
+            SET_SECONDS.observe(perf_counter() - start)
+
+    async def aset(self, attribute, value):
+        """
+        Coroutine that sets an attribute and evaluates the task graph
+        within the running event loop. Nodes defined with ``async def``
+        are awaited, and the ones that are independent run concurrently.
+
+        :param attribute: Name of the attribute to be evaluated.
+        :param value: Value of the attribute with a correct type.
+        """
+        await self.aset_many({attribute: value})
+
+    async def aset_many(self, attributes):
+        """
+        Coroutine version of :meth:`set_many`.
+
+        :param attributes: Dictionary with names of attributes as keys.
+        """
+        start = perf_counter() if metrics.enabled else None
+        changed = self._assign(attributes)
+        if changed or self.retry is not None:
+            await self._apropagate(*self._dirty(changed))
+        await self._anode_eval()
+        if start is not None:
+            SETS.inc()
+            SET_SECONDS.observe(perf_counter() - start)
+
     def run(self, **attributes):
         """
         Run a contract setting multiple attributes as keyword arguments.
+        It is equivalent to :meth:`set_many`.
+        """
+        self.set_many(attributes)
+
+    def _buffer(self, i, items=()):
         """
-        for k, v in attributes.items():
-            self.set(k, v)
+        New buffer with the items of the multiple attribute *i*. Items
+        of type int or float are stored in an array, and the rest in a
+        list.
+        """
+        attr_type = self.attrs[self.schedule.names[i]].attr_type
+        typecode = BUFFER_TYPECODES.get(attr_type)
+        if typecode is not None:
+            try:
+                return array(typecode, items)
+            except OverflowError:
+                pass
+
+        return list(items)
+
+    def _extend(self, attribute, items):
+        """
+        Append the items to the buffer of a multiple attribute, and
+        update the reducers that take it. Returns the heap and the set
+        of the nodes to recompute, and the set of the nodes modified in
+        place, or None if the attribute had no value yet, and its
+        successors are released instead.
+        """
+        attr = self.attrs.get(attribute)
+        if attr is None or not attr.multiple:
+            raise ValueError(
+                'Attribute {} not a multiple attribute of the graph'.format(
+                    attribute)
+            )
+
+        if any(type(item) is not attr.attr_type for item in items):
+            raise ValueError(
+                'Attribute {} not of type {}'.format(
+                    attribute, attr.attr_type)
+            )
+
+        i = self.schedule.index[attribute]
+        buffer = self.values[i]
+        if buffer is None:
+            buffer = self.values[i] = self._buffer(i)
+        size = len(buffer)
+        try:
+            buffer.extend(items)
+        except OverflowError:
+            self.values[i] = list(buffer[:size]) + items
+
+        if not self.state[i] & EVALUATED:
+            self._release(i)
+            return None
+
+        heap = []
+        marked = set()
+        if not items:
+            return heap, marked, set()
+
+        if self.changes is not None:
+            self.changes.append(i)
+
+        # The nodes that take the buffer may return it, and then their
+        # previous value is the same object.
+        inplace = {i}
+        changed = []
+        reducers = self.schedule.reducers
+        for target in self.schedule.targets(i):
+            reducer = reducers[target]
+            if reducer is None or not self.state[target] & EVALUATED \
+                    or self.state[target] >= FROZEN:
+                continue
+
+            marked.add(target)
+            old = value = self.values[target]
+            for item in items:
+                value = reducer.step(value, item)
+
+            # A reducer that modifies the value in place returns the
+            # same object, that can't be compared with the previous one.
+            if reducer.inplace or not self._unchanged(old, value):
+                self.values[target] = value
+                changed.append(target)
+                if value is old:
+                    inplace.add(target)
+
+        if self.changes is not None:
+            self.changes.extend(changed)
+
+        # The rest of the successors take the whole buffer, and they
+        # are recomputed.
+        self._mark(i, heap, marked)
+        for target in changed:
+            self._mark(target, heap, marked)
+
+        return heap, marked, inplace
 
     def append(self, attribute, value):
         """
-        Appends an item to a present multiple attribute.
+        Append an item to a multiple attribute and evaluate the task
+        graph. The nodes declared with a reducer that take the attribute
+        are updated with the item, and the other nodes downstream are
+        recomputed, with early cutoff, like after a set of a mutable
+        attribute.
+
+        :param attribute: Name of the multiple attribute.
+        :param value: Item with the type of the attribute.
+        """
+        self.extend(attribute, (value,))
+
+    def extend(self, attribute, values):
+        """
+        Append many items to a multiple attribute, and evaluate the task
+        graph once.
+
+        :param attribute: Name of the multiple attribute.
+        :param values: Iterable of items with the type of the attribute.
+        """
+        if self.schedule.is_async:
+            raise ValueError(
+                'Contract has asynchronous nodes, use Contract.aextend'
+            )
+
+        items = list(values)
+        dirty = self._extend(attribute, items)
+        if dirty is None and self.retry is not None:
+            dirty = [], set(), set()
+        if dirty is not None:
+            self._propagate(*dirty)
+        self._node_eval()
+        if metrics.enabled:
+            APPENDED.inc(len(items))
+
+    async def aappend(self, attribute, value):
+        """
+        Coroutine version of :meth:`append`.
+        """
+        await self.aextend(attribute, (value,))
+
+    async def aextend(self, attribute, values):
+        """
+        Coroutine version of :meth:`extend`.
         """
-        pass
+        items = list(values)
+        dirty = self._extend(attribute, items)
+        if dirty is None and self.retry is not None:
+            dirty = [], set(), set()
+        if dirty is not None:
+            await self._apropagate(*dirty)
+        await self._anode_eval()
+        if metrics.enabled:
+            APPENDED.inc(len(items))
 
 
 if __name__ == '__main__':
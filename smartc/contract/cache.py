@@ -0,0 +1,113 @@
+#   Smartc. Smart contracts for real time applications.
+#   Copyright (C) 2017 Guillem Borrell i Nogueras (@guillemborrell)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from collections import OrderedDict
+from threading import Lock
+
+MISSING = object()
+
+
+class NodeCache:
+    """
+    Bounded LRU cache of the results of pure nodes, keyed on the
+    function and the values of its arguments. A cache is stored with
+    the node when the graph is built, so it is shared by all the
+    contracts built from that graph. The same cache can also be given
+    to many nodes.
+
+    Calls with arguments that can't be hashed are evaluated, but not
+    cached. They are counted as misses.
+
+    :param maxsize: Maximum number of results stored. None for no limit.
+    """
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._results = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._results)
+
+    def __repr__(self):
+        return 'NodeCache(maxsize={}, size={}, hits={}, misses={})'.format(
+            self.maxsize, len(self._results), self.hits, self.misses)
+
+    @staticmethod
+    def key(function, args):
+        """
+        Key of a call, or None if the arguments can't be hashed. The
+        types of the arguments are part of the key, since values of
+        different types like 1, 1.0 and True are equal.
+        """
+        key = (function, tuple((type(arg), arg) for arg in args))
+        try:
+            hash(key)
+        except TypeError:
+            return None
+
+        return key
+
+    def get(self, key):
+        """
+        Cached result for the key, or MISSING. Updates the counters.
+        """
+        with self._lock:
+            if key is not None and key in self._results:
+                self._results.move_to_end(key)
+                self.hits += 1
+                return self._results[key]
+
+            self.misses += 1
+            return MISSING
+
+    def put(self, key, value):
+        """
+        Store a result, and drop the least recently used if the cache
+        is full.
+        """
+        if key is None:
+            return
+
+        with self._lock:
+            self._results[key] = value
+            self._results.move_to_end(key)
+            if self.maxsize is not None and \
+                    len(self._results) > self.maxsize:
+                self._results.popitem(last=False)
+
+    def call(self, function, args):
+        """
+        Call the function with the given arguments, unless the result
+        is already in the cache.
+        """
+        key = self.key(function, args)
+        value = self.get(key)
+        if value is MISSING:
+            value = function(*args)
+            self.put(key, value)
+
+        return value
+
+    def clear(self):
+        """
+        Drop all the results and reset the counters.
+        """
+        with self._lock:
+            self._results.clear()
+            self.hits = 0
+            self.misses = 0
@@ -0,0 +1,111 @@
+#   Smartc. Smart contracts for real time applications.
+#   Copyright (C) 2017 Guillem Borrell i Nogueras (@guillemborrell)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Incremental reducers of multiple attributes. A node whose only argument
+is a multiple attribute can declare a reducer with
+``@node(reducer=...)``. The function of the node computes its value
+from all the items of the attribute, and the reducer updates that value
+each time an item is appended with :meth:`Contract.append`, without
+calling the function again::
+
+    @node(reducer=Sum())
+    def total(prices):
+        return sum(prices)
+
+The function is still called the first time the node is evaluated, and
+when the whole attribute is set again, so both must agree.
+"""
+from collections import deque
+
+
+class Reducer:
+    """
+    Base class of the reducers. :meth:`step` returns the value of the
+    node after an item is appended, given its value before. It returns
+    a new object, and the previous value is compared with the new one
+    to stop the propagation when it does not change.
+
+    Reducers of containers that set *inplace* to True modify the value
+    in place and return it, so the update does not copy the container.
+    Then the value always counts as changed, and the nodes downstream
+    are recomputed with the same object.
+    """
+    inplace = False
+
+    def step(self, value, item):
+        raise NotImplementedError
+
+    def __repr__(self):
+        return '{}()'.format(type(self).__name__)
+
+
+class Sum(Reducer):
+    """
+    Sum of the items, for ``sum(items)``
+    """
+    def step(self, value, item):
+        return value + item
+
+
+class Count(Reducer):
+    """
+    Number of items, for ``len(items)``
+    """
+    def step(self, value, item):
+        return value + 1
+
+
+class LastN(Reducer):
+    """
+    Deque with the last *n* items, for ``deque(items, maxlen=n)``. The
+    deque is updated in place, in O(1) time per item.
+
+    :param n: Number of items kept
+    """
+    inplace = True
+
+    def __init__(self, n):
+        if n < 1:
+            raise ValueError('LastN needs at least one item')
+        self.n = n
+
+    def step(self, value, item):
+        if type(value) is not deque or value.maxlen != self.n:
+            value = deque(value, maxlen=self.n)
+        value.append(item)
+        return value
+
+    def __repr__(self):
+        return 'LastN({})'.format(self.n)
+
+
+class Fold(Reducer):
+    """
+    Any reduction given a function of the value and the new item, like
+    ``functools.reduce(function, items, initial)``
+
+    :param function: Function of the value and the item that returns
+                     the new value
+    """
+    def __init__(self, function):
+        self.function = function
+
+    def step(self, value, item):
+        return self.function(value, item)
+
+    def __repr__(self):
+        return 'Fold({})'.format(self.function.__name__)
@@ -0,0 +1,295 @@
+#   Smartc. Smart contracts for real time applications.
+#   Copyright (C) 2017 Guillem Borrell i Nogueras (@guillemborrell)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import hashlib
+from array import array
+from collections import deque
+from inspect import iscoroutinefunction
+
+# The evaluation state of a node in a contract is packed in an integer.
+# The three lowest bits are flags, and the rest is the number of
+# arguments that are still pending, that may become negative for
+# gather nodes. Adding or subtracting PENDING changes that number.
+EVALUATED = 1
+LOCKED = 2
+QUEUED = 4
+PENDING = 8
+# Nodes evaluated on demand in lazy contracts start with this many
+# pending arguments, so they are never released to the ready queue.
+DEFERRED = PENDING << 40
+# A gather that fired, and the nodes upstream only used by frozen nodes,
+# are frozen: they are never evaluated again. Their pending count is set
+# to twice FROZEN, so it stays above FROZEN whatever arguments arrive.
+FROZEN = PENDING << 50
+
+
+class Schedule:
+    """
+    Flat representation of a contract graph. Nodes are identified by
+    integers assigned in topological order, so that a node always has
+    a larger id than all its arguments. The edges are stored in
+    CSR (compressed sparse row) arrays: the predecessors of the node *i*
+    are ``pred_idx[pred_ptr[i]:pred_ptr[i+1]]``, and the same goes for
+    the successors with *succ_ptr* and *succ_idx*.
+
+    A schedule is built with :func:`compile_graph`, and it is never
+    modified afterwards.
+
+    :param names: Names of the nodes, in topological order
+    :param methods: Function of each node, None for attributes
+    :param pred_ptr: Offsets of the predecessors of each node
+    :param pred_idx: Predecessors of all the nodes
+    :param succ_ptr: Offsets of the successors of each node
+    :param succ_idx: Successors of all the nodes
+    :param needed: Number of evaluated predecessors to evaluate a node
+    :param lock: 1 if the node starts locked (gather), 0 otherwise
+    :param attrs: Dictionary with the attributes of the contract
+    :param vectorize: 1 if the function of the node is vectorized
+    :param caches: NodeCache of each pure node, None for the rest
+    :param reducers: Reducer of each node declared with
+                     ``@node(reducer=...)``, None for the rest
+    :param eager: 1 if the node is evaluated as soon as it can be in
+                  lazy contracts too, declared with ``@node(eager=True)``
+    :param delta: 1 if the node is a gather whose condition is called
+                  with the arguments that arrived since the last call
+    :param freeze: 1 if the node is a gather that freezes the nodes
+                   upstream once it fires
+
+    *state* holds the initial packed evaluation state of each node,
+    that contracts copy. The schedule also flags the nodes whose
+    function is a coroutine
+    function in *asynchronous*, and *is_async* is True if there is any,
+    the attributes that can be set again in *mutable*, the
+    attributes that take appended items in *multiple*, and the
+    arguments of the gathers flagged in *delta* in *notify*.
+    """
+    def __init__(self, names, methods, pred_ptr, pred_idx,
+                 succ_ptr, succ_idx, needed, lock, attrs, vectorize=None,
+                 caches=None, reducers=None, eager=None, delta=None,
+                 freeze=None):
+        self.names = names
+        self.index = {name: i for i, name in enumerate(names)}
+        self.methods = methods
+        self.pred_ptr = pred_ptr
+        self.pred_idx = pred_idx
+        self.succ_ptr = succ_ptr
+        self.succ_idx = succ_idx
+        self.needed = needed
+        self.lock = lock
+        self.attrs = attrs
+        self.size = len(names)
+        if vectorize is None:
+            vectorize = bytearray(self.size)
+        self.vectorize = vectorize
+        if caches is None:
+            caches = [None] * self.size
+        self.caches = caches
+        if reducers is None:
+            reducers = [None] * self.size
+        self.reducers = reducers
+        if eager is None:
+            eager = bytearray(self.size)
+        self.eager = eager
+        if delta is None:
+            delta = bytearray(self.size)
+        self.delta = delta
+        if freeze is None:
+            freeze = bytearray(self.size)
+        self.freeze = freeze
+        self.asynchronous = bytearray(
+            1 if iscoroutinefunction(m) else 0 for m in methods)
+        self.is_async = any(self.asynchronous)
+        self.mutable = bytearray(
+            1 if name in attrs and attrs[name].mutable else 0
+            for name in names)
+        self.multiple = bytearray(
+            1 if name in attrs and attrs[name].multiple else 0
+            for name in names)
+        self.notify = bytearray(self.size)
+        for i in range(self.size):
+            if delta[i]:
+                for j in self.args(i):
+                    self.notify[j] = 1
+        self.state = array('q', (
+            n * PENDING + (LOCKED if l else 0) for n, l in zip(needed, lock)))
+        self._fingerprint = None
+        self._lazy = None
+
+    def args(self, i):
+        """
+        Ids of the arguments of the node *i*
+        """
+        return self.pred_idx[self.pred_ptr[i]:self.pred_ptr[i+1]]
+
+    def targets(self, i):
+        """
+        Ids of the nodes that take the node *i* as argument
+        """
+        return self.succ_idx[self.succ_ptr[i]:self.succ_ptr[i+1]]
+
+    def fingerprint(self):
+        """
+        Digest of the structure of the schedule: the names of the nodes,
+        their functions and their edges. Two schedules with the same
+        fingerprint can share the state of their contracts.
+        """
+        if self._fingerprint is None:
+            digest = hashlib.sha1()
+            for name, method in zip(self.names, self.methods):
+                digest.update(name.encode())
+                if method is not None:
+                    digest.update('{}.{}'.format(
+                        method.__module__, method.__qualname__).encode())
+            for data in (self.pred_ptr, self.pred_idx, self.needed):
+                digest.update(data.tobytes())
+            digest.update(self.lock)
+            self._fingerprint = digest.hexdigest()
+
+        return self._fingerprint
+
+    def lazy_plan(self):
+        """
+        Nodes evaluated on demand by lazy contracts, flagged in a
+        bytearray, and the initial state of a lazy contract. The eager
+        nodes and all the nodes they depend on are evaluated as soon as
+        they can be, and the rest only when they are read.
+        """
+        if self._lazy is None:
+            lazy = bytearray(0 if m is None else 1 for m in self.methods)
+            stack = [i for i in range(self.size) if self.eager[i]]
+            for i in stack:
+                lazy[i] = 0
+            while stack:
+                for j in self.args(stack.pop()):
+                    if lazy[j]:
+                        lazy[j] = 0
+                        stack.append(j)
+
+            state = array('q', (s + DEFERRED if l else s
+                                for s, l in zip(self.state, lazy)))
+            self._lazy = (lazy, state)
+
+        return self._lazy
+
+    def __repr__(self):
+        return 'Schedule({} nodes, {} edges)'.format(
+            self.size, len(self.pred_idx))
+
+
+def _ancestors(graph, root):
+    """
+    Names of all the nodes the root depends on, including the root.
+    """
+    seen = {root}
+    stack = [root]
+    while stack:
+        key = stack.pop()
+        for arg in graph[key].args:
+            if arg not in seen:
+                seen.add(arg)
+                stack.append(arg)
+
+    return seen
+
+
+def compile_graph(graph, attrs, root=None):
+    """
+    Compile the graph built by the @node decorator into a
+    :class:`Schedule`. If *root* is given, only the nodes the root
+    depends on are compiled.
+
+    :param graph: Dictionary of GraphNode, like Node.graph
+    :param attrs: Dictionary of Attribute, like Node.attrs
+    :param root: Name of the last node of the contract
+    :raises ValueError: If the graph has a cycle or a missing argument
+    """
+    if root is None:
+        keys = set(graph)
+    else:
+        keys = _ancestors(graph, root)
+
+    # Kahn's algorithm. Iterating over the graph keeps the
+    # insertion order, so the schedule is deterministic.
+    keys = [k for k in graph if k in keys]
+    indegree = {}
+    successors = {k: [] for k in keys}
+    for k in keys:
+        args = graph[k].args
+        indegree[k] = len(args)
+        for arg in args:
+            if arg not in successors:
+                raise ValueError(
+                    'Node {} depends on {}, that is not in the graph'.format(
+                        k, arg)
+                )
+            successors[arg].append(k)
+
+    queue = deque(k for k in keys if indegree[k] == 0)
+    names = []
+    while queue:
+        key = queue.popleft()
+        names.append(key)
+        for target in successors[key]:
+            indegree[target] -= 1
+            if indegree[target] == 0:
+                queue.append(target)
+
+    if len(names) != len(keys):
+        cycle = sorted(k for k in keys if indegree[k] > 0)
+        raise ValueError(
+            'Contract graph has a cycle through nodes {}'.format(
+                ', '.join(cycle))
+        )
+
+    index = {name: i for i, name in enumerate(names)}
+    pred_ptr = array('l', [0])
+    pred_idx = array('l')
+    succ_ptr = array('l', [0])
+    succ_idx = array('l')
+    needed = array('l')
+    lock = bytearray(len(names))
+    vectorize = bytearray(len(names))
+    methods = []
+    caches = []
+    reducers = []
+    eager = bytearray(len(names))
+    delta = bytearray(len(names))
+    freeze = bytearray(len(names))
+
+    for i, name in enumerate(names):
+        graph_node = graph[name]
+        pred_idx.extend(index[arg] for arg in graph_node.args)
+        pred_ptr.append(len(pred_idx))
+        succ_idx.extend(index[target] for target in successors[name])
+        succ_ptr.append(len(succ_idx))
+        if graph_node.min_args is None:
+            needed.append(len(graph_node.args))
+        else:
+            needed.append(graph_node.min_args)
+        lock[i] = 1 if graph_node.lock else 0
+        vectorize[i] = 1 if graph_node.vectorize else 0
+        methods.append(graph_node.method)
+        caches.append(graph_node.cache)
+        reducers.append(graph_node.reducer)
+        eager[i] = 1 if graph_node.eager else 0
+        delta[i] = 1 if graph_node.delta else 0
+        freeze[i] = 1 if graph_node.freeze else 0
+
+    contract_attrs = {k: v for k, v in attrs.items() if k in index}
+
+    return Schedule(names, methods, pred_ptr, pred_idx,
+                    succ_ptr, succ_idx, needed, lock, contract_attrs,
+                    vectorize, caches, reducers, eager, delta, freeze)
@@ -0,0 +1,195 @@
+#   Smartc. Smart contracts for real time applications.
+#   Copyright (C) 2017 Guillem Borrell i Nogueras (@guillemborrell)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Persistence of contracts. The structure of a contract, its
+:class:`smartc.contract.schedule.Schedule`, is serialized once with
+functions and types referenced by their qualified names. The state of
+each contract is a separate blob, see :meth:`Contract.snapshot`.
+
+A snapshot file stores one schedule followed by the state of many
+contracts, and it is read through a memory map::
+
+    write_snapshots('contracts.snap', contracts)
+    contracts = list(load_snapshots('contracts.snap'))
+"""
+import mmap
+import pickle
+import struct
+from array import array
+
+from smartc.contract.builder import Attribute, Contract, Method, \
+    function_reference, resolve_reference, resolve_function
+from smartc.contract.cache import NodeCache
+from smartc.contract.schedule import Schedule
+
+MAGIC = b'SMARTC\x00\x01'
+LENGTH = struct.Struct('<Q')
+
+
+def _reference(f):
+    """
+    Reference to a function or a type, checking that it can be resolved.
+    """
+    reference = function_reference(f)
+    try:
+        resolved = resolve_function(reference)
+    except (ImportError, AttributeError):
+        resolved = None
+
+    if resolved is not f:
+        raise ValueError(
+            '{} can not be referenced by its qualified name'.format(f)
+        )
+
+    return reference
+
+
+def dump_schedule(schedule):
+    """
+    Serialize a schedule to bytes.
+    """
+    data = dict(
+        names=schedule.names,
+        methods=[None if m is None else _reference(m)
+                 for m in schedule.methods],
+        pure=[c is not None for c in schedule.caches],
+        typecode=schedule.pred_idx.typecode,
+        pred_ptr=schedule.pred_ptr.tobytes(),
+        pred_idx=schedule.pred_idx.tobytes(),
+        succ_ptr=schedule.succ_ptr.tobytes(),
+        succ_idx=schedule.succ_idx.tobytes(),
+        needed=schedule.needed.tobytes(),
+        lock=bytes(schedule.lock),
+        vectorize=bytes(schedule.vectorize),
+        eager=bytes(schedule.eager),
+        delta=bytes(schedule.delta),
+        freeze=bytes(schedule.freeze),
+        attrs=[(a.name, _reference(a.attr_type), a.mutable, a.multiple,
+                a.allowed) for a in schedule.attrs.values()],
+    )
+    return pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_schedule(data):
+    """
+    Load a schedule serialized with :func:`dump_schedule`. The modules
+    that define the functions of the nodes are imported.
+    """
+    data = pickle.loads(data)
+
+    def load_array(key):
+        result = array(data['typecode'])
+        result.frombytes(data[key])
+        return result
+
+    methods = []
+    caches = []
+    reducers = []
+    for reference, pure in zip(data['methods'], data['pure']):
+        if reference is None:
+            methods.append(None)
+            caches.append(None)
+            reducers.append(None)
+            continue
+
+        obj = resolve_reference(reference)
+        if isinstance(obj, Method):
+            # Pure nodes share the cache of the decorator, and reducers
+            # are declared by the decorator too.
+            methods.append(obj.function)
+            caches.append(obj.cache if pure else None)
+            reducers.append(obj.reducer)
+        else:
+            methods.append(obj)
+            caches.append(NodeCache() if pure else None)
+            reducers.append(None)
+
+    attrs = {}
+    for name, attr_type, mutable, multiple, allowed in data['attrs']:
+        attrs[name] = Attribute(name, resolve_function(attr_type),
+                                mutable=mutable, multiple=multiple,
+                                allowed=allowed)
+
+    return Schedule(data['names'], methods,
+                    load_array('pred_ptr'), load_array('pred_idx'),
+                    load_array('succ_ptr'), load_array('succ_idx'),
+                    load_array('needed'), bytearray(data['lock']), attrs,
+                    bytearray(data['vectorize']), caches, reducers,
+                    bytearray(data.get('eager', len(data['names']))),
+                    bytearray(data.get('delta', len(data['names']))),
+                    bytearray(data.get('freeze', len(data['names']))))
+
+
+def write_snapshots(path, contracts):
+    """
+    Write the snapshots of many contracts that share the same schedule
+    to a file. The schedule is written once.
+
+    :param path: Path of the file
+    :param contracts: Sequence of Contract
+    """
+    contracts = iter(contracts)
+    first = next(contracts, None)
+    if first is None:
+        raise ValueError('No contracts to write')
+
+    schedule = first.schedule
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        structure = dump_schedule(schedule)
+        f.write(LENGTH.pack(len(structure)))
+        f.write(structure)
+        for contract in [first] + list(contracts):
+            if contract.schedule.fingerprint() != schedule.fingerprint():
+                raise ValueError(
+                    'All the contracts in a file must share the schedule'
+                )
+            state = contract.snapshot()
+            f.write(LENGTH.pack(len(state)))
+            f.write(state)
+
+
+def load_snapshots(path, executor=None):
+    """
+    Generator that restores the contracts stored in a file written by
+    :func:`write_snapshots`. The file is memory mapped, and the schedule
+    is loaded once and shared by all the contracts.
+
+    :param path: Path of the file
+    :param executor: Optional executor for the restored contracts.
+    """
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            if buffer[:len(MAGIC)] != MAGIC:
+                raise ValueError('{} is not a snapshot file'.format(path))
+
+            view = memoryview(buffer)
+            try:
+                offset = len(MAGIC)
+                length, = LENGTH.unpack_from(buffer, offset)
+                offset += LENGTH.size
+                schedule = load_schedule(view[offset:offset + length])
+                offset += length
+
+                while offset < len(buffer):
+                    length, = LENGTH.unpack_from(buffer, offset)
+                    offset += LENGTH.size
+                    yield Contract.restore(
+                        schedule, view[offset:offset + length], executor)
+                    offset += length
+            finally:
+                view.release()
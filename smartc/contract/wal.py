@@ -0,0 +1,399 @@
+#   Smartc. Smart contracts for real time applications.
+#   Copyright (C) 2017 Guillem Borrell i Nogueras (@guillemborrell)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Write-ahead log of the changes to a set of contracts, identified by
+their ids. Each record is one of:
+
+* ``('create', contract_id, template)``
+* ``('set', contract_id, attributes)``
+* ``('delete', contract_id, None)``
+* ``('restore', contract_id, (template, snapshot))``
+
+A record is pickled and written after its length and its CRC32. The
+log is a directory of segments, ``wal-<n>.log``, and a segment is
+rotated when it is larger than *segment_size*.
+
+Records are appended to a buffer, and a thread writes the buffer and
+calls fsync once for all the records appended in the meantime (group
+commit). :meth:`WriteAheadLog.sync` waits until a record is durable::
+
+    wal = WriteAheadLog('data/wal')
+    wal.set(contract_id, {'a': 1.0})
+    wal.sync()
+
+A checkpoint, ``checkpoint-<n>.snap``, stores the snapshots of all the
+contracts, and replaces the segments before the segment *n*.
+"""
+import asyncio
+import os
+import pickle
+import re
+import struct
+import threading
+import time
+import zlib
+
+from smartc.contract.builder import Contract
+
+MAGIC = b'SMARTWAL'
+HEADER = struct.Struct('<II')
+SEGMENT = 'wal-{:08d}.log'
+CHECKPOINT = 'checkpoint-{:08d}.snap'
+FILENAME = re.compile(r'(wal|checkpoint)-(\d{8})\.(log|snap)$')
+
+
+def encode_record(record):
+    payload = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+    return HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def read_segment(path):
+    """
+    Generator of the records in a segment. It stops at the first
+    record that is incomplete or corrupt, that is the tail of a write
+    interrupted by a crash.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    if data[:len(MAGIC)] != MAGIC:
+        return
+
+    offset = len(MAGIC)
+    while offset + HEADER.size <= len(data):
+        length, crc = HEADER.unpack_from(data, offset)
+        offset += HEADER.size
+        payload = data[offset:offset + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            return
+
+        yield pickle.loads(payload)
+        offset += length
+
+
+class WriteAheadLog:
+    """
+    Write-ahead log with group commit. It always appends to a new
+    segment, so the segments written before can be recovered with
+    :meth:`recover`.
+
+    :param directory: Directory of the segments and the checkpoints
+    :param segment_size: Size of a segment before it is rotated, in bytes
+    :param window: Time to wait for more records before each write, in
+                   seconds. With 0, the records that arrive during a
+                   write are committed together in the next one.
+    :param checkpoint_segments: Number of segments written after a
+                                checkpoint when :meth:`should_checkpoint`
+                                is True.
+    """
+    def __init__(self, directory, segment_size=64 * 2 ** 20, window=0,
+                 checkpoint_segments=4):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segment_size = segment_size
+        self.window = window
+        self.checkpoint_segments = checkpoint_segments
+
+        files = self._files()
+        self.last_checkpoint = max(files['checkpoint'], default=0)
+        self.segment = max(files['wal'] + [self.last_checkpoint])
+        self.file = None
+        self._open(self.segment + 1)
+        self.first = self.segment
+
+        self.buffer = bytearray()
+        self.lsn = 0
+        self.durable = 0
+        self.closed = False
+        self.condition = threading.Condition()
+        self.io = threading.Lock()
+        self.thread = threading.Thread(target=self._commit_loop, daemon=True)
+        self.thread.start()
+
+    def _files(self):
+        files = {'wal': [], 'checkpoint': []}
+        for name in os.listdir(self.directory):
+            match = FILENAME.match(name)
+            if match:
+                files[match.group(1)].append(int(match.group(2)))
+
+        return files
+
+    def _path(self, template, number):
+        return os.path.join(self.directory, template.format(number))
+
+    def _sync_directory(self):
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _open(self, segment):
+        if self.file is not None:
+            self.file.close()
+
+        self.segment = segment
+        self.file = open(self._path(SEGMENT, segment), 'ab')
+        self.file.write(MAGIC)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self._sync_directory()
+
+    def _write(self, rotate=False):
+        """
+        Write and fsync the buffer, and rotate the segment if it is
+        too large or if *rotate* is True.
+        """
+        with self.io:
+            with self.condition:
+                data = bytes(self.buffer)
+                self.buffer.clear()
+                lsn = self.lsn
+
+            if data:
+                self.file.write(data)
+                self.file.flush()
+                os.fsync(self.file.fileno())
+
+            if rotate or self.file.tell() >= self.segment_size:
+                self._open(self.segment + 1)
+
+            with self.condition:
+                self.durable = max(self.durable, lsn)
+                self.condition.notify_all()
+
+    def _commit_loop(self):
+        while True:
+            with self.condition:
+                while not self.buffer and not self.closed:
+                    self.condition.wait()
+                if not self.buffer and self.closed:
+                    return
+
+            if self.window:
+                time.sleep(self.window)
+            self._write()
+
+    def append(self, *record):
+        """
+        Append a record to the log. Returns its sequence number, to
+        wait until it is durable with :meth:`sync`.
+        """
+        data = encode_record(record)
+        with self.condition:
+            if self.closed:
+                raise ValueError('The log is closed')
+
+            self.buffer += data
+            self.lsn += 1
+            self.condition.notify_all()
+            return self.lsn
+
+    def create(self, contract_id, template):
+        return self.append('create', contract_id, template)
+
+    def set(self, contract_id, attributes):
+        return self.append('set', contract_id, attributes)
+
+    def delete(self, contract_id):
+        return self.append('delete', contract_id, None)
+
+    def restore(self, contract_id, template, snapshot):
+        return self.append('restore', contract_id, (template, snapshot))
+
+    def sync(self, lsn=None):
+        """
+        Wait until a record, or all the records appended so far, are
+        written to disk.
+
+        :param lsn: Sequence number returned by :meth:`append`
+        """
+        with self.condition:
+            if lsn is None:
+                lsn = self.lsn
+            while self.durable < lsn:
+                self.condition.wait()
+
+    def rotate(self):
+        """
+        Write the pending records and start a new segment. Returns the
+        number of the new segment.
+        """
+        self._write(rotate=True)
+        return self.segment
+
+    def should_checkpoint(self):
+        return self.segment - self.last_checkpoint >= self.checkpoint_segments
+
+    def checkpoint(self, contracts):
+        """
+        Write a checkpoint with the snapshots of the contracts, and
+        remove the segments and the checkpoints that it replaces. The
+        contracts must include all the records appended before, so it
+        has to be called from the thread that applies them.
+
+        :param contracts: Dictionary with the ids of the contracts, and
+                          tuples with the name of the template and the
+                          contract.
+        """
+        segment = self.rotate()
+        snapshots = {contract_id: (template, contract.snapshot())
+                     for contract_id, (template, contract)
+                     in contracts.items()}
+
+        path = self._path(CHECKPOINT, segment)
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(snapshots, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+        self._sync_directory()
+        self.last_checkpoint = segment
+
+        files = self._files()
+        for number in files['wal']:
+            if number < segment:
+                os.remove(self._path(SEGMENT, number))
+        for number in files['checkpoint']:
+            if number < segment:
+                os.remove(self._path(CHECKPOINT, number))
+
+    def recover(self, create):
+        """
+        Rebuild the contracts from the last checkpoint and the segments
+        written before this log was opened. Consecutive sets of a
+        contract with different attributes are merged, and evaluated
+        with a single :meth:`Contract.set_many`. Sets that fail their
+        checks are skipped, since they failed when they were logged too.
+        Sets where a node raises are replayed and the error is ignored,
+        since their attributes were assigned anyway.
+
+        Returns a dictionary with the ids of the contracts, and tuples
+        with the name of the template and the contract.
+
+        :param create: Function that returns a new contract given the
+                       name of a template
+        """
+        contracts = {}
+        schedules = {}
+        gathers = {}
+        pending = {}
+
+        def schedule(template):
+            if template not in schedules:
+                schedules[template] = create(template).schedule
+            return schedules[template]
+
+        def restore(template, snapshot):
+            return Contract.restore(schedule(template), snapshot)
+
+        def mergeable(contract_id):
+            # Sets of contracts with gathers are not merged, since the
+            # condition of a gather is evaluated each time one of its
+            # arguments arrives.
+            entry = contracts.get(contract_id)
+            if entry is None:
+                return False
+
+            lock = entry[1].schedule.lock
+            if id(lock) not in gathers:
+                gathers[id(lock)] = not any(lock)
+            return gathers[id(lock)]
+
+        def flush(contract_id):
+            merged, batch = pending.pop(contract_id, (None, None))
+            if batch is None or contract_id not in contracts:
+                return
+
+            # If any of the merged sets fails its checks, none of them
+            # would be assigned, so they are replayed one by one.
+            contract = contracts[contract_id][1]
+            if len(batch) == 1 or _valid(contract, merged):
+                batch = [merged]
+            for attributes in batch:
+                try:
+                    _set_many(contract, attributes)
+                except Exception:
+                    pass
+
+        if self.last_checkpoint:
+            path = self._path(CHECKPOINT, self.last_checkpoint)
+            with open(path, 'rb') as f:
+                for contract_id, (template, snapshot) in \
+                        pickle.load(f).items():
+                    contracts[contract_id] = (
+                        template, restore(template, snapshot))
+
+        segments = sorted(n for n in self._files()['wal']
+                          if self.last_checkpoint <= n < self.first)
+        for number in segments:
+            for op, contract_id, arg in read_segment(
+                    self._path(SEGMENT, number)):
+                if op == 'set':
+                    if contract_id in pending:
+                        merged, batch = pending[contract_id]
+                        if not mergeable(contract_id) or \
+                                any(k in merged for k in arg):
+                            flush(contract_id)
+
+                    if contract_id not in pending:
+                        pending[contract_id] = ({}, [])
+                    merged, batch = pending[contract_id]
+                    merged.update(arg)
+                    batch.append(arg)
+                    continue
+
+                flush(contract_id)
+                if op == 'create':
+                    contracts[contract_id] = (arg, create(arg))
+                elif op == 'restore':
+                    contracts[contract_id] = (arg[0], restore(*arg))
+                elif op == 'delete':
+                    contracts.pop(contract_id, None)
+
+        for contract_id in list(pending):
+            flush(contract_id)
+
+        return contracts
+
+    def close(self):
+        """
+        Write the pending records and close the log
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join()
+        self.file.close()
+
+
+def _valid(contract, attributes):
+    try:
+        for attribute, value in attributes.items():
+            contract._check(attribute, value)
+    except ValueError:
+        return False
+
+    return True
+
+
+def _set_many(contract, attributes):
+    if contract.schedule.is_async:
+        asyncio.run(contract.aset_many(attributes))
+    else:
+        contract.set_many(attributes)
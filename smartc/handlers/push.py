@@ -14,38 +14,316 @@
 #   You should have received a copy of the GNU Affero General Public License
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from tornado import websocket
+import json
+import struct
+from time import perf_counter
+
+from tornado import ioloop, locks, websocket
 from zmq.eventloop import zmqstream
 import zmq
 
+from smartc.broker import BACKEND
+from smartc.handlers.queues import SendQueue, DROP_OLDEST
+from smartc.handlers.topics import TopicIndex
+from smartc.monitor import metrics
+
+
+clients = set()
+subscriber = None
+
+CLIENTS = metrics.gauge(
+    'smartc_push_clients', 'Websocket clients connected')
+SEND_SECONDS = metrics.histogram(
+    'smartc_push_send_seconds', 'Time to write a message to a websocket')
+QUEUE_DEPTH = metrics.histogram(
+    'smartc_push_queue_depth',
+    'Messages waiting for a client after a message is queued', lowest=1,
+    highest=2 ** 20)
+DROPPED = metrics.counter(
+    'smartc_push_dropped_total', 'Messages dropped for slow clients')
+RECEIVED = metrics.counter(
+    'smartc_zmq_messages_received_total',
+    'Messages received from the broker')
+
+# Each event in a coalesced frame is preceded by its length
+BATCH_LENGTH = struct.Struct('>I')
+
+
+def encode_batch(events):
+    """
+    Encode a list of events, as bytes, in a single frame.
+    """
+    return b''.join(BATCH_LENGTH.pack(len(event)) + event
+                    for event in events)
+
+
+def decode_batch(frame):
+    """
+    List of events encoded in a frame with :func:`encode_batch`
+    """
+    events = []
+    offset = 0
+    while offset < len(frame):
+        length, = BATCH_LENGTH.unpack_from(frame, offset)
+        offset += BATCH_LENGTH.size
+        events.append(frame[offset:offset + length])
+        offset += length
+
+    return events
+
+
+class Subscriber:
+    """
+    Single ZMQ subscriber of the process. Each message from the broker
+    is received once and pushed to the clients subscribed to its topic,
+    that are found with a :class:`smartc.handlers.topics.TopicIndex`.
+    The socket only subscribes to the prefixes that some client needs,
+    so the rest of the topics are filtered by ZMQ.
+
+    Messages for clients that coalesce are batched per topic during the
+    window of the client, and each batch is encoded once and shared by
+    all the clients subscribed to its topic.
+
+    :param address: Address of the backend of the broker
+    """
+    def __init__(self, address=BACKEND):
+        # Context.instance is created again in forked processes
+        self.socket = zmq.Context.instance().socket(zmq.SUB)
+        self.socket.connect(address)
+        self.index = TopicIndex()
+        self.filters = {}
+        self.batches = {}
+        self.stream = zmqstream.ZMQStream(self.socket)
+        self.stream.on_recv(self._fan_out)
+
+    def _add_filter(self, prefix):
+        if prefix not in self.filters:
+            self.socket.setsockopt_string(zmq.SUBSCRIBE, prefix)
+            self.filters[prefix] = 0
+        self.filters[prefix] += 1
+
+    def _remove_filter(self, prefix):
+        self.filters[prefix] -= 1
+        if not self.filters[prefix]:
+            self.socket.setsockopt_string(zmq.UNSUBSCRIBE, prefix)
+            del self.filters[prefix]
+
+    def subscribe(self, client, pattern):
+        """
+        Subscribe a client to a topic or a prefix ending in ``/*``
+        """
+        if self.index.add(client, pattern):
+            self._add_filter(TopicIndex.prefix(pattern))
+
+    def unsubscribe(self, client, pattern):
+        """
+        Unsubscribe a client from a topic or a prefix
+        """
+        if self.index.discard(client, pattern):
+            self._remove_filter(TopicIndex.prefix(pattern))
+
+    def remove(self, client):
+        """
+        Unsubscribe a client from everything
+        """
+        for pattern in self.index.remove(client):
+            self._remove_filter(TopicIndex.prefix(pattern))
+
+    def _fan_out(self, message):
+        if metrics.enabled:
+            RECEIVED.inc()
+
+        topic = message[0].decode()
+        coalesced = {}
+        for client in self.index.match(topic):
+            if client.coalesce is None:
+                client._push_message(message)
+            else:
+                coalesced.setdefault(client.coalesce, []).append(client)
+
+        for window, batch_clients in coalesced.items():
+            self._coalesce(window, message, batch_clients)
+
+    def _coalesce(self, window, message, batch_clients):
+        """
+        Add the events of a message to the batch of its topic, that is
+        flushed at the end of the window.
+        """
+        batches = self.batches.get(window)
+        if batches is None:
+            batches = self.batches[window] = {}
+            loop = ioloop.IOLoop.current()
+            if window:
+                loop.call_later(window, self._flush, window)
+            else:
+                loop.add_callback(self._flush, window)
 
-clients = []
-context = zmq.Context()
+        batch = batches.get(message[0])
+        if batch is None:
+            batch = batches[message[0]] = ([], set())
+
+        batch[0].extend(message[1:])
+        batch[1].update(batch_clients)
+
+    def _flush(self, window):
+        """
+        Encode the batches of a window and push them to their clients
+        """
+        for topic, (events, batch_clients) in \
+                self.batches.pop(window, {}).items():
+            message = [topic, encode_batch(events)]
+            for client in batch_clients:
+                if not client.closed:
+                    client._push_message(message)
+
+    def close(self):
+        """
+        Close the stream and the socket
+        """
+        self.stream.close(linger=0)
 
 
 class PushHandler(websocket.WebSocketHandler):
+    """
+    Websocket that pushes the messages of the broker. Clients are
+    subscribed to *default_topics* when they connect, and they manage
+    their subscriptions sending JSON messages like
+    ``{"subscribe": "contract/<id>/node/<name>"}`` or
+    ``{"unsubscribe": "contract/<id>/*"}``. Any other message is echoed.
+
+    Messages for each client wait in a bounded
+    :class:`smartc.handlers.queues.SendQueue`, and they are written one
+    after the other, waiting for each write to complete. The size of the
+    queue and the policy with slow clients are set in the URL spec, as
+    in ``(r'/push', PushHandler, dict(queue_size=100, policy='coalesce'))``.
+
+    With *coalesce*, the messages that arrive within a window of that
+    many seconds are sent in a single binary frame per topic, encoded
+    with :func:`encode_batch`. A window of 0 coalesces the messages
+    received in the same iteration of the IOLoop. With
+    *compression_level*, the frames are compressed with the
+    permessage-deflate extension if the client supports it.
+
+    :param queue_size: Maximum number of messages waiting for a client
+    :param policy: Policy of the queue with slow clients
+    :param coalesce: Window to coalesce messages in seconds, or None
+    :param compression_level: Level of compression from 0 to 9, or None
+                              not to compress
+    :param mem_level: Memory used by the compressor, from 1 to 9
+    """
+    default_topics = ('pub',)
+
+    def initialize(self, queue_size=1000, policy=DROP_OLDEST, coalesce=None,
+                   compression_level=None, mem_level=None):
+        self.queue = SendQueue(queue_size, policy)
+        self.wakeup = locks.Event()
+        self.closed = False
+        self.coalesce = coalesce
+        self.compression = None
+        if compression_level is not None:
+            self.compression = {'compression_level': compression_level}
+            if mem_level is not None:
+                self.compression['mem_level'] = mem_level
+
+    def get_compression_options(self):
+        return self.compression
+
     def check_origin(self, origin):
         print(origin)
         return True
 
     def _push_message(self, message):
-        self.write_message(message[1])
+        # The first frame is the topic, and each of the following is
+        # an event. See smartc.broker.Publisher
+        topic = message[0]
+        dropped = self.queue.dropped
+        for event in message[1:]:
+            if not self.queue.put(topic, event):
+                print('Disconnecting slow client', self)
+                self.close()
+                self._remove()
+                return
+
+        if metrics.enabled:
+            QUEUE_DEPTH.observe(len(self.queue))
+            DROPPED.inc(self.queue.dropped - dropped)
+
+        self.wakeup.set()
+
+    async def _drain(self):
+        """
+        Write the queued messages until the connection is closed
+        """
+        binary = self.coalesce is not None
+        while not self.closed:
+            while len(self.queue):
+                topic, event = self.queue.get()
+                start = perf_counter() if metrics.enabled else None
+                try:
+                    await self.write_message(event, binary=binary)
+                except websocket.WebSocketClosedError:
+                    self._remove()
+                    return
+
+                if start is not None:
+                    SEND_SECONDS.observe(perf_counter() - start)
+
+            self.wakeup.clear()
+            await self.wakeup.wait()
+
+    def _remove(self):
+        global subscriber
+        self.closed = True
+        self.queue.clear()
+        self.wakeup.set()
+        if self in clients:
+            print('Removed client', self)
+            clients.discard(self)
+            CLIENTS.dec()
+            subscriber.remove(self)
+
+        if not clients and subscriber is not None:
+            subscriber.close()
+            subscriber = None
 
     def open(self):
+        global subscriber
+        if subscriber is None:
+            subscriber = Subscriber()
+
         if self not in clients:
             print('Added client', self)
-            clients.append(self)
+            clients.add(self)
+            CLIENTS.inc()
+            for topic in self.default_topics:
+                subscriber.subscribe(self, topic)
 
-        socket = context.socket(zmq.SUB)
-        socket.connect("tcp://127.0.0.1:5555")
-        socket.setsockopt_string(zmq.SUBSCRIBE, "pub")
-        stream_sub = zmqstream.ZMQStream(socket)
-        stream_sub.on_recv(self._push_message)
+        ioloop.IOLoop.current().spawn_callback(self._drain)
 
     def on_message(self, message):
-        self.write_message(message)
+        try:
+            command = json.loads(message)
+        except ValueError:
+            command = None
+
+        if isinstance(command, dict) and \
+                ('subscribe' in command or 'unsubscribe' in command):
+            try:
+                for action in ('subscribe', 'unsubscribe'):
+                    if action not in command:
+                        continue
+
+                    pattern = command[action]
+                    if not isinstance(pattern, str):
+                        raise ValueError(
+                            'Topic {} is not a string'.format(
+                                json.dumps(pattern))
+                        )
+                    getattr(subscriber, action)(self, pattern)
+            except (ValueError, AttributeError) as error:
+                self.write_message(json.dumps({'error': str(error)}))
+        else:
+            self.write_message(message)
 
     def on_close(self):
-        if self in clients:
-            print('Removed client', self)
-            clients.remove(self)
+        self._remove()
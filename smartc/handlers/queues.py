@@ -0,0 +1,92 @@
+#   Smartc. Smart contracts for real time applications.
+#   Copyright (C) 2017 Guillem Borrell i Nogueras (@guillemborrell)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from collections import deque, OrderedDict
+
+DROP_OLDEST = 'drop-oldest'
+COALESCE = 'coalesce'
+DISCONNECT = 'disconnect'
+POLICIES = (DROP_OLDEST, COALESCE, DISCONNECT)
+
+
+class SendQueue:
+    """
+    Bounded queue of the messages waiting to be sent to a client. The
+    policy says what happens when a client does not keep up:
+
+    * ``drop-oldest``: When the queue is full, the oldest message is
+      dropped to make room for the new one.
+    * ``coalesce``: Only the latest message of each topic is kept, and
+      it takes the place of the previous one in the queue. When the
+      queue is full, the oldest topic is dropped.
+    * ``disconnect``: When the queue is full, the client has to be
+      disconnected.
+
+    :param maxsize: Maximum number of messages in the queue
+    :param policy: One of the policies above
+    """
+    def __init__(self, maxsize=1000, policy=DROP_OLDEST):
+        if policy not in POLICIES:
+            raise ValueError(
+                'Policy {} not one of {}'.format(policy, ', '.join(POLICIES))
+            )
+
+        self.maxsize = maxsize
+        self.policy = policy
+        self.dropped = 0
+        if policy == COALESCE:
+            self._messages = OrderedDict()
+        else:
+            self._messages = deque()
+
+    def __len__(self):
+        return len(self._messages)
+
+    def put(self, topic, message):
+        """
+        Queue a message. Returns False if the queue is full and the
+        policy is to disconnect the client.
+        """
+        messages = self._messages
+        if self.policy == COALESCE:
+            if topic in messages:
+                self.dropped += 1
+            elif len(messages) >= self.maxsize:
+                messages.popitem(last=False)
+                self.dropped += 1
+            messages[topic] = message
+            return True
+
+        if len(messages) >= self.maxsize:
+            if self.policy == DISCONNECT:
+                return False
+            messages.popleft()
+            self.dropped += 1
+
+        messages.append((topic, message))
+        return True
+
+    def get(self):
+        """
+        Oldest message in the queue, as a tuple (topic, message)
+        """
+        if self.policy == COALESCE:
+            return self._messages.popitem(last=False)
+
+        return self._messages.popleft()
+
+    def clear(self):
+        self._messages.clear()
@@ -14,9 +14,301 @@
 #   You should have received a copy of the GNU Affero General Public License
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from tornado import web
+"""
+REST API to drive contracts over HTTP. Contracts are created from
+templates registered with :func:`register_template`:
 
+* ``POST /contracts/<template>`` creates a contract, optionally setting
+  the attributes in a JSON object, and returns its id.
+* ``GET /contracts/<id>`` returns the values of the evaluated nodes.
+* ``DELETE /contracts/<id>`` removes the contract.
+* ``POST /contracts/<id>/attributes`` sets attributes. The body is a
+  JSON object, a JSON list of objects, or one object per line with
+  content type ``application/x-ndjson``. Each object is set at once
+  with :meth:`smartc.contract.builder.Contract.set_many`, in order.
+  NDJSON bodies are evaluated while they are streamed in.
+* ``GET /contracts/<id>/nodes/<name>`` returns the value of a node.
 
-class RestHandler(web.RequestHandler):
-    def get(self):
-        self.write("Hello, world!")
+Contracts with ``async def`` nodes are evaluated in the IOLoop, and
+the rest in a thread, so the server is never blocked by an evaluation.
+The sets of each contract are serialized, and the values are read
+between sets, so a GET never sees a set half propagated.
+"""
+import json
+from uuid import uuid4
+
+from tornado import ioloop, locks, web
+
+from smartc.contract.builder import Contract, ContractTemplate
+from smartc.contract.schedule import EVALUATED
+
+NDJSON = 'application/x-ndjson'
+
+templates = {}
+contracts = {}
+
+
+def register_template(name, node):
+    """
+    Register a task graph, so contracts can be created from it with
+    ``POST /contracts/<name>``. The graph is compiled once, and all the
+    contracts created from it share the compiled template.
+
+    :param name: Name of the template
+    :param node: Node of type Node, usually the last node in the task
+                 graph, or a ContractTemplate
+    """
+    if not isinstance(node, ContractTemplate):
+        node = ContractTemplate(node)
+    templates[name] = node
+
+
+class ContractEntry:
+    """
+    Contract served by the REST API, with the name of its template and
+    the lock that serializes its evaluations.
+    """
+    __slots__ = ('template', 'contract', 'lock')
+
+    def __init__(self, template, contract):
+        self.template = template
+        self.contract = contract
+        self.lock = locks.Lock()
+
+
+def _coerce(contract, attributes):
+    """
+    Check that the attributes are a JSON object, and convert the
+    integers given to float attributes.
+    """
+    if not isinstance(attributes, dict):
+        raise ValueError('Attributes must be a JSON object')
+
+    for name, value in attributes.items():
+        attribute = contract.attrs.get(name)
+        if attribute is not None and attribute.attr_type is float \
+                and type(value) is int:
+            attributes[name] = float(value)
+
+    return attributes
+
+
+def _set_all(contract, batch):
+    for sets, attributes in enumerate(batch):
+        try:
+            contract.set_many(_coerce(contract, attributes))
+        except ValueError as error:
+            return sets, str(error)
+
+    return len(batch), None
+
+
+async def _aset_all(contract, batch):
+    for sets, attributes in enumerate(batch):
+        try:
+            await contract.aset_many(_coerce(contract, attributes))
+        except ValueError as error:
+            return sets, str(error)
+
+    return len(batch), None
+
+
+async def evaluate(entry, batch):
+    """
+    Set each of the dictionaries of attributes in *batch*, in order,
+    without blocking the IOLoop. It stops at the first set that is not
+    valid, and returns the number of sets done and the error, or None.
+    """
+    contract = entry.contract
+    async with entry.lock:
+        if contract.schedule.is_async:
+            return await _aset_all(contract, batch)
+
+        return await ioloop.IOLoop.current().run_in_executor(
+            None, _set_all, contract, batch)
+
+
+class RestError(web.HTTPError):
+    """
+    HTTP error with a message for the client
+    """
+    def __init__(self, status_code, message):
+        super().__init__(status_code)
+        self.message = message
+
+
+class JSONHandler(web.RequestHandler):
+    """
+    Base handler that looks up the contracts and writes the errors
+    as JSON.
+    """
+    def _entry(self, contract_id):
+        entry = contracts.get(contract_id)
+        if entry is None:
+            raise RestError(404, 'Contract {} not found'.format(contract_id))
+
+        return entry
+
+    def write_error(self, status_code, **kwargs):
+        error = kwargs.get('exc_info', (None, None, None))[1]
+        self.finish({'error': getattr(error, 'message', self._reason)})
+
+
+class ContractsHandler(JSONHandler):
+    """
+    Creates contracts from templates
+    """
+    async def post(self, template):
+        compiled = templates.get(template)
+        if compiled is None:
+            raise RestError(404, 'Template {} not found'.format(template))
+
+        entry = ContractEntry(template, Contract(compiled))
+        if self.request.body:
+            try:
+                attributes = json.loads(self.request.body)
+            except ValueError as error:
+                raise RestError(400, str(error))
+
+            sets, error = await evaluate(entry, [attributes])
+            if error is not None:
+                raise RestError(400, error)
+
+        contract_id = uuid4().hex
+        contracts[contract_id] = entry
+
+        self.set_status(201)
+        self.write({'id': contract_id, 'template': template})
+
+
+class ContractHandler(JSONHandler):
+    """
+    Values of all the evaluated nodes of a contract
+    """
+    async def get(self, contract_id):
+        entry = self._entry(contract_id)
+        contract = entry.contract
+        async with entry.lock:
+            values = {
+                name: contract.values[i]
+                for i, name in enumerate(contract.schedule.names)
+                if contract.state[i] & EVALUATED
+            }
+        self.write(json.dumps(
+            {'id': contract_id, 'template': entry.template, 'values': values},
+            default=str))
+
+    def delete(self, contract_id):
+        self._entry(contract_id)
+        del contracts[contract_id]
+        self.set_status(204)
+
+
+class NodeHandler(JSONHandler):
+    """
+    Value of a node or an attribute of a contract. The value is null if
+    the node has not been evaluated yet.
+    """
+    async def get(self, contract_id, name):
+        entry = self._entry(contract_id)
+        if name not in entry.contract.schedule.index:
+            raise RestError(404, 'Node {} not found'.format(name))
+
+        async with entry.lock:
+            value = await entry.contract.aget(name)
+        self.write(json.dumps({'name': name, 'value': value}, default=str))
+
+
+@web.stream_request_body
+class AttributesHandler(JSONHandler):
+    """
+    Sets the attributes of a contract. NDJSON bodies are parsed and
+    evaluated chunk by chunk while they are received. Other bodies are
+    buffered and parsed as JSON at the end.
+    """
+    def prepare(self):
+        self.entry = self._entry(self.path_kwargs['contract_id'])
+        content_type = self.request.headers.get('Content-Type', '')
+        self.ndjson = content_type.startswith(NDJSON)
+        self.chunks = []
+        self.sets = 0
+        self.error = None
+
+    async def _evaluate(self, batch, error=None):
+        """
+        Evaluate a batch of sets, unless a previous set failed. *error*
+        is the error found parsing the sets that follow the batch.
+        """
+        if self.error is not None:
+            return
+
+        if batch:
+            sets, self.error = await evaluate(self.entry, batch)
+            self.sets += sets
+            if self.error is not None:
+                self.error = 'Set {}: {}'.format(self.sets + 1, self.error)
+                return
+
+        if error is not None:
+            self.error = 'Set {}: {}'.format(self.sets + 1, error)
+
+    @staticmethod
+    def _parse_lines(lines):
+        """
+        Parse the lines until the first that is not valid JSON. Returns
+        the parsed objects and the error, or None.
+        """
+        batch = []
+        for line in lines:
+            if line.strip():
+                try:
+                    batch.append(json.loads(line))
+                except ValueError as error:
+                    return batch, str(error)
+
+        return batch, None
+
+    async def data_received(self, chunk):
+        if not self.ndjson:
+            self.chunks.append(chunk)
+            return
+
+        lines = (b''.join(self.chunks) + chunk).split(b'\n')
+        self.chunks = [lines.pop()]
+        await self._evaluate(*self._parse_lines(lines))
+
+    async def post(self, contract_id):
+        body = b''.join(self.chunks)
+        if self.ndjson:
+            await self._evaluate(*self._parse_lines([body]))
+        else:
+            try:
+                batch = json.loads(body)
+            except ValueError as error:
+                raise RestError(400, str(error))
+
+            if not isinstance(batch, list):
+                batch = [batch]
+            await self._evaluate(batch)
+
+        if self.error is not None:
+            self.set_status(400)
+            self.write({'error': self.error, 'sets': self.sets})
+        else:
+            self.write({'sets': self.sets})
+
+
+def rest_urls(prefix=''):
+    """
+    URL specs of the REST API, to be added to a
+    :class:`tornado.web.Application`.
+
+    :param prefix: Prefix of all the URLs
+    """
+    contract = prefix + r'/contracts/(?P<contract_id>[0-9a-f]{32})'
+    return [
+        (contract + r'/attributes', AttributesHandler),
+        (contract + r'/nodes/(?P<name>[^/]+)', NodeHandler),
+        (contract, ContractHandler),
+        (prefix + r'/contracts/(?P<template>[^/]+)', ContractsHandler),
+    ]
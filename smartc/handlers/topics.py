@@ -0,0 +1,146 @@
+#   Smartc. Smart contracts for real time applications.
+#   Copyright (C) 2017 Guillem Borrell i Nogueras (@guillemborrell)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+WILDCARD = '*'
+SEPARATOR = '/'
+
+
+class TopicNode:
+    """
+    Node of the topic trie. It stores the clients subscribed to the
+    topic that ends in this node, and the ones subscribed to every
+    topic below it.
+    """
+    __slots__ = ('children', 'exact', 'below')
+
+    def __init__(self):
+        self.children = {}
+        self.exact = set()
+        self.below = set()
+
+    def empty(self):
+        return not (self.children or self.exact or self.below)
+
+
+class TopicIndex:
+    """
+    Prefix trie of subscriptions. Topics are split in segments by
+    slashes, like ``contract/<id>/node/<name>``. A pattern is either a
+    topic, or a prefix that ends with a wildcard segment, like
+    ``contract/<id>/*``, that matches all the topics below the prefix.
+    Matching a topic costs the number of its segments plus the number
+    of subscribers found.
+    """
+    def __init__(self):
+        self.root = TopicNode()
+        self.patterns = {}
+
+    @staticmethod
+    def split(pattern):
+        """
+        Segments of a pattern, and True if it ends with a wildcard.
+        """
+        segments = pattern.split(SEPARATOR) if pattern else []
+        if segments and segments[-1] == WILDCARD:
+            return segments[:-1], True
+
+        if WILDCARD in segments:
+            raise ValueError(
+                'Wildcards are only allowed at the end of {}'.format(pattern)
+            )
+
+        return segments, False
+
+    @staticmethod
+    def prefix(pattern):
+        """
+        Prefix that the broker must match to deliver the topics of the
+        pattern.
+        """
+        segments, wildcard = TopicIndex.split(pattern)
+        if wildcard:
+            return ''.join(s + SEPARATOR for s in segments)
+
+        return pattern
+
+    def add(self, client, pattern):
+        """
+        Subscribe a client to a pattern. Returns True if it is a new
+        pattern in the index.
+        """
+        segments, wildcard = self.split(pattern)
+        node = self.root
+        for segment in segments:
+            node = node.children.setdefault(segment, TopicNode())
+
+        (node.below if wildcard else node.exact).add(client)
+        self.patterns.setdefault(client, set()).add(pattern)
+        return len(node.below if wildcard else node.exact) == 1
+
+    def discard(self, client, pattern):
+        """
+        Unsubscribe a client from a pattern. Returns True if nobody else
+        is subscribed to the pattern.
+        """
+        segments, wildcard = self.split(pattern)
+        path = [self.root]
+        for segment in segments:
+            node = path[-1].children.get(segment)
+            if node is None:
+                return False
+            path.append(node)
+
+        node = path[-1]
+        subscribers = node.below if wildcard else node.exact
+        if client not in subscribers:
+            return False
+
+        subscribers.discard(client)
+        self.patterns[client].discard(pattern)
+        if not self.patterns[client]:
+            del self.patterns[client]
+
+        # Prune the branches that are left empty
+        for segment, parent in zip(reversed(segments), reversed(path[:-1])):
+            if not parent.children[segment].empty():
+                break
+            del parent.children[segment]
+
+        return not subscribers
+
+    def remove(self, client):
+        """
+        Unsubscribe a client from all its patterns. Returns the patterns
+        that have no subscribers left.
+        """
+        return [pattern for pattern in list(self.patterns.get(client, ()))
+                if self.discard(client, pattern)]
+
+    def match(self, topic):
+        """
+        Set of clients subscribed to the topic.
+        """
+        node = self.root
+        result = set()
+        for segment in topic.split(SEPARATOR):
+            # A wildcard matches the topics strictly below its prefix
+            result.update(node.below)
+            node = node.children.get(segment)
+            if node is None:
+                return result
+
+        result.update(node.exact)
+        return result
@@ -0,0 +1,664 @@
+#   Smartc. Smart contracts for real time applications.
+#   Copyright (C) 2017 Guillem Borrell i Nogueras (@guillemborrell)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Registry of live contracts sharded across worker processes. The ids of
+the contracts are placed on a consistent :class:`HashRing` of workers,
+and each worker owns the contracts of its shard, so a contract is only
+evaluated by one process and no locking is needed.
+
+The :class:`ContractManager` binds a ROUTER socket and each worker
+connects a DEALER socket, identified by the name of the worker. The
+commands are pickled tuples, and the values of the nodes changed by
+each command are published through the broker in the topics
+``contract/<id>/node/<name>``.
+
+When a worker is added, only the contracts that the ring assigns to
+the new worker are moved to it, as snapshots. A contract is removed
+from its old worker only after the new one has loaded it, so if a move
+fails, the contract stays where it was and the commands keep going
+there. Templates, a dictionary of names and nodes, must be built before
+the workers are started.
+
+With a directory for the write-ahead logs, each worker logs the
+changes to its contracts in a :class:`smartc.contract.wal.WriteAheadLog`
+and replies to a batch of commands after a single fsync. The values of
+the nodes are published after the fsync too, so subscribers never see
+the result of a set that is lost in a crash. A moved contract is
+logged by the new worker before it is deleted from the log of the old
+one, so a crash in between leaves it in both logs, and never in none.
+A worker recovers its contracts when it is started again, so after a
+restart the manager has to start at least as many workers as before.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import pickle
+from bisect import bisect, insort
+from itertools import count
+from multiprocessing import Process
+from uuid import uuid4
+
+import zmq
+import zmq.asyncio
+
+from smartc.broker import FRONTEND, Publisher
+from smartc.contract.builder import ContractTemplate
+from smartc.contract.wal import WriteAheadLog
+
+MANAGER = 'tcp://127.0.0.1:5557'
+READY = b'ready'
+
+
+class HashRing:
+    """
+    Consistent hash ring. Each worker is placed in the ring *replicas*
+    times, and a key is owned by the first worker found clockwise from
+    the hash of the key. Adding or removing a worker only moves the keys
+    of that worker.
+
+    :param replicas: Number of points of each worker in the ring
+    """
+    def __init__(self, replicas=64):
+        self.replicas = replicas
+        self.points = []
+        self.owners = {}
+        self.workers = set()
+
+    @staticmethod
+    def hash(key):
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+    def __len__(self):
+        return len(self.workers)
+
+    def __contains__(self, worker):
+        return worker in self.workers
+
+    def add(self, worker):
+        self.workers.add(worker)
+        for replica in range(self.replicas):
+            point = self.hash('{}#{}'.format(worker, replica))
+            insort(self.points, point)
+            self.owners[point] = worker
+
+    def remove(self, worker):
+        self.workers.remove(worker)
+        for replica in range(self.replicas):
+            point = self.hash('{}#{}'.format(worker, replica))
+            self.points.remove(point)
+            del self.owners[point]
+
+    def owner(self, key):
+        """
+        Worker that owns the key
+        """
+        if not self.points:
+            raise ValueError('The hash ring has no workers')
+
+        i = bisect(self.points, self.hash(key)) % len(self.points)
+        return self.owners[self.points[i]]
+
+
+class Shard:
+    """
+    Contracts owned by a worker. Each template is compiled once into a
+    :class:`smartc.contract.builder.ContractTemplate`, and the contracts
+    created or restored from it share its schedule.
+
+    :param templates: Dictionary with names of templates and nodes, or
+                      ContractTemplates
+    :param publisher: Optional :class:`smartc.broker.Publisher` for the
+                      values of the evaluated nodes, that are sent by
+                      :meth:`publish`
+    :param wal: Optional :class:`smartc.contract.wal.WriteAheadLog`
+                where the changes are logged before they are applied
+    """
+    def __init__(self, templates, publisher=None, wal=None):
+        self.templates = templates
+        self.publisher = publisher
+        self.wal = wal
+        self.contracts = {}
+        self.compiled = {}
+        self.published = []
+
+    def _template(self, template):
+        compiled = self.compiled.get(template)
+        if compiled is None:
+            if template not in self.templates:
+                raise ValueError('Template {} not found'.format(template))
+
+            compiled = self.templates[template]
+            if not isinstance(compiled, ContractTemplate):
+                compiled = ContractTemplate(compiled)
+            self.compiled[template] = compiled
+
+        return compiled
+
+    def _new(self, template):
+        return self._template(template).instantiate()
+
+    def recover(self):
+        """
+        Recover the contracts from the log. Returns a list of tuples
+        with the ids of the contracts and their templates.
+        """
+        self.contracts = self.wal.recover(self._new)
+        return [(contract_id, template) for contract_id, (template, contract)
+                in self.contracts.items()]
+
+    def _contract(self, contract_id):
+        try:
+            return self.contracts[contract_id][1]
+        except KeyError:
+            raise ValueError('Contract {} not found'.format(contract_id))
+
+    def _set(self, contract_id, contract, attributes):
+        """
+        Set the attributes and queue for :meth:`publish` the values of
+        the nodes and the attributes that changed
+        """
+        if self.publisher is not None:
+            contract.changes = []
+        try:
+            if contract.schedule.is_async:
+                asyncio.run(contract.aset_many(attributes))
+            else:
+                contract.set_many(attributes)
+        finally:
+            changes, contract.changes = contract.changes, None
+
+        if not changes:
+            return
+
+        names = contract.schedule.names
+        for i in dict.fromkeys(changes):
+            self.published.append((
+                'contract/{}/node/{}'.format(contract_id, names[i]),
+                json.dumps(contract.values[i], default=str).encode()))
+
+    def publish(self):
+        """
+        Publish the values of the nodes evaluated since the last call.
+        With a log, it must be called once the sets are durable.
+        """
+        if self.publisher is None:
+            return
+
+        for topic, event in self.published:
+            self.publisher.publish(topic, event)
+        self.published.clear()
+        self.publisher.flush()
+
+    def create(self, contract_id, template, attributes=None):
+        self._template(template)
+        if self.wal is not None:
+            self.wal.create(contract_id, template)
+        contract = self._new(template)
+        self.contracts[contract_id] = (template, contract)
+        if attributes:
+            try:
+                self.set(contract_id, attributes)
+            except Exception:
+                self.delete(contract_id)
+                raise
+
+    def set(self, contract_id, attributes):
+        contract = self._contract(contract_id)
+        if self.wal is not None:
+            self.wal.set(contract_id, attributes)
+        self._set(contract_id, contract, attributes)
+
+    def get(self, contract_id, name):
+        return self._contract(contract_id).get(name)
+
+    def delete(self, contract_id):
+        self._contract(contract_id)
+        if self.wal is not None:
+            self.wal.delete(contract_id)
+        del self.contracts[contract_id]
+
+    def export(self, contract_ids):
+        """
+        Templates and snapshots of the contracts. The contracts stay in
+        the shard until they are removed with :meth:`discard`.
+        """
+        exported = []
+        for contract_id in contract_ids:
+            template, contract = self.contracts[contract_id]
+            exported.append((contract_id, template, contract.snapshot()))
+
+        return exported
+
+    def load(self, exported):
+        """
+        Restore the contracts returned by :meth:`export`. Either all of
+        them are restored, or none if any snapshot is not valid.
+        """
+        restored = [(contract_id, template,
+                     self._template(template).restore(snapshot), snapshot)
+                    for contract_id, template, snapshot in exported]
+        for contract_id, template, contract, snapshot in restored:
+            if self.wal is not None:
+                self.wal.restore(contract_id, template, snapshot)
+            self.contracts[contract_id] = (template, contract)
+
+    def discard(self, contract_ids):
+        """
+        Remove the contracts exported to another shard
+        """
+        for contract_id in contract_ids:
+            self.delete(contract_id)
+
+    def handle(self, command):
+        """
+        Run a command, a tuple with the name of a method and its
+        arguments. Returns a tuple with ``'ok'`` and the result, or
+        ``'error'`` and the message of the error. Errors other than
+        ValueError, raised by the functions of the nodes, are reported
+        with the name of the exception.
+        """
+        name, args = command[0], command[1:]
+        if name not in ('create', 'set', 'get', 'delete', 'export', 'load',
+                        'discard'):
+            return 'error', 'Unknown command {}'.format(name)
+
+        try:
+            return 'ok', getattr(self, name)(*args)
+        except ValueError as error:
+            return 'error', str(error)
+        except Exception as error:
+            return 'error', '{}: {}'.format(type(error).__name__, error)
+
+
+def run_worker(identity, templates, address=MANAGER,
+               publisher_address=FRONTEND, wal_directory=None):
+    """
+    Run a worker that owns a shard of the contracts. It blocks until
+    the manager sends the ``stop`` command.
+
+    The worker runs all the commands that are waiting, and then it
+    replies to all of them, so with a log there is a single fsync for
+    each batch of commands. The values of the nodes evaluated by the
+    batch are published after the fsync.
+
+    :param identity: Name of the worker, as bytes
+    :param templates: Dictionary with names of templates and nodes, or
+                      ContractTemplates
+    :param address: Address of the manager
+    :param publisher_address: Address of the frontend of the broker
+    :param wal_directory: Optional directory of the log of the worker
+    """
+    context = zmq.Context.instance()
+    socket = context.socket(zmq.DEALER)
+    socket.setsockopt(zmq.IDENTITY, identity)
+    socket.connect(address)
+    publisher = Publisher(publisher_address)
+    wal = None
+    recovered = []
+    if wal_directory is not None:
+        wal = WriteAheadLog(wal_directory)
+    shard = Shard(templates, publisher, wal)
+    if wal is not None:
+        recovered = shard.recover()
+
+    socket.send_multipart([READY, pickle.dumps(recovered)])
+    running = True
+    while running:
+        replies = []
+        while running and (not replies or socket.poll(0)):
+            request_id, payload = socket.recv_multipart()
+            command = pickle.loads(payload)
+            if command[0] == 'stop':
+                replies.append([request_id, pickle.dumps(('ok', None))])
+                running = False
+                break
+
+            replies.append([
+                request_id,
+                pickle.dumps(shard.handle(command),
+                             protocol=pickle.HIGHEST_PROTOCOL)
+            ])
+
+        if wal is not None:
+            wal.sync()
+            if wal.should_checkpoint():
+                wal.checkpoint(shard.contracts)
+
+        shard.publish()
+        for reply in replies:
+            socket.send_multipart(reply)
+
+    if wal is not None:
+        wal.close()
+
+    # The process exits without waiting for the sockets otherwise
+    publisher.close(linger=1000)
+    socket.close(linger=1000)
+    context.term()
+
+
+class ContractManager:
+    """
+    Creates contracts and routes the commands to the worker that owns
+    each contract. All the methods are coroutines, and many commands
+    can be in flight at the same time. The commands of each contract
+    are run in order by its worker.
+
+    :param templates: Dictionary with names of templates and nodes, or
+                      ContractTemplates
+    :param address: Address where the workers connect
+    :param publisher_address: Address of the frontend of the broker
+    :param replicas: Number of points of each worker in the hash ring
+    :param wal_directory: Optional directory for the logs of the workers
+    :param interval: Seconds between the checks that a worker is alive
+                     while a command waits for its reply
+
+    A command sent to a worker that dies raises RuntimeError.
+    """
+    def __init__(self, templates, address=MANAGER,
+                 publisher_address=FRONTEND, replicas=64,
+                 wal_directory=None, interval=1.0):
+        self.templates = templates
+        self.address = address
+        self.publisher_address = publisher_address
+        self.wal_directory = wal_directory
+        self.interval = interval
+        self.ring = HashRing(replicas)
+        self.workers = {}
+        self.contracts = {}
+        self.pinned = {}
+        self.moving = {}
+        self.requests = {}
+        self.ready = {}
+        self.context = zmq.asyncio.Context()
+        self.socket = self.context.socket(zmq.ROUTER)
+        self.socket.bind(address)
+        self._request_ids = count()
+        self._worker_ids = count()
+        self._receiver = None
+
+    async def _receive(self):
+        while True:
+            identity, request_id, payload = await self.socket.recv_multipart()
+            if request_id == READY:
+                ready = self.ready.pop(identity, None)
+                if ready is not None and not ready.done():
+                    ready.set_result(pickle.loads(payload))
+                continue
+
+            future = self.requests.pop(int(request_id), None)
+            if future is not None and not future.done():
+                future.set_result(pickle.loads(payload))
+
+    async def _wait(self, future, identity, process):
+        """
+        Wait for a reply of a worker, and raise RuntimeError if its
+        process exits before it replies.
+        """
+        exited = False
+        while not future.done():
+            if exited:
+                raise RuntimeError(
+                    'Worker {} exited with code {}'.format(
+                        identity.decode(), process.exitcode)
+                )
+
+            # A reply sent just before the worker exited is waited for
+            # one more interval.
+            exited = not process.is_alive()
+            await asyncio.wait([future], timeout=self.interval)
+
+        return future.result()
+
+    async def _request(self, identity, *command):
+        """
+        Send a command to a worker and wait for the result
+        """
+        request_id = next(self._request_ids)
+        future = asyncio.get_running_loop().create_future()
+        self.requests[request_id] = future
+        await self.socket.send_multipart([
+            identity,
+            str(request_id).encode(),
+            pickle.dumps(command, protocol=pickle.HIGHEST_PROTOCOL)
+        ])
+
+        try:
+            status, result = await self._wait(future, identity,
+                                              self.workers[identity])
+        finally:
+            self.requests.pop(request_id, None)
+        if status == 'error':
+            raise ValueError(result)
+
+        return result
+
+    async def _route(self, contract_id, *command):
+        """
+        Send a command to the worker that owns the contract, waiting
+        for the contract if it is being moved.
+        """
+        moving = self.moving.get(contract_id)
+        if moving is not None:
+            await moving
+
+        if contract_id not in self.contracts:
+            raise ValueError('Contract {} not found'.format(contract_id))
+
+        return await self._request(self._location(contract_id), *command)
+
+    def _location(self, contract_id):
+        """
+        Worker that holds the contract: its owner in the hash ring, or
+        the worker where it stayed because it could not be moved.
+        """
+        worker = self.pinned.get(contract_id)
+        if worker is None:
+            worker = self.ring.owner(contract_id)
+
+        return worker
+
+    async def start(self, workers):
+        """
+        Start the given number of workers
+        """
+        for worker in range(workers):
+            await self.add_worker()
+
+    async def add_worker(self):
+        """
+        Start a new worker, and move to it the contracts that it owns
+        in the hash ring. The contracts recovered by the worker from its
+        log that belong to other workers are moved to them, and so are
+        the contracts that could not be moved before. Returns the
+        identity of the worker.
+        """
+        if self._receiver is None:
+            self._receiver = asyncio.ensure_future(self._receive())
+
+        identity = 'shard-{}'.format(next(self._worker_ids)).encode()
+        wal_directory = None
+        if self.wal_directory is not None:
+            wal_directory = os.path.join(self.wal_directory,
+                                         identity.decode())
+
+        ready = self.ready[identity] = \
+            asyncio.get_running_loop().create_future()
+        process = Process(
+            target=run_worker,
+            args=(identity, self.templates, self.address,
+                  self.publisher_address, wal_directory),
+            daemon=True)
+        process.start()
+        try:
+            recovered = await self._wait(ready, identity, process)
+        finally:
+            self.ready.pop(identity, None)
+        self.workers[identity] = process
+
+        owners = {contract_id: self._location(contract_id)
+                  for contract_id in self.contracts} if self.ring else {}
+        self.ring.add(identity)
+        moves = {}
+        for contract_id, owner in owners.items():
+            target = self.ring.owner(contract_id)
+            if target != owner:
+                moves.setdefault((owner, target), []).append(contract_id)
+
+        for contract_id, template in recovered:
+            self.contracts[contract_id] = template
+            owner = self.ring.owner(contract_id)
+            if owner != identity:
+                moves.setdefault((identity, owner), []).append(contract_id)
+
+        await self._move(moves)
+        return identity
+
+    async def remove_worker(self, identity):
+        """
+        Move the contracts of a worker to the rest, and stop it. If a
+        contract can't be moved, the worker is not stopped, and it keeps
+        the contracts that it could not move, until it is removed again.
+        """
+        if identity not in self.workers:
+            raise ValueError('Worker {} not found'.format(identity))
+
+        if identity in self.ring and len(self.ring) <= 1:
+            raise ValueError('The last worker can not be removed')
+
+        owned = [contract_id for contract_id in self.contracts
+                 if self._location(contract_id) == identity]
+        if identity in self.ring:
+            self.ring.remove(identity)
+        moves = {}
+        for contract_id in owned:
+            target = self.ring.owner(contract_id)
+            moves.setdefault((identity, target), []).append(contract_id)
+
+        await self._move(moves)
+
+        await self._request(identity, 'stop')
+        self.workers.pop(identity).join()
+
+    async def _move(self, moves):
+        """
+        Move contracts between workers. *moves* is a dictionary with
+        tuples of the current owner and the new one, and the ids of the
+        contracts. The commands for these contracts wait until they are
+        moved.
+
+        The contracts are exported from the owner, loaded in the new
+        one, and only then discarded from the owner. If a move fails,
+        the contracts stay in the owner and the commands are routed to
+        it, and the first error is raised once the other moves are done.
+        """
+        if not moves:
+            return
+
+        done = asyncio.get_running_loop().create_future()
+        for contract_ids in moves.values():
+            for contract_id in contract_ids:
+                self.moving[contract_id] = done
+
+        error = None
+        try:
+            for (owner, target), contract_ids in moves.items():
+                try:
+                    exported = await self._request(owner, 'export',
+                                                   contract_ids)
+                    await self._request(target, 'load', exported)
+                except ValueError as e:
+                    for contract_id in contract_ids:
+                        self.pinned[contract_id] = owner
+                    error = error or e
+                    continue
+
+                for contract_id in contract_ids:
+                    self.pinned.pop(contract_id, None)
+                await self._request(owner, 'discard', contract_ids)
+        finally:
+            for contract_ids in moves.values():
+                for contract_id in contract_ids:
+                    del self.moving[contract_id]
+            done.set_result(None)
+
+        if error is not None:
+            raise error
+
+    async def create(self, template, attributes=None, contract_id=None):
+        """
+        Create a contract from a template in the worker that owns it.
+        Returns the id of the contract.
+
+        :param template: Name of the template
+        :param attributes: Optional dictionary of attributes to set
+        :param contract_id: Id of the contract, a new one by default
+        """
+        if template not in self.templates:
+            raise ValueError('Template {} not found'.format(template))
+
+        if contract_id is None:
+            contract_id = uuid4().hex
+        elif contract_id in self.contracts:
+            raise ValueError('Contract {} already exists'.format(contract_id))
+
+        self.contracts[contract_id] = template
+        try:
+            await self._route(contract_id, 'create', contract_id, template,
+                              attributes)
+        except ValueError:
+            del self.contracts[contract_id]
+            raise
+
+        return contract_id
+
+    async def set(self, contract_id, attributes):
+        """
+        Set attributes of a contract.
+
+        :param contract_id: Id of the contract
+        :param attributes: Dictionary with names of attributes as keys.
+        """
+        await self._route(contract_id, 'set', contract_id, attributes)
+
+    async def get(self, contract_id, name):
+        """
+        Value of a node or an attribute of a contract
+        """
+        return await self._route(contract_id, 'get', contract_id, name)
+
+    async def delete(self, contract_id):
+        await self._route(contract_id, 'delete', contract_id)
+        del self.contracts[contract_id]
+        self.pinned.pop(contract_id, None)
+
+    async def close(self):
+        """
+        Stop the workers and close the socket
+        """
+        for identity in list(self.workers):
+            try:
+                await self._request(identity, 'stop')
+            except RuntimeError:
+                # The worker is not running
+                pass
+            self.workers.pop(identity).join()
+
+        if self._receiver is not None:
+            self._receiver.cancel()
+        self.socket.close(linger=0)
@@ -0,0 +1,335 @@
+#   Smartc. Smart contracts for real time applications.
+#   Copyright (C) 2017 Guillem Borrell i Nogueras (@guillemborrell)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+In-process metrics: counters, gauges and histograms with log-linear
+buckets in the spirit of HDR histograms, rendered in the Prometheus text
+format by :func:`render`.
+
+Monitoring is disabled by default. The instrumented code checks the
+module attribute *enabled* before measuring anything, so the overhead
+is a single attribute lookup per operation::
+
+    from smartc.monitor import metrics
+
+    if metrics.enabled:
+        SETS.inc()
+
+Updates are not locked. They may be lost in a race between threads,
+which is acceptable for monitoring.
+"""
+import math
+
+enabled = False
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+
+    return repr(value)
+
+
+def _format_bound(value):
+    if value == math.inf:
+        return '+Inf'
+
+    return '{:.6g}'.format(value)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+
+    return '{' + ','.join(
+        '{}="{}"'.format(name, value.replace('\\', '\\\\')
+                         .replace('"', '\\"').replace('\n', '\\n')
+                         if isinstance(value, str) else _format_bound(value))
+        for name, value in labels) + '}'
+
+
+class Metric:
+    """
+    Base class of the metrics. A metric with label names has a child
+    for each combination of values of the labels, returned by
+    :meth:`labels`.
+
+    :param name: Name of the metric
+    :param documentation: Help text of the metric
+    :param labelnames: Names of the labels
+    """
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children = {}
+        self._reset()
+
+    def _reset(self):
+        pass
+
+    def _child(self):
+        return type(self)(self.name, self.documentation)
+
+    def labels(self, *values):
+        """
+        Child of the metric for the given values of the labels
+        """
+        child = self.children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(
+                    'Metric {} has labels {}'.format(
+                        self.name, ', '.join(self.labelnames))
+                )
+            child = self.children[values] = self._child()
+
+        return child
+
+    def _samples(self):
+        """
+        Samples of a metric without labels, as tuples of the suffix of
+        the name, the extra labels and the value.
+        """
+        return []
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.documentation),
+                 '# TYPE {} {}'.format(self.name, self.kind)]
+        if self.labelnames:
+            children = [(tuple(zip(self.labelnames, values)), child)
+                        for values, child in sorted(self.children.items())]
+        else:
+            children = [((), self)]
+
+        for labels, child in children:
+            for suffix, extra, value in child._samples():
+                lines.append('{}{}{} {}'.format(
+                    self.name, suffix, _format_labels(labels + extra),
+                    _format_value(value)))
+
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    """
+    Value that only increases
+    """
+    kind = 'counter'
+
+    def _reset(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def _samples(self):
+        return [('', (), self.value)]
+
+
+class Gauge(Metric):
+    """
+    Value that increases and decreases
+    """
+    kind = 'gauge'
+
+    def _reset(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def _samples(self):
+        return [('', (), self.value)]
+
+
+class Histogram(Metric):
+    """
+    Histogram with log-linear buckets. Each power of two from *lowest*
+    to *highest* is split in *sub_buckets* buckets of the same width, so
+    the relative error of a quantile is below 1 / *sub_buckets*. The
+    buckets are fixed when the histogram is declared, and all of them
+    are rendered, since Prometheus expects the same ``le`` series in
+    every scrape. Values below *lowest* are counted in the first bucket,
+    and values above *highest* only in the ``+Inf`` bucket.
+
+    :param name: Name of the metric
+    :param documentation: Help text of the metric
+    :param labelnames: Names of the labels
+    :param lowest: Lowest value distinguished from zero
+    :param highest: Highest value of the buckets, *lowest* times
+                    ``2 ** 26`` by default
+    :param sub_buckets: Number of buckets of each power of two
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), lowest=1e-6,
+                 highest=None, sub_buckets=2):
+        if highest is None:
+            highest = lowest * 2 ** 26
+        if not 0 < lowest < highest:
+            raise ValueError(
+                'Histogram {} needs 0 < lowest < highest'.format(name))
+
+        self.lowest = lowest
+        self.highest = highest
+        self.sub_buckets = sub_buckets
+        # Upper bounds of the buckets, up to the first one that is not
+        # below highest. The first one takes the values below lowest.
+        self.bounds = [lowest]
+        while self.bounds[-1] < highest:
+            self.bounds.append(self._upper(len(self.bounds) - 1))
+        super().__init__(name, documentation, labelnames)
+
+    def _reset(self):
+        # One more for the values above the last bound
+        self.buckets = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def _child(self):
+        return Histogram(self.name, self.documentation, lowest=self.lowest,
+                         highest=self.highest, sub_buckets=self.sub_buckets)
+
+    def _index(self, value):
+        """
+        Index of the bucket of a value, from zero for the bucket that
+        starts at lowest.
+        """
+        mantissa, exponent = math.frexp(value / self.lowest)
+        return (exponent - 1) * self.sub_buckets + \
+            int((mantissa - 0.5) * 2 * self.sub_buckets)
+
+    def _upper(self, index):
+        """
+        Upper bound of a bucket
+        """
+        exponent, sub = divmod(index, self.sub_buckets)
+        return math.ldexp(0.5 + (sub + 1) / (2 * self.sub_buckets),
+                          exponent + 1) * self.lowest
+
+    def observe(self, value):
+        bounds = self.bounds
+        if value <= self.lowest:
+            position = 0
+        else:
+            position = min(self._index(value) + 1, len(bounds))
+            # A value on a bound belongs to the bucket below
+            if value <= bounds[position - 1]:
+                position -= 1
+
+        self.buckets[position] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """
+        Upper bound of the bucket of the quantile *q*, between 0 and 1,
+        or infinity if it is above the last bound.
+        """
+        if not self.count:
+            return 0
+
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.buckets):
+            seen += count
+            if seen >= rank:
+                return bound
+
+        return math.inf
+
+    def _samples(self):
+        samples = []
+        seen = 0
+        for bound, count in zip(self.bounds, self.buckets):
+            seen += count
+            samples.append(('_bucket', (('le', bound),), seen))
+
+        samples.append(('_bucket', (('le', math.inf),), self.count))
+        samples.append(('_sum', (), self.sum))
+        samples.append(('_count', (), self.count))
+        return samples
+
+
+class Registry:
+    """
+    Collection of metrics rendered together
+    """
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(
+                'Metric {} already registered'.format(metric.name))
+
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        return ''.join(metric.render() + '\n'
+                       for name, metric in sorted(self.metrics.items()))
+
+
+registry = Registry()
+
+
+def counter(name, documentation, labelnames=()):
+    """
+    Create a counter in the default registry
+    """
+    return registry.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name, documentation, labelnames=()):
+    """
+    Create a gauge in the default registry
+    """
+    return registry.register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name, documentation, labelnames=(), **kwargs):
+    """
+    Create a histogram in the default registry
+    """
+    return registry.register(
+        Histogram(name, documentation, labelnames, **kwargs))
+
+
+def render():
+    """
+    All the metrics of the default registry in the Prometheus text format
+    """
+    return registry.render()
@@ -14,34 +14,159 @@
 #   You should have received a copy of the GNU Affero General Public License
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import argparse
 import os
+import signal
+import sys
 from multiprocessing import Process
 
-from tornado import web
+from tornado import httpserver, netutil, web
 from zmq.eventloop import ioloop
 
-from smartc.broker import server_pub
+from smartc.broker import run_broker, server_pub
 from smartc.handlers.web import IndexHandler
 from smartc.handlers.push import PushHandler
-from smartc.handlers.rest import RestHandler
+from smartc.handlers.rest import rest_urls
+from smartc.monitor import metrics
+from smartc.monitor.handler import MetricsHandler
 
 ioloop.install()
 
 app = web.Application([
     (r'/', IndexHandler),
     (r'/push', PushHandler),
-    (r'/rest', RestHandler),
+    (r'/metrics', MetricsHandler),
     (r'/(favicon.ico)', web.StaticFileHandler, {
         'path': os.path.join(os.pardir, 'static')
     }),
-    ])
+    ] + rest_urls('/rest'))
 
 
-def main(port):
-    app.listen(port)
-    ioloop.IOLoop.instance().start()
-    
+def fork_workers(workers, max_restarts=100):
+    """
+    Fork the worker processes and supervise them. It returns the number
+    of the worker in each worker process, and it does not return in the
+    supervisor, that waits for the workers and restarts the ones that
+    die. SIGTERM and SIGINT stop the supervisor and all the workers.
+
+    :param workers: Number of worker processes
+    :param max_restarts: Maximum number of worker restarts
+    """
+    children = {}
+
+    def start(worker):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            return True
+
+        children[pid] = worker
+        return False
+
+    def stop(signum, frame):
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                # Reaped, but not removed from children yet
+                pass
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for worker in range(workers):
+        if start(worker):
+            return worker
+
+    restarts = 0
+    while children:
+        pid, status = os.wait()
+        worker = children.pop(pid, None)
+        if worker is None:
+            continue
+
+        if os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0:
+            print('Worker {} exited'.format(worker))
+            continue
+
+        restarts += 1
+        if restarts > max_restarts:
+            stop(signal.SIGTERM, None)
+
+        print('Worker {} died, restarting'.format(worker))
+        if start(worker):
+            return worker
+
+    sys.exit(0)
+
+
+def main(port, workers=1, reuse_port=False, max_restarts=100):
+    """
+    Run the web server. With more than one worker, the process forks
+    the workers and supervises them (see :func:`fork_workers`). Each
+    worker has its own IOLoop, ZMQ context and subscriber.
+
+    :param port: Port to listen to
+    :param workers: Number of worker processes, 0 for one per core
+    :param reuse_port: If True, each worker binds its own socket with
+                       SO_REUSEPORT, and the kernel balances the
+                       connections. Otherwise the socket is bound
+                       before forking and shared by the workers.
+    :param max_restarts: Maximum number of worker restarts
+    """
+    if workers == 1:
+        app.listen(port)
+        ioloop.IOLoop.instance().start()
+        return
+
+    sockets = None
+    if not reuse_port:
+        sockets = netutil.bind_sockets(port)
+
+    if workers == 0:
+        workers = os.cpu_count()
+
+    worker = fork_workers(workers, max_restarts)
+    print('Worker {} started with pid {}'.format(worker, os.getpid()))
+
+    if reuse_port:
+        sockets = netutil.bind_sockets(port, reuse_port=True)
+
+    server = httpserver.HTTPServer(app)
+    server.add_sockets(sockets)
+    ioloop.IOLoop.current().start()
+
 
 if __name__ == '__main__':
-    Process(target=server_pub).start()
-    main(8080)
+    parser = argparse.ArgumentParser(description='Smartc web server')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of worker processes, 0 for one per core')
+    parser.add_argument('--reuse-port', action='store_true',
+                        help='Each worker binds the port with SO_REUSEPORT')
+    parser.add_argument('--metrics', action='store_true',
+                        help='Collect the metrics served in /metrics')
+    args = parser.parse_args()
+
+    if args.metrics:
+        metrics.enable()
+
+    services = [Process(target=run_broker), Process(target=server_pub)]
+    for service in services:
+        service.start()
+
+    # SIGTERM exits through the finally clause in single worker mode.
+    # With more workers, the supervisor handles it in fork_workers.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    supervisor = os.getpid()
+    try:
+        main(args.port, args.workers, args.reuse_port)
+    finally:
+        # The forked workers exit through here too
+        if os.getpid() == supervisor:
+            for service in services:
+                service.terminate()
+                service.join()
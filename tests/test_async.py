@@ -0,0 +1,117 @@
+#   Smartc. Smart contracts for real time applications.
+#   Copyright (C) 2017 Guillem Borrell i Nogueras (@guillemborrell)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from smartc.contract.builder import Attribute, Contract, node
+
+events = {}
+
+
+@node
+async def fetch(x):
+    await asyncio.sleep(0)
+    return 2 * x
+
+
+@node
+async def ping(x):
+    # pong must run at the same time for ping to finish
+    events['ping'].set()
+    await asyncio.wait_for(events['pong'].wait(), 10)
+    return x
+
+
+@node
+async def pong(x):
+    events['pong'].set()
+    await asyncio.wait_for(events['ping'].wait(), 10)
+    return x
+
+
+@node
+def add(x, y):
+    return x + y
+
+
+def test_async_nodes():
+    a = Attribute('a', int)
+    b = Attribute('b', int)
+    last = add(fetch(a), b)
+    contract = Contract(last)
+
+    async def run():
+        await contract.aset('a', 1)
+        await contract.aset('b', 3)
+
+    asyncio.run(run())
+    assert contract.get(last) == 5
+    with pytest.raises(ValueError):
+        contract.set('a', 1)
+
+
+def test_async_nodes_run_concurrently():
+    a = Attribute('a', int)
+    b = Attribute('b', int)
+    last = add(ping(a), pong(b))
+    contract = Contract(last)
+
+    async def run():
+        events.update(ping=asyncio.Event(), pong=asyncio.Event())
+        await contract.aset_many({'a': 1, 'b': 2})
+
+    asyncio.run(run())
+    assert contract.get(last) == 3
+
+
+def test_sync_nodes_in_an_executor():
+    a = Attribute('a', int)
+    b = Attribute('b', int)
+    last = add(fetch(a), b)
+    with ThreadPoolExecutor(2) as executor:
+        contract = Contract(last, executor=executor)
+        asyncio.run(contract.aset_many({'a': 1, 'b': 3}))
+    assert contract.get(last) == 5
+
+
+def test_failed_wave_keeps_the_other_results():
+    calls = []
+
+    @node
+    async def flaky(x):
+        calls.append(x)
+        if len(calls) == 1:
+            raise RuntimeError('Node failed')
+        return x
+
+    a = Attribute('a', int)
+    b = Attribute('b', int)
+    left = fetch(a)
+    right = flaky(b)
+    last = add(add(left, right), Attribute('c', int))
+    contract = Contract(last)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(contract.aset_many({'a': 2, 'b': 3}))
+    assert contract.get(left) == 4
+    assert contract.get(right) is None
+
+    asyncio.run(contract.aset('c', 1))
+    assert calls == [3, 3]
+    assert contract.get(last) == 8
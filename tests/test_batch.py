@@ -0,0 +1,170 @@
+#   Smartc. Smart contracts for real time applications.
+#   Copyright (C) 2017 Guillem Borrell i Nogueras (@guillemborrell)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import numpy as np
+import pytest
+
+from smartc.contract.batch import ContractBatch
+from smartc.contract.builder import Attribute, Contract, ContractTemplate, \
+    gather, node
+
+
+@node
+def add(x, y):
+    return x + y
+
+
+@node(vectorize=True)
+def scale(x):
+    return 10 * x
+
+
+@node
+async def fetch(x):
+    return x
+
+
+def build():
+    a = Attribute('a', int)
+    b = Attribute('b', int)
+    return add(scale(a), b)
+
+
+def test_batch_matches_contracts():
+    last = build()
+    batch = ContractBatch(last, 4)
+    batch.set('a', np.arange(4))
+    batch.set('b', [1, 2], rows=[1, 3])
+    assert type(batch.column('a')) is np.ndarray
+
+    for row in range(4):
+        contract = Contract(last)
+        contract.set('a', row)
+        if row in (1, 3):
+            contract.set('b', (row + 1) // 2)
+        assert batch.get(row, last.name) == contract.get(last)
+
+
+def test_template():
+    template = ContractTemplate(build())
+    batch = ContractBatch(template, 2)
+    batch.set_many({'a': [1, 2], 'b': [3, 4]})
+    assert list(batch.column(template.name)) == [13, 24]
+
+
+def test_gather_rows():
+    a = Attribute('a', int)
+    b = Attribute('b', int)
+
+    def condition(x, y):
+        if x or y:
+            return x or y
+
+    last = gather(add(a, a), add(b, b), condition=condition)
+    batch = ContractBatch(last, 3)
+    batch.set('a', [0, 1, 0])
+    assert [batch.get(row, last.name) for row in range(3)] == [None, 2, None]
+    batch.set('b', [2, 3, 0])
+    assert [batch.get(row, last.name) for row in range(3)] == [4, 2, None]
+
+
+@pytest.mark.parametrize('mode', ['first', 'any'])
+def test_gather_modes_match_contracts(mode):
+    a = Attribute('a', int)
+    b = Attribute('b', int)
+    c = Attribute('c', int)
+    calls = []
+
+    def condition(*args):
+        calls.append(args)
+        if sum(args) > 2:
+            return sum(args)
+
+    doubled = add(b, b)
+    last = gather(add(a, a), doubled, add(c, c), mode=mode,
+                  condition=None if mode == 'first' else condition)
+    sets = [('a', [1, 2]), ('b', [1, 3]), ('c', [4, 5])]
+    batch = ContractBatch(last, 2)
+    for name, values in sets:
+        batch.set(name, values)
+    batch_calls = calls[:]
+
+    del calls[:]
+    for row in range(2):
+        contract = Contract(last)
+        for name, values in sets:
+            contract.set(name, values[row])
+        for n in (last, doubled):
+            assert batch.get(row, n.name) == contract.get(n)
+
+    # The batch calls the condition for both rows at each set
+    assert sorted(batch_calls) == sorted(calls)
+
+
+def test_gather_arguments_match_contracts():
+    a = Attribute('a', int)
+    b = Attribute('b', float)
+    calls = []
+
+    def condition(x, y):
+        calls.append((x, type(x), y, type(y)))
+
+    last = gather(a, b, condition=condition)
+    batch = ContractBatch(last, 2)
+    batch.set('a', [1, 2])
+    batch_calls = calls[:]
+
+    del calls[:]
+    for row in range(2):
+        Contract(last).set('a', row + 1)
+
+    # Arguments without a value are None, not zero, and the values are
+    # not NumPy scalars
+    assert batch_calls == calls == [(1, int, None, type(None)),
+                                    (2, int, None, type(None))]
+
+
+def test_errors():
+    last = build()
+    batch = ContractBatch(last, 2)
+    with pytest.raises(ValueError):
+        batch.set('missing', [1, 2])
+    with pytest.raises(ValueError):
+        batch.set('a', [1])
+    with pytest.raises(ValueError):
+        batch.set('a', [1.0, 2.0])
+    with pytest.raises(ValueError):
+        ContractBatch(fetch(Attribute('a', int)), 2)
+
+
+def test_attributes_are_set_once():
+    a = Attribute('a', int, mutable=True)
+    b = Attribute('b', int)
+    last = add(a, b)
+    batch = ContractBatch(last, 2)
+    batch.set_many({'a': [1], 'b': [3]}, rows=[0])
+    with pytest.raises(ValueError):
+        batch.set('a', [5], rows=[0])
+    with pytest.raises(ValueError):
+        batch.set('b', [6], rows=[0])
+    # None of the attributes is set if any of them fails
+    with pytest.raises(ValueError):
+        batch.set_many({'b': [4, 5], 'a': [2, 6]})
+    assert batch.get(0, 'a') == 1 and batch.get(0, last.name) == 4
+    assert batch.get(1, 'a') is None
+
+    batch.set_many({'b': [4], 'a': [2]}, rows=[1])
+    assert batch.get(1, last.name) == 6
@@ -0,0 +1,101 @@
+#   Smartc. Smart contracts for real time applications.
+#   Copyright (C) 2017 Guillem Borrell i Nogueras (@guillemborrell)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import time
+
+import pytest
+import zmq
+
+from smartc.broker import Publisher
+
+
+@pytest.fixture
+def subscriber():
+    """
+    SUB socket bound to a random port, standing for the broker
+    """
+    socket = zmq.Context.instance().socket(zmq.SUB)
+    socket.setsockopt(zmq.SUBSCRIBE, b'')
+    port = socket.bind_to_random_port('tcp://127.0.0.1')
+    yield socket, 'tcp://127.0.0.1:{}'.format(port)
+    socket.close(linger=0)
+
+
+def connect(subscriber, **kwargs):
+    socket, address = subscriber
+    publisher = Publisher(address, **kwargs)
+    # Wait until the subscription reaches the publisher
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        publisher.socket.send_multipart([b'probe', b''])
+        if socket.poll(50):
+            socket.recv_multipart()
+            break
+    while socket.poll(50):
+        socket.recv_multipart()
+
+    return publisher
+
+
+def received(socket, timeout=0):
+    messages = []
+    while socket.poll(timeout):
+        messages.append(socket.recv_multipart())
+        # Wait a little for the messages sent right after this one
+        timeout = min(timeout, 50)
+
+    return messages
+
+
+def test_unbatched(subscriber):
+    publisher = connect(subscriber)
+    publisher.publish('topic', b'1')
+    assert received(subscriber[0], 1000) == [[b'topic', b'1']]
+    publisher.close(linger=0)
+
+
+def test_full_batch(subscriber):
+    publisher = connect(subscriber, batch_size=2, max_delay=60)
+    publisher.publish('topic', b'1')
+    assert received(subscriber[0], 100) == []
+
+    publisher.publish('topic', b'2')
+    assert received(subscriber[0], 1000) == [[b'topic', b'1', b'2']]
+    publisher.close(linger=0)
+
+
+def test_flush(subscriber):
+    publisher = connect(subscriber, batch_size=10, max_delay=60)
+    publisher.publish('a', b'1')
+    publisher.publish('b', b'2')
+    publisher.flush()
+    assert sorted(received(subscriber[0], 1000)) == \
+        [[b'a', b'1'], [b'b', b'2']]
+    publisher.close(linger=0)
+
+
+def test_max_delay_timer(subscriber):
+    publisher = connect(subscriber, batch_size=10, max_delay=0.01)
+
+    async def publish():
+        publisher.publish('topic', b'1')
+        await asyncio.sleep(0.1)
+        assert publisher.batches == {}
+
+    asyncio.run(publish())
+    assert received(subscriber[0], 1000) == [[b'topic', b'1']]
+    publisher.close(linger=0)
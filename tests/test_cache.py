@@ -0,0 +1,93 @@
+#   Smartc. Smart contracts for real time applications.
+#   Copyright (C) 2017 Guillem Borrell i Nogueras (@guillemborrell)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from smartc.contract.builder import Attribute, Contract, node
+from smartc.contract.cache import MISSING, NodeCache
+
+calls = []
+
+
+@node(pure=True, cache=2)
+def square(x):
+    calls.append(x)
+    return x * x
+
+
+@node(pure=True)
+def length(x):
+    return len(x)
+
+
+def test_node_cache():
+    a = Attribute('a', int)
+    last = square(a)
+    cache = last.graph[last.name].cache
+    cache.clear()
+    del calls[:]
+
+    for value in (2, 2, 3, 2, 4, 3):
+        contract = Contract(last)
+        contract.set('a', value)
+        assert contract.get(last) == value * value
+
+    # 3 is the least recently used result when 4 is stored
+    assert calls == [2, 3, 4, 3]
+    assert (cache.hits, cache.misses, len(cache)) == (2, 4, 2)
+
+
+def test_executor_uses_the_cache():
+    a = Attribute('a', int)
+    last = square(a)
+    last.graph[last.name].cache.clear()
+    del calls[:]
+    with ThreadPoolExecutor(2) as executor:
+        for i in range(2):
+            Contract(last, executor=executor).set('a', 5)
+    assert calls == [5]
+
+
+def test_equal_arguments_of_other_types():
+    cache = NodeCache()
+
+    def half(x):
+        return x / 2 if type(x) is float else x // 2
+
+    assert cache.call(half, (1,)) == 0
+    assert cache.call(half, (1.0,)) == 0.5
+    assert cache.call(half, (True,)) == 0
+    assert len(cache) == 3 and cache.hits == 0
+
+
+def test_unhashable_arguments():
+    cache = NodeCache()
+    assert cache.call(len, ([1, 2],)) == 2
+    assert len(cache) == 0 and cache.misses == 1
+    assert cache.get(cache.key(len, ((1, 2),))) is MISSING
+
+    a = Attribute('a', list)
+    last = length(a)
+    contract = Contract(last)
+    contract.set('a', [1, 2, 3])
+    assert contract.get(last) == 3
+
+
+def test_only_pure_nodes_are_cached():
+    with pytest.raises(ValueError):
+        node(lambda x: x, cache=NodeCache())
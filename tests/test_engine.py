@@ -0,0 +1,282 @@
+#   Smartc. Smart contracts for real time applications.
+#   Copyright (C) 2017 Guillem Borrell i Nogueras (@guillemborrell)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Regression tests of the evaluation engine. The expected values are the
+ones computed by the engine that walked the whole graph on each set.
+"""
+from collections import defaultdict
+
+import pytest
+
+from smartc.contract.builder import Attribute, Contract, gather, node
+from smartc.contract.schedule import EVALUATED, LOCKED
+
+
+@node
+def something(a):
+    return 2*a
+
+
+@node
+def another(x, y):
+    return x + y
+
+
+def demo():
+    a = Attribute('a', float)
+    b = Attribute('b', int)
+    c = something(a)
+    x = another(a, c)
+    q = something(a)
+    y = another(b, x)
+    z = another(y, q)
+    return dict(c=c, x=x, q=q, y=y, z=z)
+
+
+def values(contract, nodes):
+    return {k: contract.get(n) for k, n in nodes.items()}
+
+
+def test_demo():
+    nodes = demo()
+    contract = Contract(nodes['z'])
+
+    contract.set('a', 1.0)
+    assert values(contract, nodes) == \
+        dict(c=2.0, x=3.0, q=2.0, y=None, z=None)
+
+    contract.set('b', 2)
+    assert values(contract, nodes) == \
+        dict(c=2.0, x=3.0, q=2.0, y=5.0, z=7.0)
+
+
+def test_demo_set_many():
+    nodes = demo()
+    contract = Contract(nodes['z'])
+    contract.set_many({'a': 1.0, 'b': 2})
+    assert values(contract, nodes) == \
+        dict(c=2.0, x=3.0, q=2.0, y=5.0, z=7.0)
+
+
+def test_set_many_is_atomic():
+    calls = []
+
+    @node
+    def record(x):
+        calls.append(x)
+        return x
+
+    a = Attribute('a', float)
+    b = Attribute('b', int)
+    c = Attribute('c', int)
+    last = another(record(a), another(b, c))
+    contract = Contract(last)
+    for attributes in ({'a': 1.0, 'b': 'not an int'},
+                       {'a': 1.0, 'b': 2, 'missing': 3}):
+        with pytest.raises(ValueError):
+            contract.set_many(attributes)
+        assert contract.values == [None] * contract.schedule.size
+        assert not any(state & EVALUATED for state in contract.state)
+        assert calls == []
+
+    contract.set('c', 3)
+    with pytest.raises(ValueError):
+        contract.set_many({'a': 1.0, 'c': 4})
+    assert contract.get('a') is None and contract.get('c') == 3
+    assert calls == []
+
+
+def test_only_downstream_nodes_are_evaluated():
+    calls = []
+
+    @node
+    def left(a):
+        calls.append('left')
+        return a
+
+    @node
+    def right(b):
+        calls.append('right')
+        return b
+
+    @node
+    def both(x, y):
+        calls.append('both')
+        return x + y
+
+    contract = Contract(both(left(Attribute('a', int)),
+                             right(Attribute('b', int))))
+    contract.set('a', 1)
+    assert calls == ['left']
+    contract.set('b', 2)
+    assert calls == ['left', 'right', 'both']
+
+
+def test_errors():
+    contract = Contract(demo()['z'])
+    with pytest.raises(ValueError):
+        contract.set('missing', 1.0)
+    with pytest.raises(ValueError):
+        contract.set('a', 1)
+
+    contract.set('a', 1.0)
+    with pytest.raises(ValueError):
+        contract.set('a', 2.0)
+
+
+def test_failed_node_is_evaluated_by_the_next_set():
+    calls = []
+
+    @node
+    def flaky(a):
+        calls.append(a)
+        if len(calls) == 1:
+            raise ZeroDivisionError('first call')
+        return 2*a
+
+    a = Attribute('a', float)
+    b = Attribute('b', int)
+    twice = flaky(a)
+    total = another(b, twice)
+    contract = Contract(total)
+
+    with pytest.raises(ZeroDivisionError):
+        contract.set('a', 1.0)
+    assert contract.get(twice) is None
+
+    contract.set('b', 2)
+    assert calls == [1.0, 1.0]
+    assert contract.get(twice) == 2.0
+    assert contract.get(total) == 4.0
+
+
+def test_failed_gather_keeps_its_arrivals():
+    calls = []
+
+    def condition(*args):
+        calls.append(args)
+        if len(calls) == 1:
+            raise KeyError('first call')
+        return sum(args)
+
+    a = Attribute('a', int)
+    b = Attribute('b', int)
+    total = gather(a, b, condition=condition, mode='any')
+    contract = Contract(total)
+
+    with pytest.raises(KeyError):
+        contract.set('a', 1)
+
+    contract.set('b', 2)
+    assert calls[1:] == [(1, 2)]
+    assert contract.get(total) == 3
+
+
+BEATS = {'rock': 'scissors', 'paper': 'rock', 'scissors': 'paper'}
+
+
+def game_winner(player1, player2, scoreboard):
+    scoreboard = defaultdict(int, scoreboard)
+    if BEATS[player1] == player2:
+        scoreboard['player1'] += 1
+    if BEATS[player2] == player1:
+        scoreboard['player2'] += 1
+    return scoreboard
+
+
+@node
+def firstgame(player1, player2):
+    return game_winner(player1, player2, {})
+
+
+@node
+def game(player1, player2, scoreboard):
+    return game_winner(player1, player2, scoreboard)
+
+
+def select_winner(*scoreboards):
+    message = None
+    for scoreboard in scoreboards:
+        if scoreboard is not None:
+            if scoreboard['player1'] == 3:
+                message = 'Player1 is the winner'
+            elif scoreboard['player2'] == 3:
+                message = 'Player2 is the winner'
+
+    return message
+
+
+MOVES = [
+    ('p1_0', 'rock'), ('p2_0', 'paper'),
+    ('p1_1', 'rock'), ('p2_1', 'paper'),
+    ('p1_2', 'rock'), ('p2_2', 'scissors'),
+    ('p1_3', 'rock'), ('p2_3', 'paper'),
+    ('p1_4', 'rock'), ('p2_4', 'rock'),
+]
+
+S1 = {'player2': 1}
+S2 = {'player2': 2}
+S3 = {'player2': 2, 'player1': 1}
+S4 = {'player2': 3, 'player1': 1}
+WINNER = 'Player2 is the winner'
+
+# Scoreboards, value of the gather, gather locked, and value of the
+# winner after each move.
+EXPECTED = [
+    ([None, None, None, None, None], None, True, None),
+    ([S1, None, None, None, None], None, True, None),
+    ([S1, None, None, None, None], None, True, None),
+    ([S1, S2, None, None, None], None, True, None),
+    ([S1, S2, None, None, None], None, True, None),
+    ([S1, S2, S3, None, None], None, True, None),
+    ([S1, S2, S3, None, None], None, True, None),
+    ([S1, S2, S3, S4, None], WINNER, False, True),
+    ([S1, S2, S3, S4, None], WINNER, False, True),
+    ([S1, S2, S3, S4, S4], WINNER, False, True),
+]
+
+
+def test_rockpaperscissors():
+    messages = []
+
+    @node
+    def winner(message):
+        messages.append(message)
+        return True
+
+    player1 = [Attribute('p1_{}'.format(i), str) for i in range(5)]
+    player2 = [Attribute('p2_{}'.format(i), str) for i in range(5)]
+    scoreboards = [firstgame(player1[0], player2[0])]
+    for i in range(1, 5):
+        scoreboards.append(game(player1[i], player2[i], scoreboards[-1]))
+    # The old engine kept evaluating the nodes upstream of a gather
+    # after it fired.
+    got_winner = gather(*scoreboards[2:], condition=select_winner,
+                        freeze=False)
+    notify_winner = winner(got_winner)
+    contract = Contract(notify_winner)
+    index = contract.schedule.index[got_winner.name]
+
+    for (attribute, value), expected in zip(MOVES, EXPECTED):
+        contract.set(attribute, value)
+        boards = [contract.get(s) for s in scoreboards]
+        assert ([dict(b) if b else None for b in boards],
+                contract.get(got_winner),
+                bool(contract.state[index] & LOCKED),
+                contract.get(notify_winner)) == expected
+
+    assert messages == [WINNER]
@@ -0,0 +1,118 @@
+#   Smartc. Smart contracts for real time applications.
+#   Copyright (C) 2017 Guillem Borrell i Nogueras (@guillemborrell)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pytest
+
+from smartc.contract.builder import Attribute, Contract, gather, node
+
+barrier = threading.Barrier(2, timeout=10)
+
+
+@node
+def square(x):
+    return x * x
+
+
+@node
+def add(x, y):
+    return x + y
+
+
+@node
+def meet(x):
+    # Both branches must be running at the same time to pass
+    barrier.wait()
+    return x
+
+
+@node
+def fail(x):
+    raise RuntimeError('Node failed')
+
+
+def build():
+    a = Attribute('a', int)
+    b = Attribute('b', int)
+    return add(square(a), square(b))
+
+
+@pytest.mark.parametrize('executor_class',
+                         [ThreadPoolExecutor, ProcessPoolExecutor])
+def test_executor(executor_class):
+    last = build()
+    with executor_class(2) as executor:
+        contract = Contract(last, executor=executor)
+        contract.set_many({'a': 2, 'b': 3})
+    assert contract.get(last) == 13
+
+
+def test_independent_nodes_run_concurrently():
+    a = Attribute('a', int)
+    b = Attribute('b', int)
+    last = add(meet(a), meet(b))
+    with ThreadPoolExecutor(2) as executor:
+        contract = Contract(last, executor=executor)
+        contract.set_many({'a': 2, 'b': 3})
+    assert contract.get(last) == 5
+
+
+def test_gather_condition():
+    a = Attribute('a', int)
+    b = Attribute('b', int)
+    last = gather(square(a), square(b), mode='first')
+    with ThreadPoolExecutor(2) as executor:
+        contract = Contract(last, executor=executor)
+        contract.set('b', 3)
+        contract.set('a', 2)
+    assert contract.get(last) == 9
+
+
+def test_errors_are_raised():
+    last = add(fail(Attribute('a', int)), Attribute('b', int))
+    with ThreadPoolExecutor(2) as executor:
+        contract = Contract(last, executor=executor)
+        with pytest.raises(RuntimeError):
+            contract.set('a', 1)
+
+
+def test_failed_wave_keeps_the_other_results():
+    calls = []
+
+    @node
+    def flaky(x):
+        calls.append(x)
+        if len(calls) == 1:
+            raise RuntimeError('Node failed')
+        return x
+
+    a = Attribute('a', int)
+    b = Attribute('b', int)
+    left = square(a)
+    right = flaky(b)
+    last = add(add(left, right), Attribute('c', int))
+    with ThreadPoolExecutor(2) as executor:
+        contract = Contract(last, executor=executor)
+        with pytest.raises(RuntimeError):
+            contract.set_many({'a': 2, 'b': 3})
+        assert contract.get(left) == 4
+        assert contract.get(right) is None
+
+        contract.set('c', 1)
+    assert calls == [3, 3]
+    assert contract.get(last) == 8
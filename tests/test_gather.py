@@ -0,0 +1,140 @@
+#   Smartc. Smart contracts for real time applications.
+#   Copyright (C) 2017 Guillem Borrell i Nogueras (@guillemborrell)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from smartc.contract.builder import Attribute, Contract, gather, node
+
+calls = []
+
+
+@node
+def first(a):
+    calls.append('first')
+    return a
+
+
+@node
+def second(b):
+    calls.append('second')
+    return b
+
+
+@node
+def slow(x):
+    calls.append('slow')
+    return 10 * x
+
+
+@node
+async def afirst(a):
+    return a
+
+
+@node
+async def aslow(x):
+    calls.append('slow')
+    return 10 * x
+
+
+def build(mode='first', freeze=True):
+    a = Attribute('a', int)
+    b = Attribute('b', int)
+    x = slow(second(b))
+    return x, gather(first(a), x, mode=mode, freeze=freeze)
+
+
+def test_frozen_while_queued():
+    x, last = build()
+    contract = Contract(last)
+    del calls[:]
+    contract.set_many({'a': 1, 'b': 2})
+    assert contract.get(last) == 1
+    # slow was waiting in the ready queue when the gather fired
+    assert calls == ['first', 'second']
+    assert contract.get(x) is None
+
+
+def test_frozen_while_queued_in_a_wave():
+    x, last = build()
+    with ThreadPoolExecutor(2) as executor:
+        contract = Contract(last, executor=executor)
+        contract.set_many({'a': 1, 'b': 2})
+    # slow may run in the same wave as the gather, but its value is
+    # dropped.
+    assert contract.get(last) == 1
+    assert contract.get(x) is None
+
+
+def test_frozen_while_queued_async():
+    a = Attribute('a', int)
+    b = Attribute('b', int)
+    x = aslow(second(b))
+    last = gather(afirst(a), x, mode='first')
+    contract = Contract(last)
+
+    asyncio.run(contract.aset_many({'a': 1, 'b': 2}))
+    assert contract.get(last) == 1
+    assert contract.get(x) is None
+
+
+def test_no_freeze():
+    x, last = build(freeze=False)
+    contract = Contract(last)
+    del calls[:]
+    contract.set_many({'a': 1, 'b': 2})
+    assert contract.get(last) == 1
+    assert calls == ['first', 'second', 'slow']
+    assert contract.get(x) == 20
+
+
+def test_frozen_nodes_are_not_evaluated():
+    x, last = build()
+    contract = Contract(last)
+    contract.set('a', 1)
+    del calls[:]
+    contract.set('b', 2)
+    assert calls == []
+    assert contract.get(last) == 1
+
+
+def any_value(*values):
+    for value in values:
+        if value is not None:
+            return value
+
+
+@pytest.mark.parametrize('mode, condition, expected', [
+    (None, any_value, 1), ('any', None, 1), ('all', None, (1, 20))])
+def test_modes(mode, condition, expected):
+    a = Attribute('a', int)
+    b = Attribute('b', int)
+    last = gather(first(a), slow(second(b)), condition=condition, mode=mode)
+    contract = Contract(last)
+    contract.set('a', 1)
+    contract.set('b', 2)
+    assert contract.get(last) == expected
+
+
+def test_unknown_mode():
+    with pytest.raises(ValueError):
+        gather(first(Attribute('a', int)), mode='last')
+    with pytest.raises(ValueError):
+        gather(first(Attribute('a', int)), mode='first',
+               condition=lambda value: value)
@@ -0,0 +1,148 @@
+#   Smartc. Smart contracts for real time applications.
+#   Copyright (C) 2017 Guillem Borrell i Nogueras (@guillemborrell)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import pytest
+
+from smartc.contract.builder import Attribute, Contract, ContractTemplate, \
+    GraphNode, GraphRegistry, SEPARATOR, node
+from smartc.contract.schedule import EVALUATED, LOCKED, PENDING, \
+    compile_graph
+
+
+@node
+def add(x, y):
+    return x + y
+
+
+@node
+def increment(x):
+    return x + 1
+
+
+def test_registries_are_merged():
+    a = Attribute('a', int)
+    b = Attribute('b', int)
+    left = increment(a)
+    right = increment(add(a, b))
+    assert left.registry.find() is not right.registry.find()
+
+    last = add(left, right)
+    for built in (left, right, last):
+        assert built.graph is last.graph
+    assert set(last.attrs) == {'a', 'b'}
+    # The attribute shared by both registries keeps all its targets
+    assert len(last.graph['a'].to) == 2
+
+    contract = Contract(last)
+    contract.set_many({'a': 1, 'b': 2})
+    assert contract.get(last) == 6
+
+
+def test_find_compresses_the_path():
+    registries = [GraphRegistry() for i in range(4)]
+    for child, parent in zip(registries, registries[1:]):
+        child.parent = parent
+
+    root = registries[0].find()
+    assert root is registries[-1]
+    assert all(r.parent is root for r in registries[:-1])
+
+
+def test_long_chain():
+    last = Attribute('a', int)
+    for i in range(5000):
+        last = increment(last)
+
+    contract = Contract(last)
+    contract.set('a', 0)
+    assert contract.get(last) == 5000
+
+
+def test_slots():
+    a = Attribute('a', int)
+    last = increment(a)
+    for record in (a, last, last.graph[last.name], last.registry):
+        with pytest.raises(AttributeError):
+            record.extra = None
+    assert isinstance(last.graph[last.name], GraphNode)
+
+
+def test_packed_state():
+    a = Attribute('a', int)
+    b = Attribute('b', int)
+    last = add(a, b)
+    contract = Contract(last)
+    i = contract.schedule.index[last.name]
+    assert contract.state[i] == 2 * PENDING
+
+    contract.set('a', 1)
+    assert contract.state[i] == PENDING
+    contract.set('b', 2)
+    assert contract.state[i] & EVALUATED and not contract.state[i] & LOCKED
+    # Contracts copy the initial state of the schedule
+    assert Contract(last).state[i] == 2 * PENDING
+
+
+def test_template_instances():
+    a = Attribute('a', int)
+    b = Attribute('b', int)
+    template = ContractTemplate(add(increment(a), b))
+    first = template.instantiate()
+    second = Contract(template)
+    assert first.schedule is second.schedule is template.schedule
+    assert set(template.attrs) == {'a', 'b'}
+
+    first.set_many({'a': 1, 'b': 2})
+    second.set('a', 5)
+    assert first.get(template.name) == 4
+    assert second.get(template.name) is None
+    assert second.get('a') == 5 and first.get('a') == 1
+
+
+def test_cycle():
+    a = Attribute('a', int)
+    first = increment(a)
+    second = increment(first)
+    last = add(second, a)
+    last.graph[first.name].args = [second.name]
+
+    message = 'Contract graph has a cycle through nodes {}'.format(
+        ', '.join(sorted([first.name, second.name, last.name])))
+    with pytest.raises(ValueError, match=message):
+        compile_graph(last.graph, last.attrs)
+    with pytest.raises(ValueError, match=message):
+        Contract(last)
+
+
+def test_missing_argument():
+    a = Attribute('a', int)
+    last = increment(a)
+    last.graph[last.name].args = ['missing']
+    with pytest.raises(ValueError, match='Node {} depends on missing, that '
+                       'is not in the graph'.format(last.name)):
+        compile_graph(last.graph, last.attrs)
+
+
+def test_attribute_with_the_name_of_a_node():
+    with pytest.raises(ValueError, match='cannot contain'):
+        Attribute('increment{}0'.format(SEPARATOR), int)
+
+    last = increment(Attribute('a', int))
+    other = Attribute('b', int)
+    other.name = last.name
+    with pytest.raises(ValueError, match='Attribute {} has the name of a '
+                       'node'.format(last.name)):
+        add(last, other)
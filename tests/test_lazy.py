@@ -0,0 +1,126 @@
+#   Smartc. Smart contracts for real time applications.
+#   Copyright (C) 2017 Guillem Borrell i Nogueras (@guillemborrell)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+
+import pytest
+
+from smartc.contract.builder import Attribute, Contract, ContractTemplate, \
+    node
+
+calls = []
+
+
+@node
+def double(x):
+    calls.append('double')
+    return 2 * x
+
+
+@node
+def add(x, y):
+    calls.append('add')
+    return x + y
+
+
+@node(eager=True)
+def notify(x):
+    calls.append('notify')
+    return x
+
+
+@node
+async def slow_double(x):
+    await asyncio.sleep(0)
+    return 2 * x
+
+
+def build():
+    a = Attribute('a', float, mutable=True)
+    b = Attribute('b', float)
+    doubled = double(a)
+    return doubled, add(doubled, b)
+
+
+def test_nodes_are_evaluated_when_read():
+    doubled, total = build()
+    contract = Contract(total, lazy=True)
+    del calls[:]
+    contract.set_many({'a': 1.0, 'b': 1.0})
+    assert calls == []
+
+    assert contract.get(doubled) == 2.0
+    assert calls == ['double']
+    assert contract.get(total) == 3.0
+    assert contract.get(total) == 3.0
+    assert calls == ['double', 'add']
+
+    # A new value of an argument invalidates the nodes downstream
+    contract.set('a', 2.0)
+    assert contract.get(total) == 5.0
+    assert calls == ['double', 'add', 'double', 'add']
+
+
+def test_missing_arguments():
+    doubled, total = build()
+    contract = Contract(total, lazy=True)
+    contract.set('a', 1.0)
+    assert contract.get(total) is None
+    assert contract.get(doubled) == 2.0
+
+
+def test_eager_nodes():
+    doubled, total = build()
+    last = notify(total)
+    contract = ContractTemplate(last).instantiate(lazy=True)
+    del calls[:]
+    contract.set_many({'a': 1.0, 'b': 1.0})
+    assert calls == ['double', 'add', 'notify']
+    assert contract.get(last) == 3.0
+
+
+def test_snapshot():
+    doubled, total = build()
+    template = ContractTemplate(total)
+    contract = template.instantiate(lazy=True)
+    contract.set_many({'a': 1.0, 'b': 1.0})
+    restored = template.restore(contract.snapshot())
+    assert restored.lazy is not None
+    assert restored.get(total) == 3.0
+
+
+def test_async():
+    a = Attribute('a', float)
+    last = slow_double(a)
+    contract = Contract(last, lazy=True)
+
+    async def run():
+        await contract.aset('a', 1.0)
+        return await contract.aget(last)
+
+    assert asyncio.run(run()) == 2.0
+    with pytest.raises(ValueError):
+        Contract(last, lazy=True).get(last)
+
+
+def test_unknown_node():
+    doubled, total = build()
+    for lazy in (False, True):
+        contract = Contract(total, lazy=lazy)
+        with pytest.raises(ValueError):
+            contract.get('missing')
+        with pytest.raises(ValueError):
+            asyncio.run(contract.aget('missing'))
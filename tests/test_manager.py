@@ -0,0 +1,191 @@
+#   Smartc. Smart contracts for real time applications.
+#   Copyright (C) 2017 Guillem Borrell i Nogueras (@guillemborrell)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import multiprocessing
+import os
+import socket
+
+import pytest
+
+from smartc.contract.builder import Attribute, node
+from smartc.manager import ContractManager, HashRing, Shard
+
+
+@node
+def double(a):
+    return 2 * a
+
+
+@node
+def inverse(a):
+    return 1 / a
+
+
+TEMPLATES = {'double': double(Attribute('a', int, mutable=True)),
+             'other': double(Attribute('b', int)),
+             'inverse': inverse(Attribute('c', int, mutable=True))}
+
+
+def free_address():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return 'tcp://127.0.0.1:{}'.format(s.getsockname()[1])
+
+
+def test_hash_ring():
+    ring = HashRing()
+    ring.add('a')
+    ring.add('b')
+    keys = [str(i) for i in range(1000)]
+    before = {key: ring.owner(key) for key in keys}
+    assert set(before.values()) == {'a', 'b'}
+
+    ring.add('c')
+    assert len(ring) == 3 and 'c' in ring
+    for key in keys:
+        assert ring.owner(key) in (before[key], 'c')
+
+    ring.remove('c')
+    assert 'c' not in ring
+    assert {key: ring.owner(key) for key in keys} == before
+
+
+def test_shard_move():
+    source = Shard(TEMPLATES)
+    target = Shard(TEMPLATES)
+    source.create('x', 'double', {'a': 2})
+    source.create('y', 'double')
+
+    exported = source.export(['x', 'y'])
+    assert sorted(source.contracts) == ['x', 'y']
+
+    target.load(exported)
+    source.discard(['x', 'y'])
+    assert source.contracts == {}
+    assert target.get('x', 'a') == 2
+    target.set('y', {'a': 3})
+    assert target.get('y', 'a') == 3
+
+
+def test_shard_load_is_atomic():
+    source = Shard(TEMPLATES)
+    target = Shard(TEMPLATES)
+    source.create('x', 'double', {'a': 2})
+    source.create('y', 'other', {'b': 2})
+    (x, template, snapshot), (y, other, wrong) = source.export(['x', 'y'])
+
+    # The snapshot of y does not match the template
+    with pytest.raises(ValueError):
+        target.load([(x, template, snapshot), (y, template, wrong)])
+    assert target.contracts == {}
+
+
+def test_shard_errors():
+    shard = Shard(TEMPLATES)
+    assert shard.handle(('create', 'x', 'missing'))[0] == 'error'
+    assert shard.handle(('get', 'x', 'a'))[0] == 'error'
+    assert shard.handle(('unknown',))[0] == 'error'
+
+    # Any error raised by a node is replied
+    assert shard.handle(('create', 'x', 'inverse', {'c': 0})) == \
+        ('error', 'ZeroDivisionError: division by zero')
+    assert 'x' not in shard.contracts
+    shard.create('x', 'inverse', {'c': 1})
+    assert shard.handle(('set', 'x', {'c': 0}))[0] == 'error'
+
+
+def run(test):
+    """
+    Run a test coroutine with a manager, that is closed at the end
+    """
+    async def main():
+        manager = ContractManager(TEMPLATES, free_address(),
+                                  free_address(), replicas=8,
+                                  interval=0.1)
+        try:
+            await asyncio.wait_for(test(manager), 60)
+        finally:
+            await asyncio.wait_for(manager.close(), 10)
+
+    asyncio.run(main())
+
+
+async def values(manager, contracts):
+    return [await manager.get(contract_id, 'a') for contract_id in contracts]
+
+
+def test_rebalance():
+    async def main(manager):
+        await manager.start(2)
+        contracts = [await manager.create('double', {'a': i})
+                     for i in range(20)]
+
+        shard = await manager.add_worker()
+        assert await values(manager, contracts) == list(range(20))
+        assert any(manager.ring.owner(c) == shard for c in contracts)
+
+        await manager.remove_worker(b'shard-0')
+        for contract_id in contracts:
+            await manager.set(contract_id, {'a': 1})
+        assert await values(manager, contracts) == [1] * 20
+
+    run(main)
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != 'fork',
+                    reason='The failure is injected in forked workers')
+def test_failed_move(monkeypatch):
+    async def main(manager):
+        await manager.start(1)
+        contracts = [await manager.create('double', {'a': i})
+                     for i in range(20)]
+
+        def load(self, exported):
+            raise ValueError('Load failed')
+
+        monkeypatch.setattr(Shard, 'load', load)
+        with pytest.raises(ValueError):
+            await manager.add_worker()
+        assert await values(manager, contracts) == list(range(20))
+        assert set(manager.pinned) == set(contracts) - {
+            c for c in contracts if manager.ring.owner(c) == b'shard-0'}
+
+        # The contracts that could not be moved are moved to the next
+        # worker that owns them.
+        monkeypatch.undo()
+        await manager.remove_worker(b'shard-1')
+        await manager.add_worker()
+        for contract_id in contracts:
+            await manager.set(contract_id, {'a': 1})
+        assert await values(manager, contracts) == [1] * 20
+
+    run(main)
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != 'fork',
+                    reason='The failure is injected in forked workers')
+def test_dead_worker(monkeypatch):
+    async def main(manager):
+        monkeypatch.setattr(Shard, 'get', lambda *args: os._exit(1))
+        await manager.start(1)
+        contract_id = await manager.create('inverse', {'c': 1})
+        with pytest.raises(ValueError):
+            await manager.set(contract_id, {'c': 0})
+        with pytest.raises(RuntimeError):
+            await manager.get(contract_id, 'c')
+
+    run(main)
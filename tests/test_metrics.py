@@ -0,0 +1,116 @@
+#   Smartc. Smart contracts for real time applications.
+#   Copyright (C) 2017 Guillem Borrell i Nogueras (@guillemborrell)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import math
+
+import pytest
+from tornado import web
+from tornado.testing import AsyncHTTPTestCase
+
+from smartc.contract import builder
+from smartc.contract.builder import Attribute, Contract, node
+from smartc.monitor import metrics
+from smartc.monitor.handler import MetricsHandler
+
+
+@node
+def double(x):
+    return 2 * x
+
+
+@pytest.fixture
+def enabled():
+    metrics.enable()
+    yield
+    metrics.disable()
+
+
+def test_histogram_quantiles():
+    histogram = metrics.Histogram('latency', 'Latency', sub_buckets=16)
+    for value in range(1, 1001):
+        histogram.observe(value / 1000)
+
+    assert histogram.count == 1000
+    for q in (0.5, 0.9, 0.99):
+        assert q <= histogram.quantile(q) <= q * (1 + 1 / 16)
+
+
+def test_histogram_buckets_are_fixed():
+    histogram = metrics.Histogram('depth', 'Depth', lowest=1, highest=8)
+    assert histogram.bounds == [1, 1.5, 2, 3, 4, 6, 8]
+
+    def buckets():
+        return [line.split(' ')[0] for line in
+                histogram.render().splitlines() if '_bucket' in line]
+
+    empty = buckets()
+    assert len(empty) == len(histogram.bounds) + 1
+    for value in (0.5, 1, 2, 2.5, 8, 100):
+        histogram.observe(value)
+    assert buckets() == empty
+    assert histogram.render().splitlines()[2:10] == [
+        'depth_bucket{le="1"} 2', 'depth_bucket{le="1.5"} 2',
+        'depth_bucket{le="2"} 3', 'depth_bucket{le="3"} 4',
+        'depth_bucket{le="4"} 4', 'depth_bucket{le="6"} 4',
+        'depth_bucket{le="8"} 5', 'depth_bucket{le="+Inf"} 6']
+    assert histogram.quantile(1) == math.inf
+
+    # The children of a metric with labels have the same buckets
+    labelled = metrics.Histogram('seconds', 'Seconds', ['f'], lowest=1e-3)
+    assert labelled.labels('a').bounds == labelled.bounds
+
+
+def test_render():
+    counter = metrics.Counter('sets_total', 'Sets', ['kind'])
+    counter.labels('a"b').inc(2)
+    gauge = metrics.Gauge('clients', 'Clients')
+    gauge.inc(3)
+    gauge.dec()
+    assert counter.render().splitlines() == [
+        '# HELP sets_total Sets', '# TYPE sets_total counter',
+        'sets_total{kind="a\\"b"} 2']
+    assert gauge.render().splitlines()[-1] == 'clients 2'
+
+    with pytest.raises(ValueError):
+        counter.labels('a', 'b')
+
+    registry = metrics.Registry()
+    registry.register(gauge)
+    with pytest.raises(ValueError):
+        registry.register(metrics.Gauge('clients', 'Clients'))
+
+
+def test_contract_metrics(enabled):
+    sets = builder.SETS.value
+    contract = Contract(double(Attribute('a', int, mutable=True)))
+    contract.set('a', 1)
+    assert builder.SETS.value == sets + 1
+    assert builder.NODE_SECONDS.labels('double').count > 0
+
+    metrics.disable()
+    contract.set('a', 2)
+    assert builder.SETS.value == sets + 1
+
+
+class MetricsTest(AsyncHTTPTestCase):
+    def get_app(self):
+        return web.Application([(r'/metrics', MetricsHandler)])
+
+    def test_metrics(self):
+        response = self.fetch('/metrics')
+        assert response.code == 200
+        assert response.headers['Content-Type'].startswith('text/plain')
+        assert b'# TYPE smartc_contract_sets_total counter' in response.body
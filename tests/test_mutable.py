@@ -0,0 +1,151 @@
+#   Smartc. Smart contracts for real time applications.
+#   Copyright (C) 2017 Guillem Borrell i Nogueras (@guillemborrell)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import pytest
+
+from smartc.contract.builder import Attribute, Contract, gather, node
+from smartc.manager import Shard
+
+calls = []
+
+
+@node
+def rounded(price):
+    calls.append('rounded')
+    return round(price)
+
+
+@node
+def position(price, quantity):
+    calls.append('position')
+    return price * quantity
+
+
+@node
+def double(m):
+    return 2 * m
+
+
+def build():
+    price = Attribute('price', float, mutable=True)
+    quantity = Attribute('quantity', float)
+    return position(rounded(price), quantity)
+
+
+def test_recompute_with_cutoff():
+    last = build()
+    contract = Contract(last)
+    contract.set_many({'price': 1.2, 'quantity': 2.0})
+    assert contract.get(last) == 2.0
+
+    del calls[:]
+    contract.set('price', 2.6)
+    assert contract.get(last) == 6.0
+    assert calls == ['rounded', 'position']
+
+    # The rounded price does not change, so the position is not
+    # recomputed.
+    del calls[:]
+    contract.set('price', 3.4)
+    assert contract.get(last) == 6.0
+    assert calls == ['rounded']
+
+
+def test_changes():
+    last = build()
+    contract = Contract(last)
+    index = contract.schedule.index
+    contract.changes = []
+    contract.set_many({'price': 1.2, 'quantity': 2.0})
+    assert sorted(contract.changes) == sorted(index.values())
+
+    contract.changes = []
+    contract.set('price', 2.6)
+    assert contract.changes == [index[name] for name in
+                                contract.schedule.names if name != 'quantity']
+
+    # Only the price changes, the rounded price is the same
+    contract.changes = []
+    contract.set('price', 3.4)
+    assert contract.changes == [index['price']]
+
+
+def test_gather_waits_for_mutable_value():
+    m = Attribute('m', int, mutable=True)
+
+    def positive(value):
+        if value > 0:
+            return value
+
+    last = gather(double(m), condition=positive)
+    contract = Contract(last)
+    contract.set('m', 0)
+    assert contract.get(last) is None
+    contract.set('m', 2)
+    assert contract.get(last) == 4
+    contract.set('m', 3)
+    assert contract.get(last) == 4
+
+
+def test_failed_nodes_are_retried_by_the_next_set():
+    @node
+    def inverse(m):
+        return 1 / m
+
+    m = Attribute('m', int, mutable=True)
+    last = double(inverse(m))
+    contract = Contract(last)
+
+    # The first evaluation fails
+    with pytest.raises(ZeroDivisionError):
+        contract.set('m', 0)
+    assert contract.get(last) is None
+    contract.set('m', 2)
+    assert contract.get(last) == 1.0
+
+    # And so does a recomputation
+    with pytest.raises(ZeroDivisionError):
+        contract.set('m', 0)
+    assert contract.get(last) == 1.0
+    contract.set('m', 4)
+    assert contract.get(last) == 0.5
+
+
+class Recorder:
+    """
+    Stands for the publisher of a worker
+    """
+    def __init__(self):
+        self.events = []
+
+    def publish(self, topic, event):
+        self.events.append((topic.rsplit('/', 1)[1], event))
+
+    def flush(self):
+        pass
+
+
+def test_shard_publishes_recomputed_nodes():
+    m = Attribute('m', int, mutable=True)
+    last = double(m)
+    recorder = Recorder()
+    shard = Shard({'double': last}, recorder)
+    shard.create('x', 'double', {'m': 1})
+    shard.set('x', {'m': 5})
+    shard.set('x', {'m': 5})
+    shard.publish()
+    assert recorder.events == [('m', b'1'), (last.name, b'2'),
+                               ('m', b'5'), (last.name, b'10')]
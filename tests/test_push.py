@@ -0,0 +1,129 @@
+#   Smartc. Smart contracts for real time applications.
+#   Copyright (C) 2017 Guillem Borrell i Nogueras (@guillemborrell)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import json
+
+from tornado import web, websocket
+from tornado.testing import AsyncHTTPTestCase, gen_test
+
+from smartc.handlers import push
+from smartc.handlers.push import PushHandler, Subscriber, decode_batch, \
+    encode_batch
+
+
+class Client:
+    """
+    Stands for a PushHandler
+    """
+    def __init__(self, coalesce=None):
+        self.coalesce = coalesce
+        self.closed = False
+        self.messages = []
+
+    def _push_message(self, message):
+        self.messages.append(message)
+
+
+def test_encode_batch():
+    events = [b'1', b'', b'{"a": 2}']
+    assert decode_batch(encode_batch(events)) == events
+
+
+def test_fan_out():
+    async def run():
+        subscriber = Subscriber('tcp://127.0.0.1:1')
+        plain, coalesced = Client(), Client(coalesce=0)
+        subscriber.subscribe(plain, 'contract/x/*')
+        subscriber.subscribe(coalesced, 'contract/x/*')
+        subscriber.subscribe(coalesced, 'contract/y')
+        # The socket subscribes once to the prefix of each pattern
+        assert subscriber.filters == {'contract/x/': 1, 'contract/y': 1}
+
+        for topic, event in [(b'contract/x/a', b'1'), (b'contract/y', b'2'),
+                             (b'contract/x/a', b'3'), (b'contract/z', b'4')]:
+            subscriber._fan_out([topic, event])
+        await asyncio.sleep(0.01)
+        subscriber.close()
+        return plain.messages, coalesced.messages
+
+    plain, coalesced = asyncio.run(run())
+    assert plain == [[b'contract/x/a', b'1'], [b'contract/x/a', b'3']]
+    assert sorted((topic, decode_batch(frame))
+                  for topic, frame in coalesced) == [
+        (b'contract/x/a', [b'1', b'3']), (b'contract/y', [b'2'])]
+
+
+class PushTest(AsyncHTTPTestCase):
+    def get_app(self):
+        return web.Application([
+            (r'/push', PushHandler, dict(compression_level=6))])
+
+    def tearDown(self):
+        for client in list(push.clients):
+            client._remove()
+        super().tearDown()
+
+    @gen_test
+    async def test_echo_and_errors(self):
+        connection = await websocket.websocket_connect(
+            self.get_url('/push').replace('http', 'ws'),
+            compression_options={})
+        connection.write_message('hello')
+        assert await connection.read_message() == 'hello'
+
+        connection.write_message(json.dumps({'subscribe': 'a/*/b'}))
+        assert 'error' in json.loads(await connection.read_message())
+        for pattern in (None, 1, ['a']):
+            connection.write_message(json.dumps({'unsubscribe': pattern}))
+            assert json.loads(await connection.read_message()) == {
+                'error': 'Topic {} is not a string'.format(
+                    json.dumps(pattern))}
+        connection.close()
+
+    async def wait_for(self, condition):
+        for i in range(200):
+            if condition():
+                return
+            await asyncio.sleep(0.01)
+        raise AssertionError('Timed out')
+
+    @gen_test
+    async def test_shared_subscriber(self):
+        url = self.get_url('/push').replace('http', 'ws')
+        connections = []
+        # Both patterns need the same ZMQ filter
+        for pattern in ('contract/x/*', 'contract/x/'):
+            connection = await websocket.websocket_connect(url)
+            connection.write_message(json.dumps({'subscribe': pattern}))
+            # The echo is written once the subscription is done
+            connection.write_message('ping')
+            assert await connection.read_message() == 'ping'
+            connections.append(connection)
+
+        subscriber = push.subscriber
+        assert len(push.clients) == 2
+        assert subscriber.filters == {'pub': 1, 'contract/x/': 2}
+
+        connections[0].close()
+        await self.wait_for(lambda: len(push.clients) == 1)
+        assert push.subscriber is subscriber
+        assert subscriber.filters == {'pub': 1, 'contract/x/': 1}
+
+        connections[1].close()
+        await self.wait_for(lambda: not push.clients)
+        assert push.subscriber is None
+        assert subscriber.filters == {}
@@ -0,0 +1,58 @@
+#   Smartc. Smart contracts for real time applications.
+#   Copyright (C) 2017 Guillem Borrell i Nogueras (@guillemborrell)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import pytest
+
+from smartc.handlers.queues import COALESCE, DISCONNECT, DROP_OLDEST, \
+    SendQueue
+
+
+def drain(queue):
+    return [queue.get() for i in range(len(queue))]
+
+
+def test_drop_oldest():
+    queue = SendQueue(2, DROP_OLDEST)
+    for i in range(3):
+        assert queue.put('t', i)
+    assert drain(queue) == [('t', 1), ('t', 2)]
+    assert queue.dropped == 1
+
+
+def test_coalesce():
+    queue = SendQueue(2, COALESCE)
+    queue.put('a', 1)
+    queue.put('b', 1)
+    queue.put('a', 2)
+    # The new message takes the place of the previous one
+    assert drain(queue) == [('a', 2), ('b', 1)]
+
+    for topic in 'abc':
+        queue.put(topic, 3)
+    assert drain(queue) == [('b', 3), ('c', 3)]
+    assert queue.dropped == 2
+
+
+def test_disconnect():
+    queue = SendQueue(1, DISCONNECT)
+    assert queue.put('t', 1)
+    assert not queue.put('t', 2)
+    assert drain(queue) == [('t', 1)]
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        SendQueue(1, 'block')
@@ -0,0 +1,147 @@
+#   Smartc. Smart contracts for real time applications.
+#   Copyright (C) 2017 Guillem Borrell i Nogueras (@guillemborrell)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from array import array
+from collections import deque
+
+import pytest
+
+from smartc.contract.builder import Attribute, Contract, node
+from smartc.contract.reducers import Count, Fold, LastN, Sum
+
+calls = []
+
+
+@node(reducer=Sum())
+def total(prices):
+    calls.append('total')
+    return sum(prices)
+
+
+@node(reducer=Count())
+def count(prices):
+    return len(prices)
+
+
+@node(reducer=LastN(2))
+def last(prices):
+    return deque(prices, maxlen=2)
+
+
+@node(reducer=Fold(max))
+def highest(prices):
+    return max(prices)
+
+
+@node
+def mean(total, count):
+    calls.append('mean')
+    return total / count
+
+
+@node
+def spread(window):
+    calls.append('spread')
+    return window[-1] - window[0]
+
+
+def test_reducers():
+    prices = Attribute('prices', float, multiple=True)
+    average = mean(total(prices), count(prices))
+    contract = Contract(average)
+    contract.set('prices', [1.0, 2.0])
+    assert type(contract.get('prices')) is array
+    assert contract.get(average) == 1.5
+
+    del calls[:]
+    contract.append('prices', 6.0)
+    assert contract.get(average) == 3.0
+    # The sum is updated by the reducer, the mean is recomputed
+    assert calls == ['mean']
+
+    contract.extend('prices', [1.0, 2.0])
+    assert list(contract.get('prices')) == [1.0, 2.0, 6.0, 1.0, 2.0]
+    assert contract.get(average) == 12.0 / 5
+
+
+def test_last_n_in_place():
+    prices = Attribute('prices', float, multiple=True)
+    window = last(prices)
+    difference = spread(window)
+    contract = Contract(difference)
+    contract.append('prices', 1.0)
+    assert list(contract.get(window)) == [1.0]
+
+    value = contract.get(window)
+    contract.changes = []
+    contract.extend('prices', [2.0, 5.0])
+    assert contract.get(window) is value
+    assert list(value) == [2.0, 5.0]
+    assert contract.get(difference) == 3.0
+    assert contract.schedule.index[window.name] in contract.changes
+
+
+def test_last_n_from_a_tuple():
+    assert LastN(2).step((1, 2), 3) == deque([2, 3])
+    with pytest.raises(ValueError):
+        LastN(0)
+
+
+def test_fold_cutoff():
+    prices = Attribute('prices', float, multiple=True)
+    top = highest(prices)
+    contract = Contract(top)
+    contract.set('prices', [3.0])
+    contract.changes = []
+    contract.append('prices', 1.0)
+    assert contract.get(top) == 3.0
+    assert contract.changes == [contract.schedule.index['prices']]
+
+
+def test_reducer_needs_a_multiple_attribute():
+    with pytest.raises(ValueError):
+        total(Attribute('price', float))
+
+
+@node
+def window(prices):
+    return prices
+
+
+@node
+def add_up(prices):
+    return sum(prices)
+
+
+def test_pass_through_of_the_buffer():
+    prices = Attribute('prices', float, multiple=True)
+    passed = window(prices)
+    result = add_up(window(passed))
+    contract = Contract(result)
+    contract.append('prices', 1.0)
+    contract.append('prices', 2.0)
+    contract.append('prices', 3.0)
+    assert contract.get(passed) is contract.get('prices')
+    assert contract.get(result) == 6.0
+
+
+def test_pass_through_of_an_inplace_reducer():
+    prices = Attribute('prices', float, multiple=True)
+    result = add_up(window(last(prices)))
+    contract = Contract(result)
+    contract.extend('prices', [1.0, 2.0])
+    contract.append('prices', 5.0)
+    assert contract.get(result) == 7.0
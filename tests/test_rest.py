@@ -0,0 +1,127 @@
+#   Smartc. Smart contracts for real time applications.
+#   Copyright (C) 2017 Guillem Borrell i Nogueras (@guillemborrell)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import json
+import threading
+
+from tornado import web
+from tornado.testing import AsyncHTTPTestCase, gen_test
+
+from smartc.contract.builder import Attribute, node
+from smartc.handlers import rest
+
+release = threading.Event()
+
+
+@node
+def double(a):
+    return 2 * a
+
+
+@node
+def slow(a):
+    release.wait(5)
+    return a + 1
+
+
+@node
+def after(x):
+    return x + 1
+
+
+class RestTest(AsyncHTTPTestCase):
+    def setUp(self):
+        super().setUp()
+        rest.templates.clear()
+        rest.contracts.clear()
+        a = Attribute('a', float)
+        rest.register_template('double', double(a))
+        rest.register_template('slow', after(slow(Attribute('b', float))))
+        release.set()
+
+    def get_app(self):
+        return web.Application(rest.rest_urls())
+
+    async def request(self, path, method='GET', body=None, headers=None):
+        response = await self.http_client.fetch(
+            self.get_url(path), method=method, body=body, headers=headers,
+            raise_error=False)
+        return response.code, json.loads(response.body or b'null')
+
+    async def create(self, template, body=None):
+        code, created = await self.request(
+            '/contracts/' + template, 'POST', body or '')
+        assert code == 201
+        return created['id']
+
+    @gen_test
+    async def test_create_set_get(self):
+        contract_id = await self.create('double')
+        code, result = await self.request(
+            '/contracts/{}/attributes'.format(contract_id), 'POST',
+            json.dumps({'a': 2}))
+        assert (code, result) == (200, {'sets': 1})
+
+        code, result = await self.request('/contracts/' + contract_id)
+        assert code == 200
+        assert sorted(result['values'].values()) == [2.0, 4.0]
+
+        code, result = await self.request(
+            '/contracts/{}/nodes/a'.format(contract_id))
+        assert result == {'name': 'a', 'value': 2.0}
+
+    @gen_test
+    async def test_errors(self):
+        code, result = await self.request('/contracts/missing', 'POST', '')
+        assert code == 404
+
+        contract_id = await self.create('double')
+        code, result = await self.request(
+            '/contracts/{}/nodes/missing'.format(contract_id))
+        assert code == 404
+
+        code, result = await self.request(
+            '/contracts/{}/attributes'.format(contract_id), 'POST',
+            json.dumps([{'a': 1.0}, {'a': 2.0}]))
+        assert code == 400
+        assert result['sets'] == 1
+
+    @gen_test
+    async def test_ndjson(self):
+        contract_id = await self.create('double')
+        code, result = await self.request(
+            '/contracts/{}/attributes'.format(contract_id), 'POST',
+            '{"a": 3.0}\n', headers={'Content-Type': rest.NDJSON})
+        assert (code, result) == (200, {'sets': 1})
+
+    @gen_test
+    async def test_get_waits_for_set(self):
+        contract_id = await self.create('slow')
+        release.clear()
+        setting = asyncio.ensure_future(self.request(
+            '/contracts/{}/attributes'.format(contract_id), 'POST',
+            json.dumps({'b': 1.0})))
+        await asyncio.sleep(0.1)
+        reading = asyncio.ensure_future(
+            self.request('/contracts/' + contract_id))
+        await asyncio.sleep(0.1)
+        assert not reading.done()
+
+        release.set()
+        await setting
+        code, result = await reading
+        assert sorted(result['values'].values()) == [1.0, 2.0, 3.0]
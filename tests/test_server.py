@@ -0,0 +1,111 @@
+#   Smartc. Smart contracts for real time applications.
+#   Copyright (C) 2017 Guillem Borrell i Nogueras (@guillemborrell)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from urllib.request import urlopen
+
+import pytest
+
+SERVER = 'from smartc.server import main; main({}, workers=2)'
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def children(pid):
+    path = '/proc/{0}/task/{0}/children'.format(pid)
+    with open(path) as f:
+        return set(int(child) for child in f.read().split())
+
+
+def running(pid):
+    try:
+        with open('/proc/{}/stat'.format(pid)) as f:
+            return f.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    except FileNotFoundError:
+        return False
+
+
+def wait_for(condition, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if condition():
+                return
+        except OSError:
+            pass
+        time.sleep(0.1)
+
+    raise AssertionError('Timed out')
+
+
+@pytest.mark.skipif(not os.path.exists('/proc/self/task'),
+                    reason='Needs /proc to find the workers')
+def test_workers_are_restarted():
+    port = free_port()
+    url = 'http://127.0.0.1:{}/metrics'.format(port)
+    server = subprocess.Popen([sys.executable, '-c', SERVER.format(port)])
+    try:
+        wait_for(lambda: urlopen(url, timeout=1).status == 200)
+        wait_for(lambda: len(children(server.pid)) == 2)
+        workers = children(server.pid)
+
+        os.kill(workers.pop(), signal.SIGKILL)
+        wait_for(lambda: len(children(server.pid) - workers) == 1)
+        for i in range(4):
+            assert urlopen(url, timeout=5).status == 200
+
+        server.send_signal(signal.SIGTERM)
+        assert server.wait(20) == 0
+    finally:
+        if server.poll() is None:
+            for pid in children(server.pid):
+                os.kill(pid, signal.SIGKILL)
+            server.kill()
+        server.wait()
+
+
+@pytest.mark.skipif(not os.path.exists('/proc/self/task'),
+                    reason='Needs /proc to find the workers')
+def test_sigterm_stops_the_broker():
+    port = free_port()
+    url = 'http://127.0.0.1:{}/metrics'.format(port)
+    server = subprocess.Popen([sys.executable, '-m', 'smartc.server',
+                               '--port', str(port), '--workers', '2'])
+    try:
+        wait_for(lambda: urlopen(url, timeout=1).status == 200)
+        # The broker, the publisher and the two workers
+        wait_for(lambda: len(children(server.pid)) == 4)
+        processes = children(server.pid)
+
+        server.send_signal(signal.SIGTERM)
+        assert server.wait(20) == 0
+        for pid in processes:
+            wait_for(lambda: not running(pid))
+    finally:
+        if server.poll() is None:
+            for pid in children(server.pid):
+                os.kill(pid, signal.SIGKILL)
+            server.kill()
+        server.wait()
@@ -0,0 +1,143 @@
+#   Smartc. Smart contracts for real time applications.
+#   Copyright (C) 2017 Guillem Borrell i Nogueras (@guillemborrell)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import pytest
+
+from smartc.contract.builder import Attribute, Contract, ContractTemplate, \
+    gather, node
+from smartc.contract.snapshot import dump_schedule, load_schedule, \
+    load_snapshots, write_snapshots
+
+
+@node
+def double(x):
+    return 2 * x
+
+
+@node
+def add(x, y):
+    return x + y
+
+
+def positive(value):
+    if value > 0:
+        return value
+
+
+def build():
+    a = Attribute('a', int, mutable=True)
+    b = Attribute('b', int)
+    return add(gather(double(a), condition=positive), b)
+
+
+def test_restore_and_continue():
+    last = build()
+    contract = Contract(last)
+    contract.set('a', 0)
+    restored = Contract.restore(contract.schedule, contract.snapshot())
+    assert restored.get('a') == 0
+
+    restored.set('a', 1)
+    restored.set('b', 3)
+    assert restored.get(last) == 5
+    assert contract.get(last) is None
+
+
+def test_schedule_round_trip():
+    template = ContractTemplate(build())
+    schedule = load_schedule(dump_schedule(template.schedule))
+    assert schedule.fingerprint() == template.schedule.fingerprint()
+
+
+def test_snapshot_file(tmp_path):
+    template = ContractTemplate(build())
+    contracts = []
+    for i in range(3):
+        contract = template.instantiate()
+        contract.set_many({'a': i, 'b': 10})
+        contracts.append(contract)
+
+    path = str(tmp_path / 'contracts.snap')
+    write_snapshots(path, contracts)
+    restored = list(load_snapshots(path))
+    assert [c.get(template.name) for c in restored] == [None, 12, 14]
+    assert restored[0].schedule is restored[1].schedule
+
+
+def test_errors(tmp_path):
+    path = str(tmp_path / 'contracts.snap')
+    with pytest.raises(ValueError):
+        write_snapshots(path, [])
+    other = double(Attribute('c', int))
+    with pytest.raises(ValueError):
+        write_snapshots(path, [Contract(build()), Contract(other)])
+
+    anonymous = node(lambda x: x)(Attribute('a', int))
+    with pytest.raises(ValueError):
+        dump_schedule(ContractTemplate(anonymous).schedule)
+
+    with open(path, 'wb') as f:
+        f.write(b'not a snapshot file')
+    with pytest.raises(ValueError):
+        list(load_snapshots(path))
+
+
+def test_restore_failed_recomputation():
+    failing = [True]
+
+    @node
+    def increment(a):
+        if a == 5 and failing[0]:
+            raise ZeroDivisionError('five')
+        return a + 1
+
+    a = Attribute('a', int, mutable=True)
+    b = Attribute('b', int, mutable=True)
+    last = add(increment(a), b)
+    contract = Contract(last)
+    contract.set_many({'a': 3, 'b': 0})
+    with pytest.raises(ZeroDivisionError):
+        contract.set('a', 5)
+    restored = Contract.restore(contract.schedule, contract.snapshot())
+
+    # The failed node is recomputed by the next set in both contracts
+    failing[0] = False
+    for c in (contract, restored):
+        c.set('b', 6)
+        assert c.get(last) == 12
+
+
+def test_restore_arrivals():
+    calls = []
+
+    def condition(*args):
+        calls.append(args)
+        if len(calls) == 1:
+            raise KeyError('first call')
+        return sum(args)
+
+    a = Attribute('a', int)
+    b = Attribute('b', int)
+    total = gather(a, b, condition=condition, mode='any')
+    contract = Contract(total)
+    with pytest.raises(KeyError):
+        contract.set('a', 7)
+    restored = Contract.restore(contract.schedule, contract.snapshot())
+    assert restored.arrivals == contract.arrivals
+
+    restored.set('b', 2)
+    assert calls[1:] == [(7, 2)]
+    assert restored.get(total) == 9
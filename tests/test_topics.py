@@ -0,0 +1,54 @@
+#   Smartc. Smart contracts for real time applications.
+#   Copyright (C) 2017 Guillem Borrell i Nogueras (@guillemborrell)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import pytest
+
+from smartc.handlers.topics import TopicIndex
+
+
+def test_match():
+    index = TopicIndex()
+    assert index.add('a', 'contract/x/node/n')
+    assert index.add('b', 'contract/x/*')
+    assert index.add('c', '*')
+    assert not index.add('d', 'contract/x/*')
+
+    assert index.match('contract/x/node/n') == {'a', 'b', 'c', 'd'}
+    assert index.match('contract/x/node/m') == {'b', 'c', 'd'}
+    assert index.match('contract/y') == {'c'}
+    # A wildcard only matches the topics below its prefix
+    assert index.match('contract/x') == {'c'}
+
+
+def test_discard():
+    index = TopicIndex()
+    index.add('a', 'contract/x/node/n')
+    index.add('a', 'contract/x/*')
+    index.add('b', 'contract/x/*')
+
+    assert not index.discard('b', 'contract/x/node/n')
+    assert not index.discard('b', 'contract/x/*')
+    assert sorted(index.remove('a')) == ['contract/x/*', 'contract/x/node/n']
+    assert index.match('contract/x/node/n') == set()
+    assert index.root.empty() and index.patterns == {}
+
+
+def test_prefix():
+    assert TopicIndex.prefix('contract/x/*') == 'contract/x/'
+    assert TopicIndex.prefix('*') == ''
+    assert TopicIndex.prefix('contract/x') == 'contract/x'
+    with pytest.raises(ValueError):
+        TopicIndex().add('a', 'contract/*/node')
@@ -0,0 +1,217 @@
+#   Smartc. Smart contracts for real time applications.
+#   Copyright (C) 2017 Guillem Borrell i Nogueras (@guillemborrell)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+
+import pytest
+
+from smartc.contract.builder import Attribute, ContractTemplate, gather, node
+from smartc.contract.wal import SEGMENT, WriteAheadLog, read_segment
+from smartc.manager import Shard
+
+
+@node
+def double(a):
+    return 2 * a
+
+
+@node
+def add(x, y):
+    return x + y
+
+
+@node
+def inverse(c):
+    return 1 / c
+
+
+a = Attribute('a', float, mutable=True)
+b = Attribute('b', int, mutable=True)
+c = Attribute('c', int, mutable=True)
+TEMPLATES = {'sum': ContractTemplate(add(double(a), b)),
+             'inverse': ContractTemplate(add(a, inverse(c)))}
+
+
+def create(template):
+    return TEMPLATES[template].instantiate()
+
+
+@pytest.fixture
+def directory(tmp_path):
+    return str(tmp_path / 'wal')
+
+
+def recover(directory):
+    wal = WriteAheadLog(directory)
+    try:
+        return {contract_id: contract for contract_id, (template, contract)
+                in wal.recover(create).items()}
+    finally:
+        wal.close()
+
+
+def test_recover(directory):
+    wal = WriteAheadLog(directory)
+    wal.create('x', 'sum')
+    wal.set('x', {'a': 1.0})
+    wal.set('x', {'b': 2})
+    wal.set('x', {'a': 3.0})
+    wal.create('y', 'sum')
+    wal.delete('y')
+    wal.sync()
+    wal.close()
+
+    contracts = recover(directory)
+    assert list(contracts) == ['x']
+    assert contracts['x'].get(TEMPLATES['sum'].name) == 8.0
+
+
+def test_invalid_sets_are_skipped(directory):
+    wal = WriteAheadLog(directory)
+    wal.create('x', 'sum')
+    wal.set('x', {'a': 1.0})
+    wal.set('x', {'b': 'not an int'})
+    wal.set('x', {'b': 2})
+    wal.close()
+
+    contract = recover(directory)['x']
+    assert contract.get('a') == 1.0 and contract.get('b') == 2
+
+
+def test_failed_sets_are_replayed(directory):
+    shard = Shard(TEMPLATES, wal=WriteAheadLog(directory))
+    shard.create('x', 'inverse')
+    shard.set('x', {'a': 1.0})
+    with pytest.raises(ZeroDivisionError):
+        shard.set('x', {'c': 0})
+    shard.create('y', 'inverse')
+    with pytest.raises(ZeroDivisionError):
+        shard.set('y', {'a': 1.0, 'c': 0})
+    shard.wal.close()
+
+    contracts = recover(directory)
+    name = TEMPLATES['inverse'].name
+    for contract_id in ('x', 'y'):
+        contract = contracts[contract_id]
+        assert contract.get('a') == 1.0 and contract.get('c') == 0
+        assert contract.get(name) is None
+        contract.set('c', 2)
+        assert contract.get(name) == 1.5
+
+
+def test_torn_tail(directory):
+    wal = WriteAheadLog(directory)
+    wal.create('x', 'sum')
+    wal.set('x', {'a': 1.0})
+    wal.set('x', {'b': 2})
+    wal.close()
+
+    path = os.path.join(directory, SEGMENT.format(1))
+    with open(path, 'rb+') as f:
+        f.truncate(os.path.getsize(path) - 3)
+    assert [r[0] for r in read_segment(path)] == ['create', 'set']
+
+    contract = recover(directory)['x']
+    assert contract.get('a') == 1.0 and contract.get('b') is None
+
+
+def test_checkpoint(directory):
+    wal = WriteAheadLog(directory, checkpoint_segments=1)
+    wal.create('x', 'sum')
+    wal.set('x', {'a': 1.0})
+    contract = create('sum')
+    contract.set('a', 1.0)
+    wal.checkpoint({'x': ('sum', contract)})
+    wal.set('x', {'b': 2})
+    wal.close()
+
+    names = sorted(os.listdir(directory))
+    assert names[0].startswith('checkpoint')
+    assert not any(name == SEGMENT.format(1) for name in names)
+
+    contract = recover(directory)['x']
+    assert contract.get('a') == 1.0 and contract.get('b') == 2
+
+
+def test_gather_sets_are_not_merged(directory):
+    a = Attribute('a', int, mutable=True)
+    calls = []
+
+    def condition(value):
+        calls.append(value)
+        if value == 1:
+            return value
+
+    template = ContractTemplate(gather(double(a), condition=condition))
+    wal = WriteAheadLog(directory)
+    wal.create('x', 'gather')
+    wal.set('x', {'a': 0})
+    wal.set('x', {'a': 1})
+    wal.close()
+
+    wal = WriteAheadLog(directory)
+    wal.recover(lambda name: template.instantiate())
+    wal.close()
+    assert calls == [0, 2]
+
+
+class Recorder:
+    """
+    Stands for the publisher of a worker
+    """
+    def __init__(self):
+        self.events = []
+
+    def publish(self, topic, event):
+        self.events.append((topic, event))
+
+    def flush(self):
+        pass
+
+
+def test_shard_recover(directory):
+    recorder = Recorder()
+    shard = Shard(TEMPLATES, recorder, WriteAheadLog(directory))
+    shard.create('x', 'sum', {'a': 1.0})
+    shard.set('x', {'b': 2})
+    # The values are only published once the sets are durable
+    assert recorder.events == []
+    shard.wal.sync()
+    shard.publish()
+    assert [event for topic, event in recorder.events] == \
+        [b'1.0', b'2.0', b'2', b'4.0']
+    shard.wal.close()
+
+    shard = Shard(TEMPLATES, wal=WriteAheadLog(directory))
+    assert shard.recover() == [('x', 'sum')]
+    assert shard.get('x', 'b') == 2
+    shard.wal.close()
+
+
+def test_move_interrupted(tmp_path):
+    """
+    The new shard logs a moved contract before the old one deletes it,
+    so a crash in between leaves the contract in both logs.
+    """
+    source = Shard(TEMPLATES, wal=WriteAheadLog(str(tmp_path / 'a')))
+    target = Shard(TEMPLATES, wal=WriteAheadLog(str(tmp_path / 'b')))
+    source.create('x', 'sum', {'a': 1.0})
+    target.load(source.export(['x']))
+    source.wal.close()
+    target.wal.close()
+
+    for name in 'ab':
+        assert recover(str(tmp_path / name))['x'].get('a') == 1.0